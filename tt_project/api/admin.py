@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Task, Comment
+from .models import Task, Comment, ArchivedTask, ArchivedComment
 
 
 class CommentInline(admin.TabularInline):
@@ -37,3 +37,36 @@ class CommentAdmin(admin.ModelAdmin):
     """
 
     list_display = ('task', 'post_date', 'author', 'description')
+
+
+class ArchivedCommentInline(admin.TabularInline):
+    """
+    Used to show the comments of an archived task below it.
+    """
+
+    model = ArchivedComment
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedTask)
+class ArchivedTaskAdmin(admin.ModelAdmin):
+    """
+    Administration object for ArchivedTask models.
+    Archived tasks and their comments are read-only.
+    """
+
+    list_display = ('name', 'due_date', 'creator', 'performer', 'archived_at')
+    list_filter = ('due_date',)
+    inlines = [ArchivedCommentInline]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
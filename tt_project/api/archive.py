@@ -0,0 +1,87 @@
+"""
+Archival of the completed tasks, which keeps the task table that every
+list query and the admin scan small.
+
+A completed task is archived once its completion, its due date (if it
+has one) and its latest comment are older than TASK_ARCHIVE_AFTER_DAYS
+days. Tasks are moved with their
+comments in batches, one transaction per batch: the rows are copied into
+the archive tables with one INSERT ... SELECT per table and deleted with
+plain DELETE queries. Like the import, this bypasses the model signals,
+so the change log tombstones and the cache invalidation of the archived
+tasks are written here once per batch.
+"""
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .cache import invalidate_tasks
+from .changes import log_changes
+from .models import (Task, Comment, Notification, TaskReminder,
+                     ArchivedTask, ArchivedComment)
+import datetime
+
+
+def archive_candidates(days):
+    """
+    Returns the completed tasks whose completion, due date and latest
+    comment are older than the given number of days.
+    """
+
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    return Task.objects.filter(
+        status='c', completed_at__lt=cutoff).filter(
+        Q(due_date__isnull=True) | Q(due_date__lt=cutoff.date())).filter(
+        Q(last_comment_at__isnull=True) | Q(last_comment_at__lt=cutoff))
+
+
+def move_rows(model, archive_model, column, ids, **values):
+    """
+    Copies the rows of model with the given ids in column into the table
+    of archive_model, which has the same columns and the extra values,
+    and deletes them.
+    """
+
+    quote = connection.ops.quote_name
+    columns = [quote(field.column)
+               for field in model._meta.concrete_fields]
+    table = quote(model._meta.db_table)
+    condition = f'{quote(column)} IN ({", ".join(["%s"] * len(ids))})'
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(archive_model._meta.db_table)} '
+            f'({", ".join([*map(quote, values), *columns])}) '
+            f'SELECT {", ".join(["%s"] * len(values) + columns)} '
+            f'FROM {table} WHERE {condition}', [*values.values(), *ids])
+        cursor.execute(f'DELETE FROM {table} WHERE {condition}', ids)
+
+
+def archive_tasks(days, batch_size):
+    """
+    Moves the archive candidates with their comments into the archive,
+    batch_size tasks at a time. Tasks locked by a concurrent change are
+    left for the next run. Returns the number of archived tasks.
+    """
+
+    archived = 0
+    while True:
+        with transaction.atomic():
+            ids = list(archive_candidates(days).select_for_update(
+                skip_locked=True).order_by().values_list(
+                'id', flat=True)[:batch_size])
+            if not ids:
+                return archived
+
+            # Pending notifications and reminders of old tasks are dropped
+            Notification.objects.filter(task_id__in=ids).delete()
+            TaskReminder.objects.filter(task_id__in=ids).delete()
+
+            move_rows(Task, ArchivedTask, 'id', ids,
+                      archived_at=timezone.now())
+            move_rows(Comment, ArchivedComment, 'task_id', ids)
+
+            log_changes([(task_id, None, 'd') for task_id in ids])
+            invalidate_tasks(ids)
+
+        archived += len(ids)
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .cache import KEY_PREFIX
+from .metrics import count_cache_lookup
+import datetime
+
+
+def token_cache_key(key):
+    return f'{KEY_PREFIX}:auth:{key}'
+
+
+def token_expired(token):
+    """
+    Checks whether the token is older than TOKEN_EXPIRE_AFTER seconds.
+    Tokens never expire when the setting is None.
+    """
+
+    if settings.TOKEN_EXPIRE_AFTER is None:
+        return False
+
+    lifetime = datetime.timedelta(seconds=settings.TOKEN_EXPIRE_AFTER)
+    return token.created + lifetime <= timezone.now()
+
+
+def cached_token(token):
+    """
+    Returns what the cache keeps of a token: the id and the flags
+    of its user checked by the requests and the creation date,
+    but not the password hash or the personal data of the user.
+    """
+
+    user = token.user
+    return {'key': token.key, 'created': token.created, 'user_id': user.id,
+            'is_active': user.is_active, 'is_staff': user.is_staff}
+
+
+def loaded(model, values):
+    """
+    Returns an instance of model with the field values given by attname,
+    the other fields are deferred and loaded when they are used.
+    """
+
+    names = [field.attname for field in model._meta.concrete_fields
+             if field.attname in values]
+    return model.from_db(None, names, [values[name] for name in names])
+
+
+def light_token(data):
+    """
+    Rebuilds a token and its user from their cached data.
+    """
+
+    token = loaded(Token, {'key': data['key'], 'user_id': data['user_id'],
+                           'created': data['created']})
+    token.user = loaded(User, {'id': data['user_id'],
+                               'is_active': data['is_active'],
+                               'is_staff': data['is_staff']})
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication resolving tokens through the cache.
+    Tokens with the flags of their users (and unknown keys) are cached
+    for TOKEN_CACHE_TIMEOUT seconds and invalidated when the token or
+    its user changes, so most requests do not query the database.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        data = cache.get(cache_key)
+        count_cache_lookup('token', data is not None)
+
+        if data is None:
+            token = Token.objects.select_related('user').filter(
+                key=key).first()
+            data = cached_token(token) if token is not None else False
+            cache.set(cache_key, data, timeout=settings.TOKEN_CACHE_TIMEOUT)
+        elif data:
+            token = light_token(data)
+
+        if not data:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        if token_expired(token):
+            raise exceptions.AuthenticationFailed('Token has expired.')
+
+        return (token.user, token)
@@ -0,0 +1,152 @@
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from .cache import invalidate_tasks
+from .changes import log_changes
+from .models import Task
+from .outbox import enqueue_notifications
+from .serializers import TaskBulkItemSerializer
+
+
+UPDATE_FIELDS = ['name', 'specification', 'due_date', 'performer', 'status',
+                 'completed_at']
+
+NAME_TAKEN = 'a task with the same name already exists, try a another name'
+
+
+def task_names(names):
+    """
+    Returns the ids of the tasks with the given names by name.
+    """
+
+    return dict(Task.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def write_tasks(to_create, to_update):
+    """
+    Writes the new and the changed tasks with the change log entries
+    and the notifications about them in a single transaction.
+    """
+
+    with transaction.atomic():
+        Task.objects.bulk_create(to_create)
+        Task.objects.bulk_update(to_update, UPDATE_FIELDS)
+
+        if to_create and to_create[0].pk is None:
+            # Backends that cannot return the ids of inserted rows.
+            created_ids = task_names([task.name for task in to_create])
+            for task in to_create:
+                task.id = created_ids[task.name]
+
+        invalidate_tasks([task.id for task in to_create + to_update])
+        log_changes([*((task.id, None, 'c') for task in to_create),
+                     *((task.id, None, 'u') for task in to_update)])
+        enqueue_notifications([
+            *({'task_id': task.id, 'title': 'A new task has been created'}
+              for task in to_create),
+            *({'task_id': task.id, 'title': 'The task has been changed'}
+              for task in to_update)])
+
+
+def save_tasks(items, user):
+    """
+    Creates and updates a batch of tasks on behalf of the user.
+    Performers, task names and updated tasks of all items are loaded
+    with one query each, and the valid items are written with
+    bulk_create/bulk_update in a single transaction,
+    together with the notifications about them.
+    Items repeating the name or the id of an earlier item are rejected,
+    and so are the items whose name is taken by a concurrent request
+    between the check and the write, which is then retried without them.
+    Returns the per-item results in the order of the items.
+    """
+
+    results = [None] * len(items)
+    valid = []
+
+    for index, item in enumerate(items):
+        serializer = TaskBulkItemSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {'errors': serializer.errors}
+
+    performers = User.objects.filter(
+        username__in={values['performer'] for _, values in valid}).in_bulk(
+        field_name='username')
+    taken_names = task_names({values['name'] for _, values in valid})
+    tasks = Task.objects.in_bulk(
+        [values['id'] for _, values in valid if 'id' in values])
+
+    to_create, to_update, batch_names, batch_ids = [], [], set(), set()
+
+    for index, values in valid:
+        errors = {}
+        task = tasks.get(values.get('id'))
+        performer = performers.get(values['performer'])
+
+        if performer is None:
+            errors['performer'] = ['there is no user with that username']
+
+        if values['name'] in batch_names or taken_names.get(
+                values['name'], values.get('id')) != values.get('id'):
+            errors['name'] = [NAME_TAKEN]
+
+        if values.get('id') in batch_ids:
+            errors['id'] = ['the task is already changed by another item']
+        elif 'id' in values and task is None:
+            errors['id'] = ['Task not found']
+        elif task is not None and user.id not in (task.creator_id,
+                                                  task.performer_id):
+            errors['id'] = ["Failure! You don't have permission "
+                            "to edit this task."]
+        elif task is not None and user.id != task.creator_id and (
+                performer is not None and performer.id != task.performer_id):
+            errors['performer'] = ['You cannot change the task performer']
+
+        if errors:
+            results[index] = {'errors': errors}
+            continue
+
+        batch_names.add(values['name'])
+
+        if task is None:
+            task = Task(creator=user, status='n')
+            to_create.append((index, task))
+        else:
+            batch_ids.add(task.id)
+            to_update.append((index, task))
+
+        task.name = values['name']
+        task.specification = values['specification']
+        task.due_date = values['due_date']
+        task.performer = performer
+        task.status = values.get('status', task.status)
+        task.track_completion()
+
+    while True:
+        try:
+            write_tasks([task for _, task in to_create],
+                        [task for _, task in to_update])
+            break
+        except IntegrityError:
+            for _, task in to_create:
+                task.pk = None
+
+            taken_names = task_names(
+                [task.name for _, task in to_create + to_update])
+            conflicts = {index for index, task in to_create + to_update
+                         if taken_names.get(task.name, task.id) != task.id}
+            if not conflicts:
+                raise
+
+            for index in conflicts:
+                results[index] = {'errors': {'name': [NAME_TAKEN]}}
+            to_create = [item for item in to_create if item[0] not in conflicts]
+            to_update = [item for item in to_update if item[0] not in conflicts]
+
+    for index, task in to_create:
+        results[index] = {'id': task.id, 'status': 'created'}
+    for index, task in to_update:
+        results[index] = {'id': task.id, 'status': 'updated'}
+
+    return results
@@ -0,0 +1,106 @@
+"""
+Response cache of the task list and task details.
+
+Cache keys embed generation counters instead of being deleted one by one:
+a change to a task bumps the task list generation and the generation
+of that task, a new comment bumps the generation of its task,
+and a change to a user bumps the users generation (user data is embedded
+into every response). Entries of old generations are never read again
+and simply expire.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+from .metrics import count_cache_lookup
+from .replicas import read_database, PRIMARY
+import hashlib
+import time
+
+
+KEY_PREFIX = 'tasktable'
+TASKS_GENERATION = f'{KEY_PREFIX}:gen:tasks'
+USERS_GENERATION = f'{KEY_PREFIX}:gen:users'
+
+LOCK_TIMEOUT = 10
+LOCK_WAIT_INTERVAL = 0.05
+
+
+def task_generation(task_id):
+    return f'{KEY_PREFIX}:gen:task:{task_id}'
+
+
+def bump_generation(key):
+    """
+    Atomically increments a generation counter, creating it if necessary.
+    """
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def invalidate_tasks(task_ids):
+    """
+    Invalidates the cached task list and details of the given tasks
+    once the current transaction is committed.
+    """
+
+    def invalidate():
+        bump_generation(TASKS_GENERATION)
+        for task_id in task_ids:
+            bump_generation(task_generation(task_id))
+
+    transaction.on_commit(invalidate)
+
+
+def get_cache_key(request, generation_keys):
+    generations = cache.get_many(generation_keys)
+    versions = ':'.join(str(generations.get(key, 0))
+                        for key in generation_keys)
+    query = hashlib.md5(request.get_full_path().encode()).hexdigest()
+
+    return f'{KEY_PREFIX}:response:{request.user.pk}:{versions}:{query}'
+
+
+def cached_response(request, generation_keys, compute):
+    """
+    Returns the response cached for the requesting user and the query,
+    or computes it with compute() and caches it if its status is 200.
+    Only one of many concurrent misses for the same key recomputes the
+    response, the others wait for its result for up to LOCK_TIMEOUT seconds.
+    Responses are computed from the primary database, a replica lagging
+    behind the generation would leave stale data in the cache.
+    """
+
+    key = get_cache_key(request, generation_keys)
+    data = cache.get(key)
+    count_cache_lookup('response', data is not None)
+    if data is not None:
+        return Response(data)
+
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_TIMEOUT
+
+    while not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        time.sleep(LOCK_WAIT_INTERVAL)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        if time.monotonic() > deadline:
+            with read_database(PRIMARY):
+                return compute()
+
+    try:
+        with read_database(PRIMARY):
+            response = compute()
+        if response.status_code == 200:
+            cache.set(key, response.data,
+                      timeout=settings.TASK_RESPONSE_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+    return response
@@ -0,0 +1,163 @@
+"""
+Change log of tasks and comments served by the task change feed.
+
+Entries get increasing ids when they are inserted, but transactions
+commit in any order and for any time (a long bulk save, import or archive
+batch), so an entry with a lower id can become visible after a client has
+already moved its cursor past it. The feed cursor is therefore not the id
+but the position of the entry, given only to the committed entries by
+sequence_changes, one sequencing transaction at a time and always above
+the positions given before. The positions become visible in the order
+they were given, so a cursor never moves past an entry it has not seen.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .cache import KEY_PREFIX, bump_generation
+from .models import TaskChange, TaskChangeFloor
+import datetime
+import time
+
+
+CHANGES_GENERATION = f'{KEY_PREFIX}:gen:changes'
+
+POLL_INTERVAL = 0.25
+
+# Key of the PostgreSQL advisory lock serializing sequence_changes
+SEQUENCE_LOCK = 0x7461736b
+
+# Most entries given a position by one sequencing transaction
+SEQUENCE_BATCH_SIZE = 10000
+
+
+def log_changes(changes):
+    """
+    Writes (task_id, comment_id, action) entries into the change log.
+    Must be called inside the transaction of the change, like
+    enqueue_notifications. Waiting clients are woken up after the commit.
+    """
+
+    TaskChange.objects.bulk_create([
+        TaskChange(task_id=task_id, comment_id=comment_id, action=action)
+        for task_id, comment_id, action in changes])
+    transaction.on_commit(lambda: bump_generation(CHANGES_GENERATION))
+
+
+def sequence_changes():
+    """
+    Gives positions to the committed entries that have none yet, in id
+    order and above all the positions given before. SQLite runs one write
+    transaction at a time, PostgreSQL takes an advisory lock instead.
+    """
+
+    pending = TaskChange.objects.filter(position__isnull=True)
+    if not pending.exists():
+        return
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)',
+                               [SEQUENCE_LOCK])
+
+        first = pending.order_by('id').values_list('id', flat=True).first()
+        if first is None:
+            return
+
+        last = TaskChange.objects.aggregate(last=Max('position'))['last'] or 0
+        # Positions follow the ids unless an entry was committed late
+        pending.filter(id__lt=first + SEQUENCE_BATCH_SIZE).update(
+            position=F('id') + max(last + 1 - first, 0))
+
+
+def latest_cursor():
+    """
+    Returns the position of the latest change, the cursor from which
+    a new client starts following the feed.
+    """
+
+    sequence_changes()
+    return TaskChange.objects.aggregate(last=Max('position'))['last'] or 0
+
+
+def cursor_expired(cursor):
+    """
+    Tells whether changes made after the cursor have been pruned.
+    """
+
+    return TaskChangeFloor.objects.filter(position__gt=cursor).exists()
+
+
+def changes_since(cursor, limit):
+    sequence_changes()
+    return list(TaskChange.objects.filter(
+        position__gt=cursor).order_by('position')[:limit])
+
+
+def max_wait(request):
+    """
+    Returns the longest wait of a long-poll request in seconds. A sync
+    WSGI worker serves only this request while it waits, so it only waits
+    for TASK_CHANGES_MAX_WAIT_WSGI seconds; under ASGI the wait holds one
+    of the ASGI_THREADS threads.
+    """
+
+    if 'wsgi.version' not in request.META:
+        return settings.TASK_CHANGES_MAX_WAIT
+
+    return min(settings.TASK_CHANGES_MAX_WAIT,
+               settings.TASK_CHANGES_MAX_WAIT_WSGI)
+
+
+def wait_for_changes(cursor, limit, timeout):
+    """
+    Returns up to limit changes after the cursor, waiting for up to
+    timeout seconds for new ones. While nothing is written, only the
+    change generation in the cache is polled, not the database.
+    """
+
+    deadline = time.monotonic() + timeout
+    generation = cache.get(CHANGES_GENERATION)
+
+    while True:
+        changes = changes_since(cursor, limit)
+        if changes:
+            return changes
+
+        # The generation is bumped after the commit of the changes
+        while True:
+            if time.monotonic() >= deadline:
+                return []
+
+            time.sleep(POLL_INTERVAL)
+            current = cache.get(CHANGES_GENERATION)
+            if current != generation:
+                generation = current
+                break
+
+
+def prune_changes(retention_days):
+    """
+    Deletes the changes older than retention_days days and raises the
+    floor of the feed to the highest deleted position, so that cursors
+    below it are told to resync. Returns the number of deleted changes.
+    """
+
+    # Committed entries get their positions before they are counted
+    sequence_changes()
+    expired = TaskChange.objects.filter(
+        created_at__lt=timezone.now() - datetime.timedelta(
+            days=retention_days))
+
+    with transaction.atomic():
+        floor = expired.aggregate(floor=Max('position'))['floor']
+        deleted = expired.delete()[0]
+        if floor is not None and not TaskChangeFloor.objects.filter(
+                pk=1).update(position=Greatest('position', floor)):
+            TaskChangeFloor.objects.create(pk=1, position=floor)
+
+    return deleted
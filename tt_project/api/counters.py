@@ -0,0 +1,51 @@
+from django.db.models import (Count, DateTimeField, F, IntegerField,
+                              OuterRef, Subquery, Value)
+from django.db.models.functions import Coalesce, Greatest
+from .models import Task, Comment
+
+
+def last_comment_date():
+    return Subquery(Comment.objects.filter(task=OuterRef('pk')).order_by(
+        '-post_date').values('post_date')[:1])
+
+
+def comment_saved(comment, created):
+    """
+    Counts a new comment of the task and moves its last comment date
+    forward. Both are changed in the database with one UPDATE, so
+    concurrent comments are never lost and a comment committed late never
+    moves the date back. Edited comments get a new post date too.
+    """
+
+    post_date = Value(comment.post_date, output_field=DateTimeField())
+    values = {'last_comment_at': Greatest(
+        Coalesce('last_comment_at', post_date), post_date)}
+    if created:
+        values['comment_count'] = F('comment_count') + 1
+
+    Task.objects.filter(pk=comment.task_id).update(**values)
+
+
+def comment_deleted(comment):
+    """
+    Uncounts a deleted comment and takes the last comment date
+    from the remaining comments of the task.
+    """
+
+    Task.objects.filter(pk=comment.task_id).update(
+        comment_count=F('comment_count') - 1,
+        last_comment_at=last_comment_date())
+
+
+def repair_comment_counters(tasks):
+    """
+    Recounts the comments and the last comment date of the given tasks
+    from the comments table. Returns the number of updated tasks.
+    """
+
+    comment_count = Subquery(Comment.objects.filter(
+        task=OuterRef('pk')).order_by().values('task').annotate(
+        count=Count('id')).values('count'), output_field=IntegerField())
+
+    return tasks.update(comment_count=Coalesce(comment_count, 0),
+                        last_comment_at=last_comment_date())
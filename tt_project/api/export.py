@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from .models import Task, Comment
+import csv
+import datetime
+
+
+TASK_COLUMNS = ['id', 'name', 'specification', 'due_date', 'status',
+                'creator', 'performer']
+COMMENT_COLUMNS = ['id', 'task', 'task_name', 'description', 'author',
+                   'post_date']
+
+
+def task_rows(since=None, status=None, performer=None):
+    """
+    Returns an iterator over the export rows of the tasks
+    due on or after since, with the given status and performer.
+    """
+
+    queryset = Task.objects.all()
+    if since is not None:
+        queryset = queryset.filter(due_date__gte=since)
+    if status is not None:
+        queryset = queryset.filter(status=status)
+    if performer is not None:
+        queryset = queryset.filter(performer__username=performer)
+
+    return queryset.order_by('id').values_list(
+        'id', 'name', 'specification', 'due_date', 'status',
+        'creator__username', 'performer__username').iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def comment_rows(since=None, status=None, performer=None):
+    """
+    Returns an iterator over the export rows of the comments posted
+    on or after since, on tasks with the given status and performer.
+    """
+
+    queryset = Comment.objects.all()
+    if since is not None:
+        queryset = queryset.filter(post_date__gte=timezone.make_aware(
+            datetime.datetime.combine(since, datetime.time.min)))
+    if status is not None:
+        queryset = queryset.filter(task__status=status)
+    if performer is not None:
+        queryset = queryset.filter(task__performer__username=performer)
+
+    return queryset.order_by('id').values_list(
+        'id', 'task_id', 'task__name', 'description', 'author__username',
+        'post_date').iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+EXPORTS = {
+    'tasks': (TASK_COLUMNS, task_rows),
+    'comments': (COMMENT_COLUMNS, comment_rows),
+}
+
+
+class Echo:
+    """
+    File-like object returning what is written to it,
+    so that csv.writer can format one row at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_lines(kind, output, **filters):
+    """
+    Generates the NDJSON or CSV lines of the tasks or comments export
+    one row at a time, so that memory use does not depend on the table size.
+    """
+
+    columns, rows = EXPORTS[kind]
+
+    if output == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows(**filters):
+            yield writer.writerow(row)
+    else:
+        encoder = DjangoJSONEncoder()
+        for row in rows(**filters):
+            yield encoder.encode(dict(zip(columns, row))) + '\n'
@@ -0,0 +1,18 @@
+from rest_framework.filters import OrderingFilter
+
+
+class TieBreakOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter ending the requested ordering with the id, in the
+    direction of its last field, so that rows with equal values keep
+    the same order from page to page and the (field, id) indexes
+    can serve the whole ordering.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering or any(field.lstrip('-') in ('id', 'pk')
+                               for field in ordering):
+            return ordering
+
+        return [*ordering, '-id' if ordering[-1].startswith('-') else 'id']
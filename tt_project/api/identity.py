@@ -0,0 +1,38 @@
+class IdentityMap:
+    """
+    Request-scoped map of model instances loaded by field lookups.
+    Serializers resolve the objects they validate through the map,
+    so the view gets the same instances without querying them again.
+    """
+
+    def __init__(self):
+        self._objects = {}
+
+    def get(self, model, **lookup):
+        """
+        Returns the instance matching the lookup or None,
+        querying the database only the first time it is requested.
+        """
+
+        key = (model, tuple(sorted(lookup.items())))
+        if key not in self._objects:
+            self._objects[key] = model._default_manager.filter(
+                **lookup).first()
+
+        return self._objects[key]
+
+
+def get_identity_map(request):
+    """
+    Returns the identity map of the request, creating it on first use.
+    Without a request every call gets a new, empty map.
+    """
+
+    if request is None:
+        return IdentityMap()
+
+    request = getattr(request, '_request', request)
+    if not hasattr(request, 'identity_map'):
+        request.identity_map = IdentityMap()
+
+    return request.identity_map
@@ -0,0 +1,193 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.authtoken.models import Token
+from .cache import bump_generation, TASKS_GENERATION, USERS_GENERATION
+from .changes import log_changes
+from .counters import repair_comment_counters
+from .models import Task, Comment
+import io
+import itertools
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_value(parse, value):
+    """
+    Parses a date of an imported row, rejecting the values that
+    the parse function does not recognize instead of dropping them.
+    """
+
+    parsed = parse(value)
+    if parsed is None:
+        raise ValueError(f'Invalid date: {value!r}')
+
+    return parsed
+
+
+def copy_value(value):
+    """
+    Formats a value for the text format of PostgreSQL COPY.
+    """
+
+    if value is None:
+        return '\\N'
+
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace(
+        '\n', '\\n').replace('\r', '\\r')
+
+
+class Importer:
+    """
+    Imports users, tasks and comments in batches, bypassing model signals:
+    no tokens are created one by one and no notifications are sent.
+    The change log gets one entry per imported task, and one task update
+    per commented task, as the ids of imported comments are not known.
+    Users are resolved through an in-memory username -> id map,
+    tasks of comments through one query per batch.
+    On PostgreSQL tasks and comments are inserted with COPY.
+    """
+
+    def __init__(self, batch_size, use_copy=True):
+        self.batch_size = batch_size
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.user_ids = dict(User.objects.values_list('username', 'id'))
+        self.unresolved = 0
+
+    def run(self, kind, rows):
+        """
+        Imports the rows of the given kind, yielding the number of rows
+        saved after every batch.
+        """
+
+        save_batch = getattr(self, f'save_{kind}')
+        try:
+            for batch in batches(rows, self.batch_size):
+                with transaction.atomic():
+                    save_batch(batch)
+                yield len(batch)
+        finally:
+            bump_generation(TASKS_GENERATION)
+            bump_generation(USERS_GENERATION)
+
+    def resolve_user(self, username):
+        if not username:
+            return None
+
+        user_id = self.user_ids.get(username)
+        if user_id is None:
+            self.unresolved += 1
+
+        return user_id
+
+    def save_users(self, rows):
+        users = [User(username=row['username'], email=row.get('email', ''),
+                      first_name=row.get('first_name', ''),
+                      last_name=row.get('last_name', ''),
+                      password=row.get('password') or make_password(None))
+                 for row in rows]
+        User.objects.bulk_create(users)
+
+        if users[0].pk is None:
+            # Backends that cannot return the ids of inserted rows.
+            self.user_ids.update(User.objects.filter(
+                username__in=[user.username for user in users]).values_list(
+                'username', 'id'))
+        else:
+            self.user_ids.update((user.username, user.pk) for user in users)
+
+        tokens = [Token(user_id=self.user_ids[user.username])
+                  for user in users]
+        for token in tokens:
+            token.key = token.generate_key()
+        Token.objects.bulk_create(tokens)
+
+    def save_tasks(self, rows):
+        now = timezone.now()
+        names = [row['name'] for row in rows]
+        self.insert(Task, [
+            'name', 'specification', 'due_date', 'status', 'creator_id',
+            'performer_id', 'comment_count', 'completed_at'
+        ], [
+            (row['name'], row['specification'],
+             parse_value(parse_date, row['due_date'])
+             if row.get('due_date') else None,
+             row.get('status') or 'n', self.resolve_user(row.get('creator')),
+             self.resolve_user(row.get('performer')), 0,
+             now if row.get('status') == 'c' else None)
+            for row in rows])
+        # Task names are unique, the inserted rows give no ids
+        log_changes((task_id, None, 'c') for task_id in Task.objects.filter(
+            name__in=names).order_by('id').values_list('id', flat=True))
+
+    def save_comments(self, rows):
+        task_ids = dict(Task.objects.filter(
+            name__in={row['task_name'] for row in rows}).values_list(
+            'name', 'id'))
+
+        values = []
+        for row in rows:
+            task_id = task_ids.get(row['task_name'])
+            if task_id is None:
+                self.unresolved += 1
+                continue
+
+            post_date = parse_value(parse_datetime, row['post_date']) \
+                if row.get('post_date') else timezone.now()
+            if timezone.is_naive(post_date):
+                post_date = timezone.make_aware(post_date)
+
+            values.append((task_id, row['description'],
+                           self.resolve_user(row.get('author')), post_date))
+
+        self.insert(Comment, ['task_id', 'description', 'author_id',
+                              'post_date'], values)
+        # Comments are inserted without signals, so the counters of
+        # their tasks are recounted once per batch
+        task_ids = {row[0] for row in values}
+        repair_comment_counters(Task.objects.filter(id__in=task_ids))
+        log_changes((task_id, None, 'u') for task_id in sorted(task_ids))
+
+    def insert(self, model, columns, values):
+        """
+        Inserts the rows of values with COPY on PostgreSQL,
+        or with an INSERT query for all rows otherwise.
+        The values are saved as given, including auto_now dates.
+        """
+
+        if not values:
+            return
+
+        if self.use_copy:
+            buffer = io.StringIO()
+            for row in values:
+                buffer.write('\t'.join(copy_value(value) for value in row))
+                buffer.write('\n')
+            buffer.seek(0)
+
+            with connection.cursor() as cursor:
+                cursor.cursor.copy_expert(
+                    f'COPY {model._meta.db_table} ({", ".join(columns)}) '
+                    'FROM STDIN', buffer)
+            return
+
+        # A plain INSERT: bulk_create would overwrite the imported
+        # auto_now dates with now()
+        quote = connection.ops.quote_name
+        fields = [model._meta.get_field(column) for column in columns]
+        rows = [[field.get_db_prep_save(value, connection)
+                 for field, value in zip(fields, row)] for row in values]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {quote(model._meta.db_table)} '
+                f'({", ".join(map(quote, columns))}) '
+                f'VALUES ({", ".join(["%s"] * len(columns))})', rows)
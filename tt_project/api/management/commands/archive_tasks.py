@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.archive import archive_tasks
+
+
+class Command(BaseCommand):
+    help = 'Moves the old completed tasks with their comments to the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.TASK_ARCHIVE_AFTER_DAYS,
+                            help='Age in days of the archived tasks')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.TASK_ARCHIVE_BATCH_SIZE,
+                            help='Tasks archived per transaction')
+
+    def handle(self, *args, **options):
+        archived = archive_tasks(options['days'], options['batch_size'])
+        self.stdout.write(f'{archived} tasks archived')
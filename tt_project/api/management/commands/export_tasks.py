@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.export import EXPORTS, export_lines
+from api.serializers import ExportSerializer
+
+
+class Command(BaseCommand):
+    help = 'Streams all tasks or comments as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument('--output', default='ndjson',
+                            help='Export format: ndjson or csv')
+        parser.add_argument('--since',
+                            help='Tasks due or comments posted on or after '
+                                 'this date (YYYY-MM-DD)')
+        parser.add_argument('--status', help='Task status: n, w or c')
+        parser.add_argument('--performer', help='Task performer username')
+        parser.add_argument('--file', help='Write to this file '
+                                           'instead of stdout')
+
+    def handle(self, *args, **options):
+        serializer = ExportSerializer(data={
+            name: options[name] for name in ('output', 'since', 'status',
+                                             'performer')
+            if options[name] is not None})
+        if not serializer.is_valid():
+            raise CommandError(serializer.errors)
+
+        filters = dict(serializer.validated_data)
+        output = filters.pop('output')
+        lines = export_lines(options['kind'], output, **filters)
+
+        if options['file']:
+            with open(options['file'], 'w', newline='') as file:
+                file.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from api.importer import Importer
+import csv
+import json
+import sys
+import time
+
+
+REPORT_INTERVAL = 5
+
+
+class Command(BaseCommand):
+    help = ('Imports users, tasks or comments from an NDJSON or CSV file '
+            'in batches, without creating tokens one by one '
+            'or sending notifications')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['users', 'tasks', 'comments'])
+        parser.add_argument('path', help="File to import, '-' for stdin")
+        parser.add_argument('--input', choices=['ndjson', 'csv'],
+                            help='File format, guessed from the extension '
+                                 'by default')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.IMPORT_BATCH_SIZE,
+                            help='Rows inserted at a time')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Use INSERT queries instead of COPY '
+                                 'on PostgreSQL')
+
+    def read_rows(self, file, input_format):
+        if input_format == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['input'] or (
+            'csv' if path.endswith('.csv') else 'ndjson')
+        importer = Importer(options['batch_size'],
+                            use_copy=not options['no_copy'])
+
+        file = sys.stdin if path == '-' else open(path, newline='',
+                                                  encoding='utf-8')
+        started = reported = time.monotonic()
+        imported = 0
+
+        try:
+            for count in importer.run(options['kind'],
+                                      self.read_rows(file, input_format)):
+                imported += count
+                now = time.monotonic()
+                if now - reported >= REPORT_INTERVAL:
+                    reported = now
+                    self.stdout.write(f'{imported} rows, '
+                                      f'{imported / (now - started):.0f} '
+                                      'rows/s')
+        except (IntegrityError, KeyError, ValueError) as exc:
+            raise CommandError(f'Import stopped after {imported} rows: '
+                               f'{exc!r}')
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        elapsed = max(time.monotonic() - started, 0.001)
+        self.stdout.write(f'{imported} {options["kind"]} imported in '
+                          f'{elapsed:.1f}s ({imported / elapsed:.0f} rows/s)')
+        if importer.unresolved:
+            self.stdout.write(f'{importer.unresolved} unknown users or tasks '
+                              'left empty or skipped')
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.tasks import relay_notifications
+
+
+class Command(BaseCommand):
+    help = 'Publishes the pending outbox notifications to the broker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.NOTIFICATION_RELAY_BATCH_SIZE,
+                            help='Notifications per bulk email job')
+
+    def handle(self, *args, **options):
+        relayed = relay_notifications(options['batch_size'])
+        self.stdout.write(f'{relayed} notifications relayed')
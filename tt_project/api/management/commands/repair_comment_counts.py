@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.cache import invalidate_tasks
+from api.counters import repair_comment_counters
+from api.models import Task
+
+
+class Command(BaseCommand):
+    help = 'Recounts the comments and the latest comment date of the tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Tasks updated per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        repaired = 0
+        last_id = 0
+
+        # Short transactions over id ranges do not lock the whole table
+        while True:
+            ids = list(Task.objects.filter(id__gt=last_id).order_by(
+                'id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            with transaction.atomic():
+                repaired += repair_comment_counters(
+                    Task.objects.filter(id__in=ids))
+                invalidate_tasks(ids)
+            last_id = ids[-1]
+
+        self.stdout.write(f'{repaired} tasks recounted')
@@ -0,0 +1,260 @@
+"""
+Prometheus metrics of the HTTP requests, their database queries,
+the caches and the Celery tasks.
+
+With the prometheus_multiproc_dir environment variable set (gunicorn
+and Celery worker processes) every process writes its metrics to files
+in that directory and the metrics view and the worker metrics server
+add up the files of all processes. Only counters and histograms are
+used, so the files of exited processes need no cleanup while running.
+"""
+
+from celery.signals import (before_task_publish, task_prerun, task_postrun,
+                            task_retry, worker_init)
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (CollectorRegistry, Counter, Histogram,
+                               CONTENT_TYPE_LATEST, REGISTRY,
+                               generate_latest, multiprocess,
+                               start_http_server)
+from contextlib import ExitStack
+import hmac
+import ipaddress
+import os
+import time
+
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REQUEST_LATENCY = Histogram(
+    'tasktable_http_request_duration_seconds',
+    'Time to respond to a request, by route',
+    ['method', 'route'], buckets=LATENCY_BUCKETS)
+RESPONSES = Counter(
+    'tasktable_http_responses_total',
+    'Responses by route and status code',
+    ['method', 'route', 'status'])
+REQUEST_QUERIES = Histogram(
+    'tasktable_db_queries_per_request',
+    'Database queries made by a request, by route',
+    ['route'], buckets=QUERY_BUCKETS)
+REQUEST_QUERY_TIME = Histogram(
+    'tasktable_db_query_duration_seconds_per_request',
+    'Time spent in database queries by a request, by route',
+    ['route'], buckets=LATENCY_BUCKETS)
+CACHE_REQUESTS = Counter(
+    'tasktable_cache_requests_total',
+    'Lookups of the response and token caches',
+    ['cache', 'result'])
+
+CELERY_TASK_RUNTIME = Histogram(
+    'tasktable_celery_task_duration_seconds',
+    'Time to run a Celery task, by task name',
+    ['task'], buckets=LATENCY_BUCKETS)
+CELERY_TASKS = Counter(
+    'tasktable_celery_tasks_total',
+    'Celery tasks run, by task name and final state',
+    ['task', 'state'])
+CELERY_TASK_RETRIES = Counter(
+    'tasktable_celery_task_retries_total',
+    'Retries of Celery tasks, by task name',
+    ['task'])
+CELERY_QUEUE_WAIT = Histogram(
+    'tasktable_celery_queue_wait_seconds',
+    'Time from publishing a Celery task to a worker starting it',
+    ['task'], buckets=LATENCY_BUCKETS)
+
+# Message header with the time a task was published at
+PUBLISHED_AT_HEADER = 'published_at'
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def get_registry():
+    """
+    Returns the registry of this process, or one collecting the metrics
+    of all processes in multiprocess mode.
+    """
+
+    if 'prometheus_multiproc_dir' not in os.environ:
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_allowed(request):
+    """
+    Checks whether the request comes from METRICS_ALLOWED_IPS
+    or carries the METRICS_TOKEN bearer token.
+    """
+
+    if settings.METRICS_TOKEN is not None and hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', '').encode(),
+            f'Bearer {settings.METRICS_TOKEN}'.encode()):
+        return True
+
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+
+    return any(address in ipaddress.ip_network(network, strict=False)
+               for network in settings.METRICS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+
+    return HttpResponse(generate_latest(get_registry()),
+                        content_type=CONTENT_TYPE_LATEST)
+
+
+def count_cache_lookup(cache_name, hit):
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
+
+
+def request_route(request):
+    """
+    Returns the URL pattern that served the request, so that all tasks
+    share the route of the task details, for example.
+    """
+
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_ROUTE
+
+    # Regex routes of the router end with $
+    return match.route.rstrip('$')
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries and their time.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def count_queries(queries):
+    """
+    Returns a context counting the queries of all databases with queries.
+    """
+
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(queries))
+    return stack
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, status code, number of database queries and
+    time spent in them of every request, by route.
+    Streaming responses are measured until their last byte,
+    including the queries made while their content is generated.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with count_queries(queries):
+            response = self.get_response(request)
+
+        if response.streaming:
+            response.streaming_content = self.measure_stream(
+                request, response, response.streaming_content, queries,
+                started)
+        else:
+            self.record(request, response, queries, started)
+
+        return response
+
+    def measure_stream(self, request, response, content, queries, started):
+        try:
+            # Iterated in the thread sending the response
+            with count_queries(queries):
+                yield from content
+        finally:
+            self.record(request, response, queries, started)
+
+    @staticmethod
+    def record(request, response, queries, started):
+        elapsed = time.perf_counter() - started
+
+        route = request_route(request)
+        REQUEST_LATENCY.labels(request.method, route).observe(elapsed)
+        RESPONSES.labels(request.method, route, response.status_code).inc()
+        REQUEST_QUERIES.labels(route).observe(queries.count)
+        REQUEST_QUERY_TIME.labels(route).observe(queries.duration)
+
+
+# Start times of the tasks running in this worker process, by task id
+task_started = {}
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(PUBLISHED_AT_HEADER, time.time())
+
+
+def request_header(request, name):
+    # Custom headers are attributes of the request of a worker,
+    # but stay nested in the headers of eagerly applied tasks
+    return getattr(request, name, None) or \
+        (getattr(request, 'headers', None) or {}).get(name)
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    task_started[task_id] = time.perf_counter()
+
+    published_at = request_header(task.request, PUBLISHED_AT_HEADER)
+    # Retries and tasks with a countdown wait on purpose
+    if published_at is not None and not task.request.eta:
+        CELERY_QUEUE_WAIT.labels(task.name).observe(
+            max(time.time() - published_at, 0))
+
+
+@task_postrun.connect
+def stop_task_timer(task_id=None, task=None, state=None, **kwargs):
+    started = task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_RUNTIME.labels(task.name).observe(
+            time.perf_counter() - started)
+    CELERY_TASKS.labels(task.name, state or 'UNKNOWN').inc()
+
+
+@task_retry.connect
+def count_task_retry(sender=None, **kwargs):
+    CELERY_TASK_RETRIES.labels(sender.name).inc()
+
+
+@worker_init.connect
+def start_worker_metrics_server(**kwargs):
+    """
+    Serves the metrics of all worker processes on WORKER_METRICS_PORT
+    from the main process of a Celery worker.
+    """
+
+    if settings.WORKER_METRICS_PORT:
+        start_http_server(settings.WORKER_METRICS_PORT,
+                          registry=get_registry())
@@ -0,0 +1,45 @@
+# Generated by Django 3.0.8 on 2026-10-18 08:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Enter a task name', max_length=200, unique=True)),
+                ('specification', models.TextField(help_text='Enter a task specification')),
+                ('due_date', models.DateField(blank=True, help_text='Deadline for the task', null=True)),
+                ('status', models.CharField(blank=True, choices=[('n', 'New'), ('w', 'In work'), ('c', 'Completed')], default='n', help_text='Current task status', max_length=1)),
+                ('creator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='task_creator', to=settings.AUTH_USER_MODEL)),
+                ('performer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='task_performer', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['due_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.TextField(help_text='Enter a comment on the task here')),
+                ('post_date', models.DateTimeField(auto_now=True)),
+                ('author', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_comments', to='api.Task')),
+            ],
+            options={
+                'ordering': ['-post_date'],
+            },
+        ),
+    ]
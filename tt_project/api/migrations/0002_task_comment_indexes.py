@@ -0,0 +1,51 @@
+# Generated by Django 3.0.8 on 2026-10-18 08:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['task', '-post_date'], name='comment_task_post_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['due_date', 'id'], name='task_due_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'due_date'], name='task_status_due_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['performer', 'due_date'], name='task_performer_due_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator', 'due_date'], name='task_creator_due_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='task',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='task_comments', to='api.Task'),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='creator',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='task_creator', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='performer',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='task_performer', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
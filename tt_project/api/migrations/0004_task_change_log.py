@@ -0,0 +1,26 @@
+# Generated by Django 3.0.8 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.IntegerField()),
+                ('comment_id', models.IntegerField(blank=True, null=True)),
+                ('action', models.CharField(choices=[('c', 'Created'), ('u', 'Updated'), ('d', 'Deleted')], max_length=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
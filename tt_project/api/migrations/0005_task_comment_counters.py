@@ -0,0 +1,46 @@
+# Generated by Django 3.0.8 on 2026-10-18 09:01
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, schema_editor):
+    Task = apps.get_model('api', 'Task')
+    Comment = apps.get_model('api', 'Comment')
+
+    comments = Comment.objects.filter(task=OuterRef('pk')).order_by()
+    Task.objects.update(
+        comment_count=Coalesce(Subquery(comments.values('task').annotate(
+            count=Count('id')).values('count'), output_field=IntegerField()), 0),
+        last_comment_at=Subquery(comments.order_by('-post_date').values(
+            'post_date')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_task_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of comments on the task'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Date of the latest comment on the task', null=True),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['comment_count', 'id'], name='task_comment_count_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['last_comment_at', 'id'], name='task_last_comment_id_idx'),
+        ),
+    ]
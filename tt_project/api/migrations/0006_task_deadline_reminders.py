@@ -0,0 +1,39 @@
+# Generated by Django 3.0.8 on 2026-10-18 09:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_task_comment_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskReminder',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('s', 'Due soon'), ('o', 'Overdue')], max_length=1)),
+                ('due_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(status__in=('n', 'w')), fields=['due_date', 'id'], name='task_open_due_date_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='taskreminder',
+            name='task',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.Task'),
+        ),
+        migrations.AddConstraint(
+            model_name='taskreminder',
+            constraint=models.UniqueConstraint(fields=('task', 'kind', 'due_date'), name='task_reminder_unique'),
+        ),
+    ]
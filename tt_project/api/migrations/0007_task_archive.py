@@ -0,0 +1,55 @@
+# Generated by Django 3.0.8 on 2026-10-18 09:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0006_task_deadline_reminders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('specification', models.TextField()),
+                ('due_date', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('n', 'New'), ('w', 'In work'), ('c', 'Completed')], max_length=1)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+                ('last_comment_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField()),
+                ('creator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('performer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-due_date', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('description', models.TextField()),
+                ('post_date', models.DateTimeField()),
+                ('author', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='task_comments', to='api.ArchivedTask')),
+            ],
+            options={
+                'ordering': ['-post_date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedtask',
+            index=models.Index(fields=['due_date', 'id'], name='archived_task_due_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcomment',
+            index=models.Index(fields=['task', '-post_date'], name='archived_comment_task_date_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.0.8 on 2026-10-18 09:41
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def position_changes(apps, schema_editor):
+    # The existing entries keep their ids, which clients hold as cursors
+    TaskChange = apps.get_model('api', 'TaskChange')
+    TaskChange.objects.update(position=F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_task_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskchange',
+            name='position',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(position_changes, migrations.RunPython.noop),
+    ]
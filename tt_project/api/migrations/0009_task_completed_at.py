@@ -0,0 +1,47 @@
+# Generated by Django 3.0.8 on 2026-10-18 09:48
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+import datetime
+
+
+def estimate_completion(apps, schema_editor):
+    # The best known date of the tasks completed before: their latest
+    # comment, their due date or, without both, the migration itself
+    Task = apps.get_model('api', 'Task')
+    completed = Task.objects.filter(status='c', completed_at__isnull=True)
+
+    completed.filter(last_comment_at__isnull=False).update(
+        completed_at=F('last_comment_at'))
+    dated = completed.filter(due_date__isnull=False).order_by()
+    for due_date in dated.values_list('due_date', flat=True).distinct():
+        completed.filter(due_date=due_date).update(
+            completed_at=timezone.make_aware(datetime.datetime.combine(
+                due_date, datetime.time())))
+    completed.update(completed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_task_change_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedtask',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Date the task was completed', null=True),
+        ),
+        migrations.RunPython(estimate_completion, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(status='c'), fields=['completed_at'], name='task_completed_at_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.0.8 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_task_completed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskChangeFloor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -3,6 +3,11 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 from django.db import models
+from django.utils import timezone
+
+
+# Statuses of the tasks that are not completed yet
+OPEN_TASK_STATUSES = ('n', 'w')
 
 
 @receiver(post_save, sender=User)
@@ -20,6 +25,8 @@ class Task(models.Model):
     """
     The Model represents a specific task to be completed,
     with a specific status, deadline, creator and performer.
+    Note that save() without update_fields does not write the comment
+    counters of an existing task (see COUNTER_FIELDS and save).
     """
 
     name = models.CharField(unique=True, max_length=200,
@@ -28,9 +35,11 @@ class Task(models.Model):
     due_date = models.DateField(null=True, blank=True,
                                 help_text='Deadline for the task')
     creator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
-                                blank=True, related_name='task_creator')
+                                blank=True, related_name='task_creator',
+                                db_index=False)
     performer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
-                                  blank=True, related_name='task_performer')
+                                  blank=True, related_name='task_performer',
+                                  db_index=False)
 
     TASK_STATUS = (
         ('n', 'New'),
@@ -40,9 +49,81 @@ class Task(models.Model):
 
     status = models.CharField(max_length=1, choices=TASK_STATUS, default='n',
                               blank=True, help_text='Current task status')
+    comment_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text='Number of comments on the task')
+    last_comment_at = models.DateTimeField(
+        null=True, blank=True, editable=False,
+        help_text='Date of the latest comment on the task')
+    completed_at = models.DateTimeField(
+        null=True, blank=True, editable=False,
+        help_text='Date the task was completed')
+
+    # Maintained by the comment signals with UPDATE queries only
+    COUNTER_FIELDS = ('comment_count', 'last_comment_at')
 
     class Meta:
         ordering = ['due_date']
+        # The creator and performer foreign keys are covered by the leading
+        # columns of the composite indexes below.
+        indexes = [
+            models.Index(fields=['due_date', 'id'],
+                         name='task_due_date_id_idx'),
+            models.Index(fields=['status', 'due_date'],
+                         name='task_status_due_date_idx'),
+            models.Index(fields=['performer', 'due_date'],
+                         name='task_performer_due_date_idx'),
+            models.Index(fields=['creator', 'due_date'],
+                         name='task_creator_due_date_idx'),
+            models.Index(fields=['comment_count', 'id'],
+                         name='task_comment_count_id_idx'),
+            models.Index(fields=['last_comment_at', 'id'],
+                         name='task_last_comment_id_idx'),
+            # The archival looks for the tasks completed long ago
+            models.Index(fields=['completed_at'],
+                         name='task_completed_at_idx',
+                         condition=models.Q(status='c')),
+            # Deadline reminders scan only the tasks that are not completed
+            models.Index(fields=['due_date', 'id'],
+                         name='task_open_due_date_id_idx',
+                         condition=models.Q(status__in=OPEN_TASK_STATUSES)),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the task without its comment counters, so that saving a task
+        loaded before a comment was added does not overwrite them:
+        without update_fields, an existing task is saved with all its
+        loaded fields except COUNTER_FIELDS. The counters are only
+        written when they are listed in update_fields or by UPDATE
+        queries (see api/counters.py).
+        """
+
+        self.track_completion()
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and update_fields is None:
+            skipped = self.get_deferred_fields().union(self.COUNTER_FIELDS)
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped]
+        elif update_fields is not None and 'status' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'completed_at'}
+
+        super().save(*args, **kwargs)
+
+    def track_completion(self):
+        """
+        Sets completed_at when the task becomes completed and clears it
+        when the task is reopened. Must be called before the task is saved
+        by bulk_create or bulk_update, which do not call save.
+        """
+
+        if self.get_deferred_fields() & {'status', 'completed_at'}:
+            return
+
+        if self.status != 'c':
+            self.completed_at = None
+        elif self.completed_at is None:
+            self.completed_at = timezone.now()
 
     def __str__(self):
         return self.name
@@ -54,13 +135,17 @@ class Comment(models.Model):
     """
 
     task = models.ForeignKey(Task, on_delete=models.CASCADE,
-                             related_name='task_comments')
+                             related_name='task_comments', db_index=False)
     description = models.TextField(help_text='Enter a comment on the task here')
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     post_date = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-post_date']
+        indexes = [
+            models.Index(fields=['task', '-post_date'],
+                         name='comment_task_post_date_idx'),
+        ]
 
     def __str__(self):
         if len(self.description) > 75:
@@ -68,3 +153,153 @@ class Comment(models.Model):
         else:
             comment_string = self.description
         return comment_string
+
+
+class Notification(models.Model):
+    """
+    Model representing an email notification waiting in the outbox.
+    Notifications are written in the same transaction as the change
+    they are about and published to the broker in batches by the relay.
+    """
+
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True,
+                                blank=True, related_name='+')
+    title = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return self.title or f'Comment {self.comment_id}'
+
+
+class TaskChange(models.Model):
+    """
+    Model representing an entry of the change log of tasks and comments.
+    Entries are written in the same transaction as the change and keep
+    the ids of deleted objects, so clients can fetch only the changes
+    made since the last entry they have seen.
+    """
+
+    task_id = models.IntegerField()
+    comment_id = models.IntegerField(null=True, blank=True)
+
+    CHANGE_ACTION = (
+        ('c', 'Created'),
+        ('u', 'Updated'),
+        ('d', 'Deleted'),
+    )
+
+    action = models.CharField(max_length=1, choices=CHANGE_ACTION)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Position in the feed in commit order, given after the commit
+    position = models.BigIntegerField(null=True, blank=True, unique=True,
+                                      editable=False)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.get_action_display()} task {self.task_id}'
+
+
+class TaskChangeFloor(models.Model):
+    """
+    Model representing the highest position of the pruned change log
+    entries, kept in a single row. Clients whose cursor is below it may
+    have missed pruned changes and must resync.
+    """
+
+    position = models.BigIntegerField()
+
+    def __str__(self):
+        return f'Pruned up to {self.position}'
+
+
+class TaskReminder(models.Model):
+    """
+    Model representing a deadline reminder sent about a task.
+    A task is reminded once per kind and due date, so a reminder
+    is sent again only when the due date of the task changes.
+    """
+
+    # Covered by the leading column of the unique constraint
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='+',
+                             db_index=False)
+
+    REMINDER_KIND = (
+        ('s', 'Due soon'),
+        ('o', 'Overdue'),
+    )
+
+    kind = models.CharField(max_length=1, choices=REMINDER_KIND)
+    due_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'kind', 'due_date'],
+                                    name='task_reminder_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} task {self.task_id}'
+
+
+class ArchivedTask(models.Model):
+    """
+    Model representing a completed task moved out of the task table
+    by the archival (see api/archive.py). The task keeps its id,
+    and its name may be taken again by a new task.
+    """
+
+    id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=200)
+    specification = models.TextField()
+    due_date = models.DateField(null=True, blank=True)
+    creator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
+                                blank=True, related_name='+')
+    performer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
+                                  blank=True, related_name='+')
+    status = models.CharField(max_length=1, choices=Task.TASK_STATUS)
+    comment_count = models.PositiveIntegerField(default=0)
+    last_comment_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-due_date', '-id']
+        indexes = [
+            models.Index(fields=['due_date', 'id'],
+                         name='archived_task_due_date_id_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ArchivedComment(models.Model):
+    """
+    Model representing a comment of an archived task.
+    """
+
+    id = models.IntegerField(primary_key=True)
+    task = models.ForeignKey(ArchivedTask, on_delete=models.CASCADE,
+                             related_name='task_comments', db_index=False)
+    description = models.TextField()
+    author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True,
+                               related_name='+')
+    post_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-post_date']
+        indexes = [
+            models.Index(fields=['task', '-post_date'],
+                         name='archived_comment_task_date_idx'),
+        ]
+
+    def __str__(self):
+        return Comment.__str__(self)
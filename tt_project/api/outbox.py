@@ -0,0 +1,20 @@
+from django.conf import settings
+from .models import Notification
+
+
+def enqueue_notifications(notifications):
+    """
+    Writes {'task_id', 'title'} and {'task_id', 'comment_id'} notifications
+    into the outbox. Must be called inside the transaction of the change,
+    so that a notification is stored if and only if the change is committed.
+    Nothing is stored when sending emails is not configured.
+    """
+
+    if settings.EMAIL_HOST_USER is None:
+        return
+
+    Notification.objects.bulk_create([
+        Notification(task_id=notification['task_id'],
+                     comment_id=notification.get('comment_id'),
+                     title=notification.get('title', ''))
+        for notification in notifications])
@@ -0,0 +1,120 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from django.db.models import F, Q
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class TaskKeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination of tasks by the stable key (due_date, id),
+    tasks without a due date first, then the latest due dates first.
+    Every page is fetched with an indexed range condition instead of OFFSET,
+    so the response time does not depend on how deep the client pages.
+    The total number of tasks is only counted on request (?count=1).
+    The order is fixed by the key, so requests with ?ordering= are rejected.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+    ordering_message = 'Cursor pagination does not support ordering'
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if api_settings.ORDERING_PARAM in request.query_params:
+            raise ParseError(self.ordering_message)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = None
+
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(F('due_date').desc(nulls_first=True),
+                                     '-id')
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.get_position_filter(*cursor))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        content = [('next', self.get_next_link()), ('results', data)]
+        if self.count is not None:
+            content.insert(0, ('count', self.count))
+
+        return Response(OrderedDict(content))
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    @staticmethod
+    def get_position_filter(due_date, pk):
+        """
+        Condition selecting the tasks that follow the (due_date, id) position
+        in the pagination order.
+        """
+
+        if due_date is None:
+            return Q(due_date__isnull=True, id__lt=pk) | Q(
+                due_date__isnull=False)
+
+        return Q(due_date__lt=due_date) | Q(due_date=due_date, id__lt=pk)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        # The page holds tasks or their values() rows
+        last = self.page[-1]
+        if isinstance(last, dict):
+            due_date, pk = last['due_date'], last['id']
+        else:
+            due_date, pk = last.due_date, last.id
+
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param,
+                                   self.encode_cursor(due_date, pk))
+
+    @staticmethod
+    def encode_cursor(due_date, pk):
+        position = f"{due_date.isoformat() if due_date else ''}|{pk}"
+        return b64encode(position.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            position, pk = b64decode(encoded.encode('ascii')).decode(
+                'ascii').split('|')
+            due_date = parse_date(position) if position else None
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if position and due_date is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return due_date, pk
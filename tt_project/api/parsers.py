@@ -0,0 +1,26 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSON parser decoding UTF-8 with orjson if it is installed,
+    and with the standard json module like JSONParser otherwise.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding',
+                                              settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -13,4 +13,5 @@ class CanChangeTask(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
 
-        return obj.creator == request.user or obj.performer == request.user
+        return request.user.is_authenticated and request.user.id in (
+            obj.creator_id, obj.performer_id)
@@ -0,0 +1,205 @@
+"""
+On-demand profiling of single requests.
+
+A request is profiled when a staff user sends the X-Profile header, or
+when it is picked by the PROFILING_SAMPLE_RATE share of all requests.
+A profiled request runs under cProfile and every SQL statement is
+recorded with its duration and the line of the project that made it.
+The profile is saved to PROFILING_ROOT and can be downloaded by staff
+users from /api/profiles/<id>/ (see ProfileView). Responses of requests
+profiled on demand carry its id in the X-Profile-Id header and a summary
+in the Server-Timing header.
+"""
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import exceptions
+from contextlib import ExitStack
+from . import metrics
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import time
+import uuid
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+# Only the first statements of a request are kept
+MAX_STATEMENTS = 1000
+
+# Frames of the libraries and the execute wrappers are skipped
+# when looking for the call site of a statement
+IGNORED_PATHS = ('site-packages', os.path.abspath(__file__),
+                 os.path.abspath(metrics.__file__))
+
+
+def profile_path(profile_id, extension):
+    return os.path.join(settings.PROFILING_ROOT, f'{profile_id}.{extension}')
+
+
+def staff_requested(request):
+    """
+    Checks whether the request asks for a profile and comes from a staff
+    user, logged in with a session or with an authorization token.
+    """
+
+    if not request.META.get(PROFILE_HEADER):
+        return False
+
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        from .authentication import CachedTokenAuthentication
+
+        try:
+            user, _ = CachedTokenAuthentication().authenticate(request) or \
+                (None, None)
+        except exceptions.AuthenticationFailed:
+            return False
+
+    return user is not None and user.is_staff
+
+
+def call_site():
+    """
+    Returns the innermost line of the project code on the current stack.
+    """
+
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(settings.BASE_DIR) and not any(
+                path in filename for path in IGNORED_PATHS):
+            return (f'{os.path.relpath(filename, settings.BASE_DIR)}:'
+                    f'{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+
+    return None
+
+
+class StatementRecorder:
+    """
+    Database execute wrapper recording the statements of a request
+    with their durations and call sites.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if len(self.statements) < MAX_STATEMENTS:
+                self.statements.append({
+                    'sql': sql,
+                    'many': many,
+                    'duration_ms': round(duration * 1000, 3),
+                    'call_site': call_site(),
+                })
+
+
+def cumulative_time(stats, module, function):
+    """
+    Returns the time spent in a function and the functions it called.
+    """
+
+    return sum(value[3] for (filename, _, name), value in
+               stats.stats.items()
+               if name == function and filename.endswith(module))
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests of staff users with the X-Profile header and
+    a sample of all requests. Other requests cost a header lookup
+    and, with sampling on, a random number.
+    Streaming responses are profiled until their first byte.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        on_demand = staff_requested(request)
+        rate = settings.PROFILING_SAMPLE_RATE
+        if not on_demand and not (rate and random.random() < rate):
+            return self.get_response(request)
+
+        recorder = StatementRecorder()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        total = time.perf_counter() - started
+
+        profile_id = uuid.uuid4()
+        stats = pstats.Stats(profiler)
+        render = cumulative_time(stats, os.path.join('rest_framework',
+                                                     'response.py'),
+                                 'rendered_content')
+        python = max(total - recorder.duration - render, 0)
+        summary = {
+            'id': str(profile_id),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'on_demand': on_demand,
+            'created_at': time.time(),
+            'total_ms': round(total * 1000, 3),
+            'sql_ms': round(recorder.duration * 1000, 3),
+            'render_ms': round(render * 1000, 3),
+            'python_ms': round(python * 1000, 3),
+            'queries': recorder.count,
+            'statements': recorder.statements,
+        }
+        save_profile(profile_id, stats, summary)
+
+        if on_demand:
+            response['X-Profile-Id'] = str(profile_id)
+            response['Server-Timing'] = (
+                f'total;dur={summary["total_ms"]}, '
+                f'sql;dur={summary["sql_ms"]};desc="{recorder.count} '
+                f'queries", render;dur={summary["render_ms"]}, '
+                f'python;dur={summary["python_ms"]}')
+
+        return response
+
+
+def save_profile(profile_id, stats, summary):
+    """
+    Saves the pstats file and the summary with the SQL statements,
+    keeping only the PROFILING_MAX_FILES newest profiles.
+    """
+
+    os.makedirs(settings.PROFILING_ROOT, exist_ok=True)
+    stats.dump_stats(profile_path(profile_id, 'prof'))
+    with open(profile_path(profile_id, 'json'), 'w') as file:
+        json.dump(summary, file)
+
+    summaries = sorted(
+        (entry for entry in os.scandir(settings.PROFILING_ROOT)
+         if entry.name.endswith('.json')),
+        key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in summaries[settings.PROFILING_MAX_FILES:]:
+        old_id = entry.name[:-len('.json')]
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(profile_path(old_id, extension))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,109 @@
+"""
+Deadline reminders of the tasks that are due soon or overdue.
+
+Only tasks that are not completed are reminded, found with range scans of
+the partial (due_date, id) index of open tasks. Tasks can only be given
+a due date from today on, so a task becomes overdue when its due date has
+passed and the sweep looks back only REMINDER_OVERDUE_DAYS days. Every
+reminder is recorded in TaskReminder, and the tasks already reminded
+about their current due date are skipped by the query itself, so a run
+only goes through the tasks it has to remind.
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from .cache import KEY_PREFIX
+from .models import Task, TaskReminder, OPEN_TASK_STATUSES
+from .outbox import enqueue_notifications
+import datetime
+
+
+SWEEP_LOCK = f'{KEY_PREFIX}:lock:reminders'
+SWEEP_LOCK_TIMEOUT = 30 * 60
+
+REMINDER_TITLES = {
+    's': 'The task is due soon',
+    'o': 'The task is overdue',
+}
+
+
+def reminder_candidates(kind, first_date, last_date):
+    """
+    Returns the open tasks with a performer due from first_date to last_date
+    that have not been reminded of this kind for their due date,
+    in (due_date, id) order.
+    """
+
+    reminded = TaskReminder.objects.filter(
+        task=OuterRef('pk'), kind=kind, due_date=OuterRef('due_date'))
+    return Task.objects.filter(
+        status__in=OPEN_TASK_STATUSES, due_date__gte=first_date,
+        due_date__lte=last_date, performer__isnull=False).filter(
+        ~Exists(reminded)).order_by('due_date', 'id')
+
+
+def unreminded_tasks(kind, first_date, last_date, chunk_size):
+    """
+    Yields lists of {'id', 'due_date'} of the reminder candidates,
+    chunk_size at a time in keyset order.
+    """
+
+    queryset = reminder_candidates(kind, first_date, last_date).values(
+        'id', 'due_date')
+
+    position = Q()
+    while True:
+        chunk = list(queryset.filter(position)[:chunk_size])
+        if not chunk:
+            return
+
+        yield chunk
+
+        # The plain bound lets the index scan start at the last due date
+        due_date, pk = chunk[-1]['due_date'], chunk[-1]['id']
+        position = Q(due_date__gte=due_date) & (
+            Q(due_date__gt=due_date) | Q(id__gt=pk))
+
+
+def remind_tasks(kind, first_date, last_date, chunk_size):
+    """
+    Records the reminders of one kind and writes their notifications
+    into the outbox, one transaction per chunk of tasks.
+    Returns the number of reminded tasks.
+    """
+
+    reminded = 0
+    for chunk in unreminded_tasks(kind, first_date, last_date, chunk_size):
+        with transaction.atomic():
+            TaskReminder.objects.bulk_create([
+                TaskReminder(task_id=row['id'], kind=kind,
+                             due_date=row['due_date'])
+                for row in chunk])
+            enqueue_notifications([
+                {'task_id': row['id'], 'title': REMINDER_TITLES[kind]}
+                for row in chunk])
+        reminded += len(chunk)
+
+    return reminded
+
+
+def send_deadline_reminders(days_ahead, overdue_days, chunk_size, today=None):
+    """
+    Reminds about the open tasks due in the next days_ahead days and the
+    ones that became overdue in the last overdue_days days.
+    Only one sweep runs at a time. Returns the number of reminded tasks.
+    """
+
+    if not cache.add(SWEEP_LOCK, 1, timeout=SWEEP_LOCK_TIMEOUT):
+        return 0
+
+    today = today or datetime.date.today()
+    try:
+        return remind_tasks(
+            's', today, today + datetime.timedelta(days=days_ahead),
+            chunk_size) + remind_tasks(
+            'o', today - datetime.timedelta(days=overdue_days),
+            today - datetime.timedelta(days=1), chunk_size)
+    finally:
+        cache.delete(SWEEP_LOCK)
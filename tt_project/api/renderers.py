@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class DateFormatJSONEncoder(encoders.JSONEncoder):
+    """
+    JSON encoder writing the dates and times that were not formatted by
+    a serializer field in the DATE_FORMAT and DATETIME_FORMAT of the API,
+    like the serializer fields do.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, datetime.datetime):
+            output_format = api_settings.DATETIME_FORMAT
+            if output_format and output_format.lower() != 'iso-8601':
+                if settings.USE_TZ and timezone.is_aware(obj):
+                    obj = timezone.localtime(obj)
+                return obj.strftime(output_format)
+        elif isinstance(obj, datetime.date):
+            output_format = api_settings.DATE_FORMAT
+            if output_format and output_format.lower() != 'iso-8601':
+                return obj.strftime(output_format)
+
+        return super().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer encoding with orjson if it is installed, and with the
+    standard json module like JSONRenderer otherwise, with the same output.
+    Indented output (the browsable API) always uses the standard module.
+    """
+
+    encoder_class = DateFormatJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(
+                accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        content = orjson.dumps(data, default=self.encoder_class().default,
+                               option=option)
+        # U+2028 and U+2029 are escaped by JSONRenderer for JavaScript.
+        # Their first byte is rare, and looking for one byte is much faster.
+        if b'\xe2' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029')
+
+        return content
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Renders the task change feed as Server-Sent Events.
+    Every response carries one batch of changes and ends with the feed
+    cursor as the event id; the browser reconnects after 'retry'
+    milliseconds sending it in the Last-Event-ID header, so the stream
+    is a chain of long-poll requests instead of one endless response.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+    retry = 500
+
+    def dumps(self, data):
+        return json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        events = [f'retry: {self.retry}']
+        if 'changes' in data:
+            events += [f'event: change\ndata: {self.dumps(change)}'
+                       for change in data['changes']]
+            events.append(f'id: {data["cursor"]}')
+        else:
+            events.append(f'event: error\ndata: {self.dumps(data)}')
+
+        return ''.join(f'{event}\n\n' for event in events).encode()
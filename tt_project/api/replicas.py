@@ -0,0 +1,175 @@
+"""
+Routing of the database reads to the read replicas.
+
+Writes always go to the primary database. Safe-method requests read
+from a replica picked at random from DATABASE_REPLICAS, unless the client
+(its authorization header or session) has made a write request within
+the last REPLICA_STICKY_SECONDS seconds: such a client keeps reading from
+the primary, so it sees its own changes while the replicas catch up.
+Celery tasks read from the primary unless they choose a database with
+the read_database task option or the read_database message header
+(an alias, or REPLICA for any replica).
+
+Some reads stay on the primary wherever they are made: the reads inside
+a transaction on the primary, the tokens and sessions (a new token must
+work at once), the cached responses (see api/cache.py), which are
+shared by all clients and must not keep a stale replica read, and the
+change feed, whose cursors must not move past the entries a replica
+has not received yet.
+"""
+
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+from contextlib import contextmanager
+from contextvars import ContextVar
+from .metrics import request_header
+import hashlib
+import random
+
+
+PRIMARY = 'default'
+
+# Any of the replicas, or the primary if there are none
+REPLICA = 'replica'
+
+READ_DATABASE_HEADER = 'read_database'
+
+# Apps whose reads must see the latest writes
+PRIMARY_APPS = ('authtoken', 'sessions')
+
+# Database the reads of the current request or task are sent to
+read_alias = ContextVar('read_alias', default=None)
+
+
+def resolve(alias):
+    if alias == REPLICA:
+        return random.choice(settings.DATABASE_REPLICAS) \
+            if settings.DATABASE_REPLICAS else PRIMARY
+
+    return alias
+
+
+@contextmanager
+def read_database(alias):
+    """
+    Sends the reads made in the block to the alias database,
+    or to one of the replicas for REPLICA.
+    """
+
+    token = read_alias.set(resolve(alias))
+    try:
+        yield
+    finally:
+        read_alias.reset(token)
+
+
+def read_from(alias, iterable):
+    """
+    Iterates over the iterable with its reads sent to the alias database,
+    for the content of streaming responses.
+    """
+
+    with read_database(alias):
+        yield from iterable
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads to the database chosen for the
+    current request or task and all writes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_alias.get()
+        if alias is None or alias == PRIMARY or \
+                model._meta.app_label in PRIMARY_APPS or \
+                connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        return True
+
+
+def client_key(request):
+    """
+    Returns the key of the client that made the request: a hash of its
+    authorization header or its session key, or None if it has neither.
+    """
+
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        return hashlib.md5(authorization.encode()).hexdigest()
+
+    session = getattr(request, 'session', None)
+    return session.session_key if session is not None else None
+
+
+def sticky_key(client):
+    from .cache import KEY_PREFIX
+
+    return f'{KEY_PREFIX}:primary:{client}'
+
+
+class ReplicaMiddleware:
+    """
+    Sends the reads of safe-method requests to a replica, except for the
+    clients that have recently written, which stay on the primary.
+    Does nothing when no replicas are configured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            # Logging in gives the client a new session key
+            client = client_key(request)
+            if client is not None:
+                cache.set(sticky_key(client), 1,
+                          timeout=settings.REPLICA_STICKY_SECONDS)
+            return response
+
+        client = client_key(request)
+        if client is not None and cache.get(sticky_key(client)):
+            return self.get_response(request)
+
+        alias = resolve(REPLICA)
+        with read_database(alias):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = read_from(
+                alias, response.streaming_content)
+
+        return response
+
+
+# Read database tokens of the tasks running in this worker process
+task_reads = {}
+
+
+@task_prerun.connect
+def route_task_reads(task_id=None, task=None, **kwargs):
+    alias = request_header(task.request, READ_DATABASE_HEADER) or \
+        getattr(task, 'read_database', None)
+    if alias is not None:
+        task_reads[task_id] = read_alias.set(resolve(alias))
+
+
+@task_postrun.connect
+def restore_task_reads(task_id=None, **kwargs):
+    token = task_reads.pop(task_id, None)
+    if token is not None:
+        read_alias.reset(token)
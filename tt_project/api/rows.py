@@ -0,0 +1,76 @@
+from django.utils import timezone
+from rest_framework.reverse import reverse
+from .serializers import (TaskListSerializer, UserSerializer,
+                          LAST_COMMENT_FORMAT, EXPANDABLE_FIELDS)
+
+
+class TaskRows:
+    """
+    Builds the rows of the task list from values() instead of
+    TaskListSerializer, with the same output for the same tasks.
+    The conversion of every requested field is looked up once,
+    so a row costs one call per field instead of the serializer
+    field machinery (to_representation, get_attribute, nested serializers).
+    Fields are restricted by 'fields' and the nested users not named
+    in 'expand' are given as their ids (None means all of them).
+    """
+
+    def __init__(self, request, fields=None, expand=None):
+        self.fields = [field for field in TaskListSerializer.Meta.fields
+                       if fields is None or field in fields]
+        self.expand = EXPANDABLE_FIELDS if expand is None else \
+            EXPANDABLE_FIELDS & set(expand)
+        # The id is always fetched for the url, the due date for the cursor
+        self.columns = ['id', 'due_date']
+
+        url = reverse('task-detail', kwargs={'pk': 0}, request=request)
+        self.url_head, self.url_tail = url.rsplit('0', 1)
+
+        self.converters = []
+        for field in self.fields:
+            converter = getattr(self, f'convert_{field}', None)
+            self.converters.append((field, converter() if converter
+                                    else self.get_column(field)))
+
+    def get_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+
+        return lambda row: row[column]
+
+    def get_user(self, field):
+        if field not in self.expand:
+            return self.get_column(field)
+
+        columns = [f'{field}__{name}' for name in UserSerializer.Meta.fields]
+        for column in columns:
+            self.get_column(column)
+        names = list(zip(UserSerializer.Meta.fields, columns))
+        id_column = columns[0]
+
+        return lambda row: None if row[id_column] is None else {
+            name: row[column] for name, column in names}
+
+    def convert_url(self):
+        return lambda row: f'{self.url_head}{row["id"]}{self.url_tail}'
+
+    def convert_due_date(self):
+        return lambda row: row['due_date'] and row['due_date'].isoformat()
+
+    def convert_creator(self):
+        return self.get_user('creator')
+
+    def convert_performer(self):
+        return self.get_user('performer')
+
+    def convert_last_comment_at(self):
+        self.get_column('last_comment_at')
+        return lambda row: row['last_comment_at'] and timezone.localtime(
+            row['last_comment_at']).strftime(LAST_COMMENT_FORMAT)
+
+    def values(self, queryset):
+        return queryset.values(*self.columns)
+
+    def build(self, rows):
+        return [{field: convert(row) for field, convert in self.converters}
+                for row in rows]
@@ -1,9 +1,42 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Task, Comment
+from .models import (Task, Comment, TaskChange, ArchivedTask,
+                     ArchivedComment)
+from .identity import get_identity_map
 import datetime
 
 
+LAST_COMMENT_FORMAT = '%d.%m.%Y %H:%M'
+
+# Task fields with nested users, which can be given as user ids instead
+EXPANDABLE_FIELDS = frozenset(['creator', 'performer'])
+
+
+def sparse_fieldset(request):
+    """
+    Returns the task fields requested with ?fields= and the nested users
+    requested with ?expand=, each as a set or None if not restricted.
+    """
+
+    def names(parameter):
+        value = request.query_params.get(parameter)
+        return None if value is None else {
+            name.strip() for name in value.split(',') if name.strip()}
+
+    return names('fields'), names('expand')
+
+
+class IdentityMapMixin:
+    """
+    Resolves validated objects through the identity map of the request
+    from the serializer context, so that views can reuse them.
+    """
+
+    @property
+    def identity_map(self):
+        return get_identity_map(self.context.get('request'))
+
+
 class RegistrationSerializer(serializers.Serializer):
     """
     Serializes the data for registering a new user.
@@ -36,7 +69,7 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField()
 
 
-class TaskCreationSerializer(serializers.Serializer):
+class TaskCreationSerializer(IdentityMapMixin, serializers.Serializer):
     """
     Serializes the data for creation a new task.
     Conducts object- and field-level validation.
@@ -48,7 +81,7 @@ class TaskCreationSerializer(serializers.Serializer):
     performer = serializers.CharField()
 
     def validate_performer(self, value):
-        if not User.objects.filter(username=value).exists():
+        if self.identity_map.get(User, username=value) is None:
             raise serializers.ValidationError(
                 'there is no user with that username')
 
@@ -77,7 +110,7 @@ class TaskCreationSerializer(serializers.Serializer):
         return values
 
 
-class TaskUpdateSerializer(serializers.Serializer):
+class TaskUpdateSerializer(IdentityMapMixin, serializers.Serializer):
     """
     Serializes the data to update an existing task.
     Conducts object- and field-level validation.
@@ -91,13 +124,13 @@ class TaskUpdateSerializer(serializers.Serializer):
     status = serializers.ChoiceField(choices=Task.TASK_STATUS)
 
     def validate_task_id(self, value):
-        if not Task.objects.filter(id=value).exists():
+        if self.identity_map.get(Task, id=value) is None:
             raise serializers.ValidationError('Task not found')
 
         return value
 
     def validate_performer(self, value):
-        if not User.objects.filter(username=value).exists():
+        if self.identity_map.get(User, username=value) is None:
             raise serializers.ValidationError(
                 'there is no user with that username')
 
@@ -119,7 +152,30 @@ class TaskUpdateSerializer(serializers.Serializer):
         return values
 
 
-class CommentAddingSerializer(serializers.Serializer):
+class TaskBulkItemSerializer(serializers.Serializer):
+    """
+    Serializes one item of a bulk task creation or update.
+    Items with an id update the existing task, the others create a new one.
+    Conducts field-level validation only: the names and performers
+    of all items are checked together with one query each.
+    """
+
+    id = serializers.IntegerField(required=False)
+    name = serializers.CharField(max_length=200)
+    specification = serializers.CharField()
+    due_date = serializers.DateField()
+    performer = serializers.CharField()
+    status = serializers.ChoiceField(choices=Task.TASK_STATUS, required=False)
+
+    def validate(self, values):
+        if values['due_date'] < datetime.date.today():
+            raise serializers.ValidationError(
+                "due date cannot be earlier than today's date")
+
+        return values
+
+
+class CommentAddingSerializer(IdentityMapMixin, serializers.Serializer):
     """
     Serializes the data for adding a comment to a task.
     Conducts field-level validation.
@@ -129,12 +185,25 @@ class CommentAddingSerializer(serializers.Serializer):
     description = serializers.CharField()
 
     def validate_task_name(self, value):
-        if not Task.objects.filter(name=value).exists():
+        if self.identity_map.get(Task, name=value) is None:
             raise serializers.ValidationError('there is no task with that name')
 
         return value
 
 
+class ExportSerializer(serializers.Serializer):
+    """
+    Serializes the options of a tasks or comments export.
+    Tasks are filtered by due date and comments by posting date (since).
+    """
+
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'],
+                                     default='ndjson')
+    since = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Task.TASK_STATUS, required=False)
+    performer = serializers.CharField(required=False)
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Serializes data to display a User model information.
@@ -202,9 +271,61 @@ class TaskListSerializer(TaskSerializer):
 
     creator = UserSerializer(read_only=True)
     performer = UserSerializer()
+    last_comment_at = serializers.DateTimeField(format=LAST_COMMENT_FORMAT,
+                                                read_only=True)
+
+    class Meta(TaskSerializer.Meta):
+        fields = TaskSerializer.Meta.fields + ['comment_count',
+                                               'last_comment_at']
+
+
+class TaskChangeSerializer(serializers.ModelSerializer):
+    """
+    Serializes an entry of the task change feed together with the current
+    state of its task, which is None once the task has been deleted.
+    The tasks are passed in the 'tasks' context as a dict by id,
+    next to the request needed for their urls. The id of an entry
+    is its position in the feed, which the feed cursors refer to.
+    """
+
+    id = serializers.IntegerField(source='position', read_only=True)
+    task = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TaskChange
+        fields = ['id', 'task_id', 'comment_id', 'action', 'task']
+
+    def get_task(self, obj):
+        task = self.context['tasks'].get(obj.task_id)
+        return TaskListSerializer(task, context=self.context).data \
+            if task is not None else None
 
 
-class TaskDetailSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Drops the fields not requested with ?fields= and gives the nested users
+    not requested with ?expand= as their ids.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        request = self.context.get('request')
+        if request is None:
+            return
+
+        fields, expand = sparse_fieldset(request)
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+        if expand is not None:
+            for name in EXPANDABLE_FIELDS - expand:
+                if name in self.fields:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(
+                        read_only=True)
+
+
+class TaskDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializes data to display detailed information about a Task model.
     """
@@ -212,9 +333,57 @@ class TaskDetailSerializer(serializers.ModelSerializer):
     task_comments = CommentDetailSerializer(many=True, read_only=True)
     creator = UserSerializer(read_only=True)
     performer = UserSerializer()
+    last_comment_at = serializers.DateTimeField(format=LAST_COMMENT_FORMAT,
+                                                read_only=True)
 
     class Meta:
         model = Task
         fields = ['id', 'name', 'specification', 'due_date', 'creator',
-                  'performer', 'status', 'task_comments']
+                  'performer', 'status', 'comment_count', 'last_comment_at',
+                  'task_comments']
         read_only_fields = ['creator']
+
+
+class ArchivedCommentSerializer(serializers.ModelSerializer):
+    """
+    Serializes data to display a comment of an archived task.
+    """
+
+    author = UserSerializer(read_only=True)
+    post_date = serializers.DateTimeField(format='%d.%m.%Y %H:%M',
+                                          read_only=True)
+
+    class Meta:
+        model = ArchivedComment
+        fields = ['description', 'author', 'post_date']
+
+
+class ArchivedTaskListSerializer(serializers.ModelSerializer):
+    """
+    Serializes data to display a list of archived tasks.
+    """
+
+    creator = UserSerializer(read_only=True)
+    performer = UserSerializer(read_only=True)
+    last_comment_at = serializers.DateTimeField(format=LAST_COMMENT_FORMAT,
+                                                read_only=True)
+    archived_at = serializers.DateTimeField(format=LAST_COMMENT_FORMAT,
+                                            read_only=True)
+
+    class Meta:
+        model = ArchivedTask
+        fields = ['url', 'id', 'name', 'specification', 'due_date', 'creator',
+                  'performer', 'status', 'comment_count', 'last_comment_at',
+                  'archived_at']
+
+
+class ArchivedTaskDetailSerializer(ArchivedTaskListSerializer):
+    """
+    Serializes data to display an archived task with its comments.
+    """
+
+    task_comments = ArchivedCommentSerializer(many=True, read_only=True)
+
+    class Meta(ArchivedTaskListSerializer.Meta):
+        fields = ArchivedTaskListSerializer.Meta.fields[1:] + [
+            'task_comments']
@@ -0,0 +1,140 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from contextvars import ContextVar
+from rest_framework.authtoken.models import Token
+from .authentication import token_cache_key
+from .changes import log_changes
+from .counters import comment_saved, comment_deleted
+from .models import Task, Comment
+from .cache import bump_generation, invalidate_tasks, USERS_GENERATION
+
+
+# Tasks being deleted: their comments are deleted with them, and the
+# deletion of the task already updates the change log and the cache
+deleting_tasks = ContextVar('deleting_tasks', default=frozenset())
+
+
+def cascaded(comment):
+    return comment.task_id in deleting_tasks.get()
+
+
+@receiver(pre_delete, sender=Task)
+def mark_deleting_task(sender, instance, **kwargs):
+    deleting_tasks.set(deleting_tasks.get() | {instance.pk})
+
+
+@receiver(post_delete, sender=Task)
+def unmark_deleted_task(sender, instance, **kwargs):
+    deleting_tasks.set(deleting_tasks.get() - {instance.pk})
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task_cache(sender, instance, **kwargs):
+    """
+    Signal to invalidate the cached task list and details of the task
+    once the transaction that changed the task is committed.
+    """
+
+    invalidate_tasks([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created=False, **kwargs):
+    """
+    Signal to update the comment counters of the commented task.
+    """
+
+    comment_saved(instance, created)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if not cascaded(instance):
+        comment_deleted(instance)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_cache(sender, instance, **kwargs):
+    """
+    Signal to invalidate the cached task list, which shows the comment
+    counters, and the cached details of the commented task.
+    """
+
+    if not cascaded(instance):
+        invalidate_tasks([instance.task_id])
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Comment)
+def log_save(sender, instance, created=False, **kwargs):
+    """
+    Signal to write the creation or update of a task or comment
+    into the change log.
+    """
+
+    action = 'c' if created else 'u'
+    if sender is Task:
+        log_changes([(instance.pk, None, action)])
+    else:
+        log_changes([(instance.task_id, instance.pk, action)])
+
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Comment)
+def log_delete(sender, instance, **kwargs):
+    """
+    Signal to write a tombstone of a deleted task or comment
+    into the change log.
+    """
+
+    if sender is Task:
+        log_changes([(instance.pk, None, 'd')])
+    elif not cascaded(instance):
+        log_changes([(instance.task_id, instance.pk, 'd')])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, update_fields=None, **kwargs):
+    """
+    Signal to invalidate the cached responses that embed user data.
+    Logins only update 'last_login', which is never displayed.
+    """
+
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+
+    transaction.on_commit(lambda: bump_generation(USERS_GENERATION))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token_cache(sender, instance, **kwargs):
+    """
+    Signal to drop the cached token, including the tokens created
+    for new users by the create_auth_token signal.
+    """
+
+    transaction.on_commit(lambda: cache.delete(token_cache_key(instance.key)))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_token_cache(sender, instance, update_fields=None,
+                                **kwargs):
+    """
+    Signal to drop the cached token of a changed user, so that
+    deactivated users are rejected immediately.
+    Deleted users lose their tokens through the Token signals.
+    """
+
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+
+    keys = [token_cache_key(key) for key in Token.objects.filter(
+        user=instance).values_list('key', flat=True)]
+    transaction.on_commit(lambda: cache.delete_many(keys))
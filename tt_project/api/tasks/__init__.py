@@ -1 +1,7 @@
-from .emails import basic_email_sender, comment_email_sender
+from .emails import (basic_email_sender, comment_email_sender,
+                     bulk_email_sender)
+from .outbox import notification_relay, relay_notifications
+from .changes import task_change_pruner
+from .results import task_result_pruner
+from .reminders import deadline_reminder_sender
+from .archive import task_archiver
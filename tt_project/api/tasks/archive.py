@@ -0,0 +1,10 @@
+from __future__ import absolute_import, unicode_literals
+from celery import shared_task
+from django.conf import settings
+from api.archive import archive_tasks
+
+
+@shared_task(name='tasktable.archive_tasks', ignore_result=True)
+def task_archiver():
+    archive_tasks(settings.TASK_ARCHIVE_AFTER_DAYS,
+                  settings.TASK_ARCHIVE_BATCH_SIZE)
@@ -0,0 +1,9 @@
+from __future__ import absolute_import, unicode_literals
+from celery import shared_task
+from django.conf import settings
+from api.changes import prune_changes
+
+
+@shared_task(name='tasktable.prune_task_changes', ignore_result=True)
+def task_change_pruner():
+    prune_changes(settings.TASK_CHANGES_RETENTION_DAYS)
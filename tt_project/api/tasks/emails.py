@@ -1,7 +1,9 @@
 from __future__ import absolute_import, unicode_literals
 from celery import shared_task
 from api.models import Task, Comment
-from django.core.mail import send_mail
+from django.conf import settings
+from django.core.mail import EmailMessage
+from .mailer import mailer, SendError
 import logging
 import smtplib
 
@@ -16,21 +18,100 @@ and also check the correctness of the entered Email Address and Password in the
 A retry to send the email will occur in 5 minutes.'''
 
 
+def username(user):
+    # Creators, performers and authors are set to null when deleted
+    return user.username if user is not None else '-'
+
+
+def recipients(task):
+    return [user.email for user in (task.creator, task.performer)
+            if user is not None and user.email]
+
+
+def task_email_body(task):
+    return 'Task name: ' + task.name + '\n' \
+           + 'Specification: ' + task.specification + '\n' \
+           + 'Due date: ' + str(task.due_date) + '\n' \
+           + 'Creator: ' + username(task.creator) + '\n' \
+           + 'Performer: ' + username(task.performer) + '\n' \
+           + 'Status: ' + task.status
+
+
+def task_email(task, title):
+    """
+    Returns the email about the task, or None if it has nobody to send to.
+    """
+
+    to = recipients(task)
+    if not to:
+        return None
+
+    return EmailMessage(title, task_email_body(task), 'EMAIL_HOST_USER', to)
+
+
+def comment_email(task, comment):
+    """
+    Returns the email about the comment, or None if it has nobody to send to.
+    """
+
+    to = recipients(task)
+    if not to:
+        return None
+
+    post_date = comment.post_date.strftime('%Y-%m-%d %H:%M')
+    title = 'A new comment has been added to the task'
+    body = (f'{task_email_body(task)}\n\n'
+            f'New comment: {comment.description}\n'
+            f'Author: {username(comment.author)}\n'
+            f'Posting date: {post_date}')
+
+    return EmailMessage(title, body, 'EMAIL_HOST_USER', to)
+
+
+def notification_emails(notifications):
+    """
+    Builds the emails of {'task_id', 'title'} and {'task_id', 'comment_id'}
+    notifications, loading their tasks and comments with one query each.
+    Notifications of deleted tasks and comments, and of tasks whose creator
+    and performer are both deleted or have no email, are skipped.
+    Returns (position, email) pairs, the position being the index
+    of the notification in the list.
+    """
+
+    tasks = Task.objects.select_related('creator', 'performer').in_bulk(
+        {notification['task_id'] for notification in notifications})
+    comments = Comment.objects.select_related('author').in_bulk(
+        {notification['comment_id'] for notification in notifications
+         if 'comment_id' in notification})
+
+    messages = []
+    for position, notification in enumerate(notifications):
+        task = tasks.get(notification['task_id'])
+        if task is None:
+            continue
+        if 'comment_id' not in notification:
+            message = task_email(task, notification['title'])
+        elif notification['comment_id'] in comments:
+            message = comment_email(
+                task, comments[notification['comment_id']])
+        else:
+            continue
+        if message is not None:
+            messages.append((position, message))
+
+    return messages
+
+
 @shared_task(name='tasktable.send_basic_email', ignore_result=True,
              bind=True, time_limit=TIME_LIMIT, max_retries=MAX_RETRIES,
              default_retry_delay=DEFAULT_RETRY_DELAY)
 def basic_email_sender(self, task_id: int, title: str):
-    task = Task.objects.get(id=task_id)
-    body = 'Task name: ' + task.name + '\n' \
-           + 'Specification: ' + task.specification + '\n' \
-           + 'Due date: ' + str(task.due_date) + '\n' \
-           + 'Creator: ' + task.creator.username + '\n' \
-           + 'Performer: ' + task.performer.username + '\n' \
-           + 'Status: ' + task.status
-    recipients = [task.creator.email, task.performer.email]
+    task = Task.objects.select_related('creator', 'performer').get(id=task_id)
+    message = task_email(task, title)
+    if message is None:
+        return
     try:
-        send_mail(title, body, 'EMAIL_HOST_USER',
-                  recipients, fail_silently=False)
+        mailer.send_messages([message])
     except smtplib.SMTPException as exc:
         logging.warning(WARNING_MESSAGE)
         self.retry(exc=exc)
@@ -40,23 +121,37 @@ def basic_email_sender(self, task_id: int, title: str):
              bind=True, time_limit=TIME_LIMIT, max_retries=MAX_RETRIES,
              default_retry_delay=DEFAULT_RETRY_DELAY)
 def comment_email_sender(self, task_id: int, comment_id: int):
-    task = Task.objects.get(id=task_id)
-    comment = Comment.objects.get(id=comment_id)
-    post_date = comment.post_date.strftime('%Y-%m-%d %H:%M')
-    title = 'A new comment has been added to the task'
-    body = 'Task name: ' + task.name + '\n' \
-           + 'Specification: ' + task.specification + '\n' \
-           + 'Due date: ' + str(task.due_date) + '\n' \
-           + 'Creator: ' + task.creator.username + '\n' \
-           + 'Performer: ' + task.performer.username + '\n' \
-           + 'Status: ' + task.status + '\n\n' \
-           + 'New comment: ' + comment.description + '\n' \
-           + 'Author: ' + comment.author.username + '\n' \
-           + 'Posting date: ' + post_date
-    recipients = [task.creator.email, task.performer.email]
+    task = Task.objects.select_related('creator', 'performer').get(id=task_id)
+    comment = Comment.objects.select_related('author').get(id=comment_id)
+    message = comment_email(task, comment)
+    if message is None:
+        return
     try:
-        send_mail(title, body, 'EMAIL_HOST_USER',
-                  recipients, fail_silently=False)
+        mailer.send_messages([message])
     except smtplib.SMTPException as exc:
         logging.warning(WARNING_MESSAGE)
         self.retry(exc=exc)
+
+
+@shared_task(name='tasktable.send_bulk_email', ignore_result=True,
+             bind=True, time_limit=TIME_LIMIT * 10, max_retries=MAX_RETRIES,
+             default_retry_delay=DEFAULT_RETRY_DELAY)
+def bulk_email_sender(self, notifications: list):
+    """
+    Sends the emails of a batch of notifications in groups of
+    EMAIL_BATCH_SIZE through the pooled SMTP connection.
+    A retry resumes after the last email that was delivered.
+    """
+
+    batch_size = settings.EMAIL_BATCH_SIZE
+    for start in range(0, len(notifications), batch_size):
+        group = notifications[start:start + batch_size]
+        emails = notification_emails(group)
+        try:
+            mailer.send_messages([message for _, message in emails])
+        except SendError as exc:
+            logging.warning(WARNING_MESSAGE)
+            # The notifications up to the last delivered email are done
+            done = emails[exc.sent - 1][0] + 1 if exc.sent else 0
+            self.retry(exc=exc,
+                       kwargs={'notifications': notifications[start + done:]})
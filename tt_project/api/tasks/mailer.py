@@ -0,0 +1,96 @@
+from __future__ import absolute_import, unicode_literals
+from celery.signals import worker_process_shutdown
+from django.core.mail import get_connection
+import smtplib
+
+
+class SendError(smtplib.SMTPException):
+    """
+    Raised when a batch of messages fails, with the number
+    of its first messages that were delivered before the error.
+    """
+
+    def __init__(self, sent):
+        super().__init__(f'{sent} messages were sent before the error')
+        self.sent = sent
+
+
+class Delivery:
+    """
+    Hands the messages of a batch to the connection one by one,
+    counting them, so that a failed batch knows how far it got.
+    """
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.taken = 0
+
+    def __iter__(self):
+        for message in self.messages:
+            self.taken += 1
+            yield message
+
+    @property
+    def sent(self):
+        # The message being sent when the error was raised was not sent
+        return max(self.taken - 1, 0)
+
+
+class PooledMailer:
+    """
+    Keeps one SMTP connection of the worker process open between tasks,
+    so that messages do not pay for a new TLS handshake each.
+    A connection closed by the server is reopened once per batch.
+    """
+
+    def __init__(self):
+        self.connection = None
+
+    def get_connection(self):
+        if self.connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self.connection = connection
+
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+    def send_messages(self, messages):
+        """
+        Sends the messages with one call to the open connection.
+        Returns the number of messages sent, or raises SendError.
+        A dropped connection or a socket error reopens the connection once
+        and sends the remaining messages; other SMTP errors are not retried.
+        """
+
+        delivered = 0
+        for attempt in range(2):
+            delivery = Delivery(messages[delivered:])
+            try:
+                return delivered + self.get_connection().send_messages(
+                    delivery)
+            except smtplib.SMTPServerDisconnected as exc:
+                error = exc
+            except smtplib.SMTPException as exc:
+                raise SendError(delivered + delivery.sent) from exc
+            except OSError as exc:
+                error = exc
+            delivered += delivery.sent
+            self.close()
+
+        raise SendError(delivered) from error
+
+
+mailer = PooledMailer()
+
+
+@worker_process_shutdown.connect
+def close_mailer(**kwargs):
+    mailer.close()
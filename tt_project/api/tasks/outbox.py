@@ -0,0 +1,49 @@
+from __future__ import absolute_import, unicode_literals
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from api.models import Notification
+from .emails import bulk_email_sender
+
+
+def relay_notifications(batch_size, max_batches=None):
+    """
+    Publishes the pending outbox notifications to the broker as
+    bulk email jobs of batch_size notifications and deletes them,
+    until the outbox is empty or max_batches jobs have been published.
+    Batches are locked with SKIP LOCKED, so several relays can run at once.
+    Returns the number of relayed notifications.
+    """
+
+    relayed = batches = 0
+
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            batch = list(Notification.objects.select_for_update(
+                skip_locked=True).order_by('id').values(
+                'id', 'task_id', 'comment_id', 'title')[:batch_size])
+            if not batch:
+                break
+
+            notifications = [
+                {'task_id': row['task_id'], 'comment_id': row['comment_id']}
+                if row['comment_id'] is not None else
+                {'task_id': row['task_id'], 'title': row['title']}
+                for row in batch]
+            bulk_email_sender.apply_async(kwargs={
+                'notifications': notifications
+            })
+
+            Notification.objects.filter(
+                id__in=[row['id'] for row in batch]).delete()
+
+        relayed += len(batch)
+        batches += 1
+
+    return relayed
+
+
+@shared_task(name='tasktable.relay_notifications', ignore_result=True)
+def notification_relay():
+    relay_notifications(settings.NOTIFICATION_RELAY_BATCH_SIZE,
+                        settings.NOTIFICATION_RELAY_MAX_BATCHES)
@@ -0,0 +1,11 @@
+from __future__ import absolute_import, unicode_literals
+from celery import shared_task
+from django.conf import settings
+from api.reminders import send_deadline_reminders
+
+
+@shared_task(name='tasktable.send_deadline_reminders', ignore_result=True)
+def deadline_reminder_sender():
+    send_deadline_reminders(settings.REMINDER_DAYS_AHEAD,
+                            settings.REMINDER_OVERDUE_DAYS,
+                            settings.REMINDER_CHUNK_SIZE)
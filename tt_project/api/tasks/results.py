@@ -0,0 +1,34 @@
+from __future__ import absolute_import, unicode_literals
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+import datetime
+
+
+PRUNE_BATCH_SIZE = 5000
+
+
+def prune_task_results(retention_days, batch_size=PRUNE_BATCH_SIZE):
+    """
+    Deletes the Celery task results finished more than retention_days
+    days ago, batch_size rows at a time, so that the rows left by the
+    results stored before are removed without one long transaction.
+    Returns the number of deleted results.
+    """
+
+    stale = TaskResult.objects.filter(
+        date_done__lt=timezone.now() - datetime.timedelta(
+            days=retention_days))
+    deleted = 0
+
+    while True:
+        ids = list(stale.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += TaskResult.objects.filter(id__in=ids).delete()[0]
+
+
+@shared_task(name='tasktable.prune_task_results', ignore_result=True)
+def task_result_pruner():
+    prune_task_results(settings.CELERY_TASK_RESULTS_RETENTION_DAYS)
@@ -1,3 +1,1982 @@
-from django.test import TestCase
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.core.mail.backends import locmem
+from django.db import connection, connections, transaction, DatabaseError
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed, ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.request import Request
+from unittest import mock
+from asgiref.testing import ApplicationCommunicator
+from .authentication import CachedTokenAuthentication, token_cache_key
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .cache import cached_response, TASKS_GENERATION
+from .tasks import (basic_email_sender, bulk_email_sender,
+                    comment_email_sender, relay_notifications)
+from .tasks.mailer import mailer
+from .tasks.results import prune_task_results
+from tasktable.celery import app as celery_app
+from .models import (Task, Comment, Notification, TaskReminder, TaskChange,
+                     TaskChangeFloor, ArchivedTask, ArchivedComment)
+from .archive import archive_tasks
+from .bulk import task_names
+from .changes import prune_changes
+from .counters import comment_saved
+from .replicas import read_database, PRIMARY, REPLICA
+from .reminders import (reminder_candidates, send_deadline_reminders,
+                        SWEEP_LOCK)
+from .serializers import TaskListSerializer
+from .identity import IdentityMap
+from .views import TaskViewSet
+import asyncio
+import base64
+import csv
+import datetime
+import decimal
+import io
+import json
+import os
+import pstats
+import smtplib
+import tempfile
+import threading
+import time
+import uuid
 
-# Create your tests here.
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class QueryPlanTests(TestCase):
+    """
+    Checks with EXPLAIN that the hot task and comment queries
+    are served by the composite indexes instead of sequential scans.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='planner',
+                                            email='planner@example.com',
+                                            password='secretpasswd951')
+        cls.task = Task.objects.create(name='Query plan',
+                                       specification='Check the indexes',
+                                       due_date=datetime.date.today(),
+                                       creator=cls.user, performer=cls.user)
+        Comment.objects.create(task=cls.task, description='Indexed',
+                               author=cls.user)
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == 'postgresql':
+            # Test tables are tiny, so the planner has to be told
+            # that a sequential scan is not an option.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest(f'no query plan check for {connection.vendor}')
+
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_task_list_ordering(self):
+        queryset = Task.objects.order_by('-due_date', '-id')[:10]
+        self.assertUsesIndex(queryset, 'task_due_date_id_idx')
+
+    def test_task_list_keyset_page(self):
+        queryset = Task.objects.filter(
+            due_date__lt=datetime.date.today()).order_by('-due_date', '-id')
+        self.assertUsesIndex(queryset[:10], 'task_due_date_id_idx')
+
+    def test_admin_status_filter(self):
+        queryset = Task.objects.filter(
+            status='n', due_date__gte=datetime.date.today())
+        self.assertUsesIndex(queryset, 'task_status_due_date_idx')
+
+    def test_performer_tasks(self):
+        queryset = Task.objects.filter(performer=self.user).order_by(
+            'due_date')
+        self.assertUsesIndex(queryset, 'task_performer_due_date_idx')
+
+    def test_creator_tasks(self):
+        queryset = Task.objects.filter(creator=self.user).order_by(
+            'due_date')
+        self.assertUsesIndex(queryset, 'task_creator_due_date_idx')
+
+    def test_task_comments(self):
+        queryset = Comment.objects.filter(task__in=[self.task.id]).order_by(
+            '-post_date')
+        self.assertUsesIndex(queryset, 'comment_task_post_date_idx')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTests(TransactionTestCase):
+    """
+    Checks that the task list and task details are served from the cache
+    and invalidated by changes to tasks, comments and users.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader',
+                                             email='reader@example.com',
+                                             password='secretpasswd951')
+        self.task = Task.objects.create(name='Cached task',
+                                        specification='Read it twice',
+                                        due_date=datetime.date.today(),
+                                        creator=self.user,
+                                        performer=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.detail_url = f'/api/tasks/{self.task.id}/'
+
+    def test_list_is_cached(self):
+        self.client.get('/api/tasks/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tasks/')
+
+        self.assertEqual(response.data['count'], 1)
+
+    def test_list_is_cached_per_query(self):
+        self.client.get('/api/tasks/')
+        response = self.client.get('/api/tasks/?search=missing')
+
+        self.assertEqual(response.data['count'], 0)
+
+    def test_task_change_invalidates_list_and_details(self):
+        self.client.get('/api/tasks/')
+        self.client.get(self.detail_url)
+        self.task.name = 'Renamed task'
+        self.task.save()
+
+        response = self.client.get('/api/tasks/')
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed task')
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data['name'], 'Renamed task')
+
+    def test_comment_invalidates_details(self):
+        self.client.get(self.detail_url)
+        Comment.objects.create(task=self.task, description='Fresh comment',
+                               author=self.user)
+
+        response = self.client.get(self.detail_url)
+        self.assertEqual(len(response.data['task_comments']), 1)
+
+    def test_user_change_invalidates_responses(self):
+        self.client.get(self.detail_url)
+        self.user.first_name = 'Peter'
+        self.user.save()
+
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response.data['creator']['first_name'], 'Peter')
+
+    def test_concurrent_misses_compute_once(self):
+        request = Request(APIRequestFactory().get('/api/tasks/'))
+        request.user = self.user
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return Response({'results': []})
+
+        threads = [threading.Thread(target=cached_response,
+                                    args=(request, [TASKS_GENERATION],
+                                          compute))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+
+
+class BulkTaskTests(TestCase):
+    """
+    Checks the bulk creation and update of tasks with per-item errors.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = User.objects.create_user(username='creator',
+                                               email='creator@example.com',
+                                               password='secretpasswd951')
+        cls.performer = User.objects.create_user(
+            username='performer', email='performer@example.com',
+            password='secretpasswd951')
+        cls.task = Task.objects.create(name='Existing task',
+                                       specification='Update me',
+                                       due_date=datetime.date.today(),
+                                       creator=cls.creator,
+                                       performer=cls.performer)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.creator)
+        self.due_date = str(datetime.date.today())
+
+    def item(self, name, **values):
+        return dict({'name': name, 'specification': 'In bulk',
+                     'due_date': self.due_date, 'performer': 'performer'},
+                    **values)
+
+    def test_create_and_update(self):
+        response = self.client.post('/api/tasks/bulk/', [
+            self.item('First task'),
+            self.item('Second task'),
+            self.item('Existing task', id=self.task.id, status='w'),
+        ], format='json')
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['created', 'created', 'updated'])
+        self.assertEqual(Task.objects.get(name='First task').creator,
+                         self.creator)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'w')
+
+    def test_per_item_errors(self):
+        response = self.client.post('/api/tasks/bulk/', [
+            self.item('Existing task'),
+            self.item('Nobody', performer='nobody'),
+            self.item('Duplicate'),
+            self.item('Duplicate'),
+            self.item('Missing', id=0),
+            self.item('Valid task'),
+        ], format='json')
+
+        results = response.data['results']
+        self.assertIn('name', results[0]['errors'])
+        self.assertIn('performer', results[1]['errors'])
+        self.assertEqual(results[2]['status'], 'created')
+        self.assertIn('name', results[3]['errors'])
+        self.assertIn('id', results[4]['errors'])
+        self.assertEqual(results[5]['status'], 'created')
+        self.assertEqual(Task.objects.count(), 3)
+
+    def test_repeated_ids_are_rejected(self):
+        response = self.client.post('/api/tasks/bulk/', [
+            self.item('Existing task', id=self.task.id, status='w'),
+            self.item('Renamed task', id=self.task.id),
+        ], format='json')
+
+        results = response.data['results']
+        self.assertEqual(results[0]['status'], 'updated')
+        self.assertIn('id', results[1]['errors'])
+        self.assertEqual(Task.objects.get(id=self.task.id).name,
+                         'Existing task')
+
+    def test_names_taken_concurrently_are_rejected(self):
+        checks = []
+
+        def stale_names(names):
+            # The first check misses a task created by a concurrent request
+            checks.append(names)
+            return {} if len(checks) == 1 else task_names(names)
+
+        with mock.patch('api.bulk.task_names', side_effect=stale_names):
+            response = self.client.post('/api/tasks/bulk/', [
+                self.item('Fresh task'),
+                self.item('Existing task'),
+            ], format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertIn('name', results[1]['errors'])
+        self.assertEqual(Task.objects.count(), 2)
+
+    def test_performer_cannot_change_performer(self):
+        self.client.force_authenticate(self.performer)
+        response = self.client.post('/api/tasks/bulk/', [
+            self.item('Existing task', id=self.task.id, performer='creator'),
+        ], format='json')
+
+        self.assertIn('performer', response.data['results'][0]['errors'])
+
+    def test_queries_do_not_grow_with_items(self):
+        items = [self.item(f'Task {number}') for number in range(50)]
+        # performers, names, savepoint, insert, change log, savepoint release
+        # and the ids of the inserted tasks on backends without RETURNING
+        with self.assertNumQueries(6 if connection.features.
+                                   can_return_rows_from_bulk_insert else 7):
+            self.client.post('/api/tasks/bulk/', items, format='json')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTests(TestCase):
+    """
+    Checks the keyset pagination of the task list: the page boundaries
+    between tasks without a due date and with equal due dates,
+    the next links and the rejected cursors.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='pager',
+                                            password='secretpasswd951')
+        today = datetime.date.today()
+        due_dates = [None, today, None, today + datetime.timedelta(days=1),
+                     today, None, today]
+        Task.objects.bulk_create([
+            Task(name=f'Paged task {number}', specification='Page',
+                 due_date=due_date)
+            for number, due_date in enumerate(due_dates)])
+        # Tasks without a due date first, then the latest due dates first
+        tasks = Task.objects.all()
+        cls.ordered_ids = [task.id for task in sorted(tasks, key=lambda task: (
+            task.due_date is not None, -task.due_date.toordinal()
+            if task.due_date else 0, -task.id))]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def cursor(self, position):
+        return base64.b64encode(position.encode()).decode()
+
+    def test_pages_follow_the_key(self):
+        for limit in (1, 2, 3, 4):
+            pages = []
+            response = self.client.get('/api/tasks/', {
+                'pagination': 'cursor', 'limit': limit})
+            while True:
+                pages.append([task['id']
+                              for task in response.data['results']])
+                if response.data['next'] is None:
+                    break
+                self.assertIn(f'limit={limit}', response.data['next'])
+                self.assertIn('pagination=cursor', response.data['next'])
+                response = self.client.get(response.data['next'])
+
+            self.assertEqual(sum(pages, []), self.ordered_ids)
+            self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+            self.assertTrue(0 < len(pages[-1]) <= limit)
+
+    def test_count_on_request(self):
+        response = self.client.get('/api/tasks/', {
+            'pagination': 'cursor', 'limit': 2, 'count': 1})
+        self.assertEqual(response.data['count'], len(self.ordered_ids))
+        self.assertEqual(len(response.data['results']), 2)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['count'], len(self.ordered_ids))
+        self.assertNotIn('count', self.client.get('/api/tasks/', {
+            'pagination': 'cursor'}).data)
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in ('not base64!', self.cursor('no separator'),
+                       self.cursor('2020-13-45|1'),
+                       self.cursor('yesterday|1'), self.cursor('|id'),
+                       base64.b64encode('\u00e9|1'.encode()).decode()):
+            response = self.client.get('/api/tasks/', {
+                'pagination': 'cursor', 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+        # A cursor after all the tasks without a due date
+        response = self.client.get('/api/tasks/', {
+            'pagination': 'cursor', 'cursor': self.cursor('|0')})
+        self.assertEqual([task['id'] for task in response.data['results']],
+                         self.ordered_ids[3:])
+
+    def test_ordering_is_rejected(self):
+        response = self.client.get('/api/tasks/', {
+            'pagination': 'cursor', 'ordering': 'comment_count'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES,
+                   EMAIL_HOST_USER='tasktable@example.com')
+class QueryBudgetTests(TestCase):
+    """
+    Pins every task endpoint to a fixed number of queries.
+    Write endpoints save the change and its outbox notification
+    within a savepoint of the test transaction.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = User.objects.create_user(username='creator',
+                                               email='creator@example.com',
+                                               password='secretpasswd951')
+        cls.performer = User.objects.create_user(
+            username='performer', email='performer@example.com',
+            password='secretpasswd951')
+        cls.tasks = [Task.objects.create(name=f'Budget task {number}',
+                                         specification='Count the queries',
+                                         due_date=datetime.date.today(),
+                                         creator=cls.creator,
+                                         performer=cls.performer)
+                     for number in range(5)]
+        for task in cls.tasks:
+            for _ in range(3):
+                Comment.objects.create(task=task, description='Counted',
+                                       author=cls.performer)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.creator)
+        self.task = self.tasks[0]
+        self.due_date = str(datetime.date.today())
+
+    def test_task_creation(self):
+        # task name, performer, savepoint, insert, change log, outbox, release
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/taskcreation/', {
+                'name': 'New task', 'specification': 'Created',
+                'due_date': self.due_date, 'performer': 'performer'
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_task_update(self):
+        # task, performer, savepoint, update, change log, outbox, release
+        with self.assertNumQueries(7):
+            response = self.client.put('/api/taskupdate/', {
+                'task_id': self.task.id, 'name': 'Updated task',
+                'specification': 'Updated', 'due_date': self.due_date,
+                'performer': 'performer', 'status': 'w'
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_comment_adding(self):
+        # task, savepoint, insert, task counters, change log, outbox, release
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/addcomment/', {
+                'task_name': self.task.name, 'description': 'Added'
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_task_list(self):
+        # count, page with creators and performers
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/tasks/')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_task_detail(self):
+        # task with its users, comments with their authors
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/tasks/{self.task.id}/')
+
+        self.assertEqual(len(response.data['task_comments']), 3)
+
+    def test_viewset_create(self):
+        # savepoint, unique name, performer, insert, change log, outbox,
+        # release
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/tasks/', {
+                'name': 'Viewset task', 'specification': 'Created',
+                'due_date': self.due_date, 'performer': self.performer.id
+            }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_viewset_update(self):
+        # savepoint, task, unique name, performer, update, change log,
+        # outbox, release
+        with self.assertNumQueries(8):
+            response = self.client.put(f'/api/tasks/{self.task.id}/', {
+                'name': 'Viewset update', 'specification': 'Updated',
+                'due_date': self.due_date, 'performer': self.performer.id,
+                'status': 'w'
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_viewset_add_comment(self):
+        # task, savepoint, insert, task counters, change log, outbox, release
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                f'/api/tasks/{self.task.id}/add_comment/',
+                {'description': 'Added'}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+    """
+    Locmem email backend counting the connections opened to it.
+    """
+
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+
+class DisconnectingEmailBackend(CountingEmailBackend):
+    """
+    Email backend whose first connection is dropped by the server.
+    """
+
+    def send_messages(self, messages):
+        if CountingEmailBackend.opened == 1:
+            raise smtplib.SMTPServerDisconnected('Connection closed')
+
+        return super().send_messages(messages)
+
+
+class FailingEmailBackend(CountingEmailBackend):
+    """
+    Email backend whose first two connections are dropped by the server
+    after two messages each.
+    """
+
+    def send_messages(self, messages):
+        sent = 0
+        for message in messages:
+            if CountingEmailBackend.opened <= 2 and sent == 2:
+                raise smtplib.SMTPServerDisconnected('Connection closed')
+            sent += super().send_messages([message])
+
+        return sent
+
+
+@override_settings(EMAIL_BATCH_SIZE=50)
+class EmailBatchTests(TestCase):
+    """
+    Checks that notification emails are sent in groups
+    through one long-lived connection.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='recipient',
+                                            email='recipient@example.com',
+                                            password='secretpasswd951')
+        Task.objects.bulk_create([
+            Task(name=f'Mailed task {number}', specification='Notify',
+                 due_date=datetime.date.today(), creator=cls.user,
+                 performer=cls.user)
+            for number in range(500)])
+        cls.notifications = [{'task_id': task.id, 'title': 'Changed'}
+                             for task in Task.objects.all()]
+
+    def setUp(self):
+        mailer.close()
+        CountingEmailBackend.opened = 0
+
+    def tearDown(self):
+        mailer.close()
+
+    @override_settings(EMAIL_BACKEND='api.tests.CountingEmailBackend')
+    def test_one_connection_for_all_groups(self):
+        # one query for the tasks of every group of 50 notifications
+        with self.assertNumQueries(10):
+            bulk_email_sender(self.notifications)
+
+        self.assertEqual(len(mail.outbox), 500)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+
+    @override_settings(EMAIL_BACKEND='api.tests.CountingEmailBackend')
+    def test_connection_is_reused_between_tasks(self):
+        bulk_email_sender(self.notifications[:10])
+        bulk_email_sender(self.notifications[10:20])
+
+        self.assertEqual(len(mail.outbox), 20)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+
+    @override_settings(EMAIL_BACKEND='api.tests.DisconnectingEmailBackend')
+    def test_reconnects_when_connection_breaks(self):
+        bulk_email_sender(self.notifications[:10])
+
+        self.assertEqual(len(mail.outbox), 10)
+        self.assertEqual(CountingEmailBackend.opened, 2)
+
+    @override_settings(EMAIL_BACKEND='api.tests.FailingEmailBackend')
+    def test_retry_resumes_after_delivered_emails(self):
+        notifications = self.notifications[:10]
+        # The first notification has nobody to mail, so the emails
+        # and the notifications they were built from are not aligned
+        Task.objects.filter(id=notifications[0]['task_id']).update(
+            creator=None, performer=None)
+
+        bulk_email_sender.apply(kwargs={'notifications': notifications})
+
+        # Two emails per connection before the retry, which sends the rest
+        self.assertEqual(CountingEmailBackend.opened, 3)
+        names = Task.objects.in_bulk(
+            [notification['task_id'] for notification in notifications[1:]])
+        self.assertEqual(
+            sorted(message.body.splitlines()[0] for message in mail.outbox),
+            sorted(f'Task name: {task.name}' for task in names.values()))
+
+    def test_comment_notifications(self):
+        comment = Comment.objects.create(task=Task.objects.first(),
+                                         description='Mailed',
+                                         author=self.user)
+        bulk_email_sender([{'task_id': comment.task_id,
+                            'comment_id': comment.id}])
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('New comment: Mailed', mail.outbox[0].body)
+
+    def test_tasks_without_users_do_not_drop_the_batch(self):
+        creator_only, nobody = Task.objects.order_by('id')[:2]
+        Task.objects.filter(id=creator_only.id).update(performer=None)
+        Task.objects.filter(id=nobody.id).update(creator=None, performer=None)
+        comment = Comment.objects.create(task=creator_only,
+                                         description='Orphaned', author=None)
+
+        bulk_email_sender([
+            {'task_id': nobody.id, 'title': 'Changed'},
+            {'task_id': creator_only.id, 'title': 'Changed'},
+            {'task_id': creator_only.id, 'comment_id': comment.id},
+            *[{'task_id': task_id, 'title': 'Changed'} for task_id in
+              Task.objects.order_by('-id').values_list('id', flat=True)[:3]]])
+
+        # The task without a creator and performer has nobody to mail
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].to, ['recipient@example.com'])
+        self.assertIn(f'Task name: {creator_only.name}', mail.outbox[0].body)
+        self.assertIn('Performer: -', mail.outbox[0].body)
+        self.assertIn('Author: -', mail.outbox[1].body)
+
+
+@override_settings(EMAIL_HOST_USER='tasktable@example.com')
+class OutboxTests(TestCase):
+    """
+    Checks that write requests store notifications in the outbox
+    instead of talking to the broker, and that the relay publishes them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='notified',
+                                            email='notified@example.com',
+                                            password='secretpasswd951')
+        cls.task = Task.objects.create(name='Outbox task',
+                                       specification='Notify later',
+                                       due_date=datetime.date.today(),
+                                       creator=cls.user, performer=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('api.tasks.outbox.bulk_email_sender.apply_async')
+    def test_requests_write_to_outbox(self, apply_async):
+        self.client.post('/api/taskcreation/', {
+            'name': 'Notified task', 'specification': 'Created',
+            'due_date': str(datetime.date.today()), 'performer': 'notified'
+        }, format='json')
+        self.client.post(f'/api/tasks/{self.task.id}/add_comment/',
+                         {'description': 'Notified'}, format='json')
+
+        apply_async.assert_not_called()
+        self.assertEqual(Notification.objects.count(), 2)
+
+    @override_settings(EMAIL_HOST_USER=None)
+    def test_nothing_stored_without_email(self):
+        self.client.post(f'/api/tasks/{self.task.id}/add_comment/',
+                         {'description': 'Not notified'}, format='json')
+
+        self.assertFalse(Notification.objects.exists())
+
+    @mock.patch('api.tasks.outbox.bulk_email_sender.apply_async')
+    def test_relay_publishes_batches(self, apply_async):
+        comment = Comment.objects.create(task=self.task, description='Relayed',
+                                         author=self.user)
+        Notification.objects.bulk_create([
+            *(Notification(task=self.task, title='Changed') for _ in range(4)),
+            Notification(task=self.task, comment=comment)])
+
+        self.assertEqual(relay_notifications(batch_size=2), 5)
+        self.assertEqual(apply_async.call_count, 3)
+        self.assertEqual(apply_async.call_args[1]['kwargs'], {
+            'notifications': [{'task_id': self.task.id,
+                               'comment_id': comment.id}]})
+        self.assertFalse(Notification.objects.exists())
+
+    @mock.patch('api.tasks.outbox.bulk_email_sender.apply_async',
+                side_effect=ConnectionError)
+    def test_relay_keeps_notifications_on_broker_failure(self, apply_async):
+        Notification.objects.create(task=self.task, title='Changed')
+
+        with self.assertRaises(ConnectionError):
+            relay_notifications(batch_size=10)
+
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TOKEN_EXPIRE_AFTER=None)
+class CachedTokenAuthenticationTests(TransactionTestCase):
+    """
+    Checks that authorization tokens are resolved through the cache
+    and invalidated by changes to the token and its user.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tokened',
+                                             email='tokened@example.com',
+                                             password='secretpasswd951')
+        self.key = self.user.auth_token.key
+        self.authentication = CachedTokenAuthentication()
+
+    def test_token_is_cached(self):
+        self.authentication.authenticate_credentials(self.key)
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(
+                self.key)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.key)
+
+    def test_only_user_flags_are_cached(self):
+        self.authentication.authenticate_credentials(self.key)
+        cached = cache.get(token_cache_key(self.key))
+        self.assertNotIn(self.user.password, str(cached))
+        self.assertNotIn('tokened@example.com', str(cached))
+
+        with self.assertNumQueries(0):
+            user, token = self.authentication.authenticate_credentials(
+                self.key)
+            self.assertEqual((user.id, user.is_active, user.is_staff),
+                             (self.user.id, True, False))
+            self.assertEqual(token.created, self.user.auth_token.created)
+        # The other fields are loaded when they are used
+        self.assertEqual(user.email, 'tokened@example.com')
+
+    def test_unknown_token_is_cached(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials('unknown')
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials('unknown')
+
+    def test_deactivated_user_is_rejected(self):
+        self.authentication.authenticate_credentials(self.key)
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.key)
+
+    def test_deleted_token_is_rejected(self):
+        self.authentication.authenticate_credentials(self.key)
+        Token.objects.filter(user=self.user).get().delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.key)
+
+    @override_settings(TOKEN_EXPIRE_AFTER=60)
+    def test_expired_token_is_rejected_and_renewed_on_login(self):
+        Token.objects.filter(user=self.user).update(
+            created=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials(self.key)
+
+        response = self.client.post('/api/login/', {
+            'username': 'tokened', 'password': 'secretpasswd951'})
+        new_key = response.data['Authorization'].split()[1]
+        self.assertNotEqual(new_key, self.key)
+        self.authentication.authenticate_credentials(new_key)
+
+
+class ExportTests(TestCase):
+    """
+    Checks the streaming NDJSON and CSV export of tasks and comments.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reporter',
+                                            email='reporter@example.com',
+                                            password='secretpasswd951')
+        for number, status in enumerate(['n', 'w', 'c']):
+            task = Task.objects.create(name=f'Exported task {number}',
+                                       specification='Report it',
+                                       due_date=datetime.date.today(),
+                                       creator=cls.user, performer=cls.user,
+                                       status=status)
+            Comment.objects.create(task=task, description='Exported',
+                                   author=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_tasks_ndjson(self):
+        lines = self.export('/api/export/tasks/').splitlines()
+
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])['performer'], 'reporter')
+
+    def test_comments_csv_with_filter(self):
+        rows = list(csv.reader(io.StringIO(
+            self.export('/api/export/comments/?output=csv&status=w'))))
+
+        self.assertEqual(rows[0], ['id', 'task', 'task_name', 'description',
+                                   'author', 'post_date'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][2], 'Exported task 1')
+
+    def test_invalid_filter(self):
+        response = self.client.get('/api/export/tasks/?status=x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            self.export('/api/export/comments/')
+
+    def test_management_command(self):
+        out = io.StringIO()
+        call_command('export_tasks', 'tasks', '--since',
+                     str(datetime.date.today()), stdout=out)
+
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsgiExportTests(TransactionTestCase):
+    """
+    Checks that the streaming export is served in the ASGI mode, where
+    its rows are fetched outside of the event loop.
+    """
+
+    def test_streamed_over_asgi(self):
+        from tasktable.asgi import application
+
+        user = User.objects.create_user(username='streamer')
+        Task.objects.create(name='Streamed task', specification='Over ASGI',
+                            due_date=datetime.date.today(), creator=user)
+
+        async def request():
+            communicator = ApplicationCommunicator(application, {
+                'type': 'http', 'method': 'GET', 'path': '/api/export/tasks/',
+                'query_string': b'', 'server': ('testserver', 80),
+                'headers': [(b'authorization',
+                             f'Token {user.auth_token.key}'.encode())]})
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(5)
+            body = b''
+            while True:
+                message = await communicator.receive_output(5)
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    return start, body
+
+        start, body = asyncio.run(request())
+
+        self.assertEqual(start['status'], 200)
+        self.assertEqual([json.loads(line)['name']
+                          for line in body.decode().splitlines()],
+                         ['Streamed task'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES,
+                   EMAIL_HOST_USER='tasktable@example.com')
+class ImportTests(TestCase):
+    """
+    Checks the batched import of users, tasks and comments.
+    """
+
+    def import_file(self, kind, name, content, *args):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+
+        out = io.StringIO()
+        call_command('import_tasks', kind, path, *args, stdout=out)
+        return out.getvalue()
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_import(self):
+        users = '\n'.join(json.dumps({'username': f'imported{number}',
+                                      'email': f'user{number}@example.com'})
+                          for number in range(3)) + '\n'
+        self.import_file('users', 'users.ndjson', users, '--batch-size', '2')
+
+        self.assertEqual(Token.objects.filter(
+            user__username__startswith='imported').count(), 3)
+
+        tasks = 'name,specification,due_date,status,creator,performer\n' \
+                'Imported task,From the old tracker,2020-12-20,w,' \
+                'imported0,imported1\n' \
+                'Orphan task,Nobody does it,,n,ghost,\n'
+        output = self.import_file('tasks', 'tasks.csv', tasks)
+
+        task = Task.objects.get(name='Imported task')
+        self.assertEqual(task.performer.username, 'imported1')
+        self.assertEqual(task.status, 'w')
+        self.assertIsNone(Task.objects.get(name='Orphan task').creator)
+        self.assertIn('1 unknown users or tasks', output)
+
+        comments = json.dumps({'task_name': 'Imported task',
+                               'description': 'Old comment',
+                               'author': 'imported2',
+                               'post_date': '2020-01-02T03:04:05+00:00'})
+        self.import_file('comments', 'comments.ndjson', comments)
+
+        comment = task.task_comments.get()
+        self.assertEqual(comment.author.username, 'imported2')
+        task.refresh_from_db()
+        self.assertEqual(task.comment_count, 1)
+        self.assertEqual(comment.post_date, datetime.datetime(
+            2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc))
+        self.assertTrue(Comment._meta.get_field('post_date').auto_now)
+        self.assertFalse(Notification.objects.exists())
+        # Imports reach the change feed like other changes
+        orphan = Task.objects.get(name='Orphan task')
+        self.assertEqual(list(TaskChange.objects.order_by('id').values_list(
+            'task_id', 'comment_id', 'action')), [
+            (task.id, None, 'c'), (orphan.id, None, 'c'),
+            (task.id, None, 'u')])
+
+    def test_invalid_dates_stop_import(self):
+        tasks = 'name,specification,due_date\nBad task,Spec,someday\n'
+        with self.assertRaisesMessage(CommandError, "'someday'"):
+            self.import_file('tasks', 'tasks.csv', tasks)
+
+        Task.objects.create(name='Commented task', specification='Spec')
+        comments = json.dumps({'task_name': 'Commented task',
+                               'description': 'Undated',
+                               'post_date': 'yesterday'})
+        with self.assertRaisesMessage(CommandError, "'yesterday'"):
+            self.import_file('comments', 'comments.ndjson', comments)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_duplicate_stops_import(self):
+        User.objects.create_user(username='taken')
+
+        with self.assertRaises(CommandError):
+            self.import_file('users', 'users.ndjson',
+                             json.dumps({'username': 'taken'}))
+
+
+class HealthTests(TestCase):
+    """
+    Checks the health check endpoint used by load balancers.
+    """
+
+    def test_health(self):
+        response = APIClient().get('/api/health/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'ok'})
+
+    def test_database_unavailable(self):
+        with mock.patch('api.views.connection.cursor',
+                        side_effect=DatabaseError):
+            response = APIClient().get('/api/health/')
+
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ChangeFeedTests(TransactionTestCase):
+    """
+    Checks the task change feed, its tombstones and its long-poll
+    and Server-Sent Events modes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='watcher')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cursor = self.client.get('/api/tasks/changes/').data['cursor']
+
+    def changes(self, **params):
+        return self.client.get('/api/tasks/changes/',
+                               {'since': self.cursor, **params}).data
+
+    def test_changes_and_tombstones(self):
+        task = Task.objects.create(name='Watched task', specification='Spec',
+                                   creator=self.user)
+        task.status = 'w'
+        task.save()
+        comment = Comment.objects.create(task=task, description='Note',
+                                         author=self.user)
+        task_id = task.id
+        task.delete()
+
+        data = self.changes()
+        actions = [(change['task_id'], change['comment_id'], change['action'])
+                   for change in data['changes']]
+        self.assertEqual(actions, [(task_id, None, 'c'), (task_id, None, 'u'),
+                                   (task_id, comment.id, 'c'),
+                                   (task_id, None, 'd')])
+        self.assertIsNone(data['changes'][0]['task'])
+        self.assertEqual(data['cursor'], data['changes'][-1]['id'])
+
+        self.cursor = data['cursor']
+        self.assertEqual(self.changes()['changes'], [])
+
+    def test_current_task_state(self):
+        task = Task.objects.create(name='Live task', specification='Spec',
+                                   creator=self.user)
+        self.client.post('/api/tasks/bulk/', [{
+            'id': task.id, 'name': 'Live task', 'specification': 'Changed',
+            'due_date': str(datetime.date.today()),
+            'performer': 'watcher'}], format='json')
+
+        data = self.changes(limit=1)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(data['changes'][0]['task']['specification'],
+                         'Changed')
+
+        self.cursor = data['cursor']
+        self.assertEqual(self.changes()['changes'][0]['action'], 'u')
+
+    def test_long_poll(self):
+        def create_task():
+            time.sleep(0.3)
+            Task.objects.create(name='Awaited task', specification='Spec')
+
+        thread = threading.Thread(target=create_task)
+        started = time.monotonic()
+        thread.start()
+        data = self.changes(wait=5)
+        thread.join()
+
+        self.assertEqual(len(data['changes']), 1)
+        self.assertLess(time.monotonic() - started, 3)
+
+    def test_late_commits_are_not_skipped(self):
+        Task.objects.create(name='Committed task', specification='Spec')
+        self.cursor = self.changes()['cursor']
+        self.assertEqual(self.changes()['changes'], [])
+
+        # An entry inserted before the latest one but committed after it
+        late = TaskChange.objects.create(
+            id=TaskChange.objects.order_by('id').first().id - 1,
+            task_id=1, action='u')
+
+        data = self.changes()
+        self.assertEqual([change['task_id'] for change in data['changes']],
+                         [late.task_id])
+        self.assertGreater(data['cursor'], self.cursor)
+
+    @override_settings(TASK_CHANGES_MAX_WAIT_WSGI=1)
+    def test_wait_is_short_under_wsgi(self):
+        started = time.monotonic()
+        data = self.changes(wait=25)
+
+        self.assertEqual(data['changes'], [])
+        self.assertLess(time.monotonic() - started, 3)
+
+    def test_pruned_cursor_expires(self):
+        for name in ('Old task', 'Recent task'):
+            Task.objects.create(name=name, specification='Spec')
+        old = self.changes()['changes'][0]['id']
+        TaskChange.objects.filter(position__lte=old).update(
+            created_at=timezone.now() - datetime.timedelta(days=8))
+
+        self.assertEqual(prune_changes(7), 1)
+
+        response = self.client.get('/api/tasks/changes/',
+                                   {'since': self.cursor})
+        self.assertEqual(response.status_code, 410)
+        # A client that had seen the pruned change is not affected
+        self.cursor = old
+        self.assertEqual([change['task']['name']
+                          for change in self.changes()['changes']],
+                         ['Recent task'])
+        self.assertEqual(prune_changes(7), 0)
+        self.assertEqual(TaskChangeFloor.objects.get().position, old)
+
+    def test_event_stream(self):
+        Task.objects.create(name='Streamed task', specification='Spec')
+
+        response = self.client.get('/api/tasks/changes/',
+                                   HTTP_ACCEPT='text/event-stream',
+                                   HTTP_LAST_EVENT_ID=str(self.cursor))
+
+        self.assertEqual(response['Content-Type'],
+                         'text/event-stream; charset=utf-8')
+        events = response.content.decode().split('\n\n')
+        self.assertTrue(events[1].startswith('event: change\ndata: {'))
+        self.assertIn('Streamed task', events[1])
+        self.assertTrue(events[2].startswith('id: '))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CommentCounterTests(TestCase):
+    """
+    Checks the comment counters stored on tasks.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='commenter')
+        cls.task = Task.objects.create(name='Discussed task',
+                                       specification='Spec')
+        cls.quiet = Task.objects.create(name='Quiet task',
+                                        specification='Spec')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_counters(self):
+        stale = Task.objects.get(pk=self.task.pk)
+        for description in ('First', 'Second'):
+            self.client.post(f'/api/tasks/{self.task.id}/add_comment/',
+                             {'description': description}, format='json')
+        # Saving a task loaded earlier keeps the counters
+        stale.status = 'w'
+        stale.save()
+
+        self.task.refresh_from_db()
+        last = self.task.task_comments.first()
+        self.assertEqual(self.task.comment_count, 2)
+        self.assertEqual(self.task.last_comment_at, last.post_date)
+
+        last.delete()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.comment_count, 1)
+        self.assertEqual(self.task.last_comment_at,
+                         self.task.task_comments.get().post_date)
+        self.assertEqual(self.task.status, 'w')
+
+    def test_late_comment_keeps_last_date(self):
+        last = Comment.objects.create(task=self.task, description='Last')
+        # A comment whose transaction commits after a newer one
+        comment_saved(Comment(task=self.task, description='Late',
+                              post_date=last.post_date - datetime.timedelta(
+                                  minutes=1)), created=True)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.comment_count, 2)
+        self.assertEqual(self.task.last_comment_at, last.post_date)
+
+    def test_deleted_task_skips_comment_counters(self):
+        task = Task.objects.create(name='Deleted task', specification='Spec')
+        for description in ('First', 'Second', 'Third'):
+            Comment.objects.create(task=task, description=description)
+
+        with CaptureQueriesContext(connection) as queries:
+            task.delete()
+
+        # The comments only leave one delete, and no task updates
+        # or change entries of their own
+        self.assertFalse([query for query in queries
+                          if query['sql'].startswith('UPDATE')])
+        self.assertEqual(list(TaskChange.objects.filter(
+            comment_id__isnull=False, action='d')), [])
+        # Comments of other tasks are counted again afterwards
+        comment = Comment.objects.create(task=self.quiet, description='Note')
+        comment.delete()
+        self.quiet.refresh_from_db()
+        self.assertEqual(self.quiet.comment_count, 0)
+
+    def test_ordering_and_filtering(self):
+        Comment.objects.create(task=self.task, description='Note')
+
+        results = self.client.get('/api/tasks/?ordering=-comment_count').data[
+            'results']
+        self.assertEqual([task['name'] for task in results],
+                         ['Discussed task', 'Quiet task'])
+        self.assertEqual(results[0]['comment_count'], 1)
+
+        results = self.client.get('/api/tasks/?comment_count__gte=1').data[
+            'results']
+        self.assertEqual([task['name'] for task in results],
+                         ['Discussed task'])
+
+    def test_ordering_ties_are_broken_by_id(self):
+        for ordering, ids in (('comment_count', [self.task.id, self.quiet.id]),
+                              ('-last_comment_at',
+                               [self.quiet.id, self.task.id])):
+            with CaptureQueriesContext(connection) as queries:
+                results = self.client.get(
+                    f'/api/tasks/?ordering={ordering}').data['results']
+
+            self.assertEqual([task['id'] for task in results], ids)
+            direction = 'DESC' if ordering.startswith('-') else 'ASC'
+            self.assertTrue(queries[-1]['sql'].endswith(
+                f'"api_task"."id" {direction} LIMIT 10'))
+
+    def test_repair(self):
+        Comment.objects.create(task=self.task, description='Note')
+        Task.objects.update(comment_count=5, last_comment_at=None)
+
+        out = io.StringIO()
+        call_command('repair_comment_counts', '--batch-size', '1', stdout=out)
+
+        self.task.refresh_from_db()
+        self.quiet.refresh_from_db()
+        self.assertEqual(self.task.comment_count, 1)
+        self.assertIsNotNone(self.task.last_comment_at)
+        self.assertEqual(self.quiet.comment_count, 0)
+        self.assertIn('2 tasks recounted', out.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TaskRowsTests(TestCase):
+    """
+    Checks that the task list built from values() matches
+    TaskListSerializer, and the sparse fieldsets.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader',
+                                            first_name='Ann')
+        today = datetime.date.today()
+        for number in range(5):
+            task = Task.objects.create(
+                name=f'Task {number}', specification='Spec',
+                due_date=today + datetime.timedelta(days=number)
+                if number else None,
+                creator=cls.user if number % 2 else None,
+                performer=cls.user if number != 3 else None,
+                status='nwc'[number % 3])
+            if number == 2:
+                Comment.objects.create(task=task, description='Note')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_same_output_as_serializer(self):
+        for query in ('', '?pagination=cursor&limit=3'):
+            response = self.client.get(f'/api/tasks/{query}')
+            queryset = Task.objects.filter(
+                id__in=[task['id'] for task in response.data['results']])
+            tasks = sorted(queryset, key=lambda task: [
+                task['id'] for task in response.data['results']].index(
+                task.id))
+            expected = TaskListSerializer(tasks, many=True, context={
+                'request': response.wsgi_request}).data
+
+            self.assertEqual(JSONRenderer().render(response.data['results']),
+                             JSONRenderer().render(expected))
+
+    def test_sparse_fieldsets(self):
+        task = self.client.get(
+            '/api/tasks/?fields=id,name,performer,creator').data['results'][0]
+        self.assertEqual(list(task), ['id', 'name', 'creator', 'performer'])
+        self.assertEqual(task['performer']['first_name'], 'Ann')
+
+        task = self.client.get(
+            '/api/tasks/?fields=id,performer&expand=').data['results'][0]
+        self.assertEqual(task['performer'], self.user.id)
+
+        task_id = Task.objects.get(name='Task 1').id
+        task = self.client.get(
+            f'/api/tasks/{task_id}/?fields=name,creator&expand=creator').data
+        self.assertEqual(dict(task), {'name': 'Task 1', 'creator': {
+            'id': self.user.id, 'username': 'reader', 'email': '',
+            'first_name': 'Ann', 'last_name': ''}})
+
+
+class FastJSONTests(TestCase):
+    """
+    Checks that the JSON renderer and parser give the same results
+    with and without orjson.
+    """
+
+    data = {
+        'results': [{'id': 1, 'name': 'Задача ', 'due_date': None,
+                     'status': 'n', 'ratio': decimal.Decimal('0.5'),
+                     'created': datetime.datetime(
+                         2020, 12, 20, 10, 30, tzinfo=datetime.timezone.utc),
+                     'day': datetime.date(2020, 12, 24)}],
+        'next': None,
+        7: True,
+    }
+
+    def test_renderer(self):
+        fast = FastJSONRenderer().render(self.data)
+        with mock.patch('api.renderers.orjson', None):
+            standard = FastJSONRenderer().render(self.data)
+
+        self.assertEqual(fast, standard)
+        self.assertIn('"created":"20.12.2020 10:30:00 UTC"', fast.decode())
+        self.assertIn(b'\\u2028', fast)
+
+    def test_parser(self):
+        content = json.dumps(self.data['results'][0], default=str).encode()
+
+        parsed = FastJSONParser().parse(io.BytesIO(content))
+        with mock.patch('api.parsers.orjson', None):
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(content)),
+                             parsed)
+
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"name": NaN}'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MetricsTests(TestCase):
+    """
+    Checks the Prometheus metrics of requests, caches and Celery tasks.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='measured',
+                                            email='measured@example.com',
+                                            password='secretpasswd951')
+        cls.task = Task.objects.create(name='Measured task',
+                                       specification='Measured',
+                                       due_date=datetime.date.today(),
+                                       creator=cls.user, performer=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        mailer.close()
+
+    def tearDown(self):
+        mailer.close()
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_metrics(self):
+        labels = {'method': 'GET', 'route': 'api/health/'}
+        requests = self.sample(
+            'tasktable_http_request_duration_seconds_count', **labels)
+        responses = self.sample('tasktable_http_responses_total',
+                                status='200', **labels)
+        queries = self.sample('tasktable_db_queries_per_request_sum',
+                              route='api/health/')
+
+        APIClient().get('/api/health/')
+
+        self.assertEqual(self.sample(
+            'tasktable_http_request_duration_seconds_count', **labels),
+            requests + 1)
+        self.assertEqual(self.sample('tasktable_http_responses_total',
+                                     status='200', **labels), responses + 1)
+        self.assertEqual(self.sample('tasktable_db_queries_per_request_sum',
+                                     route='api/health/'), queries + 1)
+
+    def test_tasks_share_a_route(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        route = 'api/tasks/(?P<pk>[^/.]+)/'
+        before = self.sample('tasktable_db_queries_per_request_count',
+                             route=route)
+
+        client.get(f'/api/tasks/{self.task.id}/')
+        client.get('/api/tasks/0/')
+
+        self.assertEqual(self.sample('tasktable_db_queries_per_request_count',
+                                     route=route), before + 2)
+
+    def test_metrics_endpoint(self):
+        APIClient().get('/api/health/')
+        response = APIClient().get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'tasktable_http_request_duration_seconds_bucket',
+                      response.content)
+
+    def test_metrics_endpoint_is_restricted(self):
+        client = APIClient(REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(client.get('/metrics').status_code, 403)
+
+        with override_settings(METRICS_TOKEN='scraper'):
+            self.assertEqual(client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer scraper').status_code,
+                200)
+            self.assertEqual(client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer other').status_code,
+                403)
+
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(client.get('/metrics').status_code, 200)
+
+    def test_streaming_responses_are_measured_to_the_end(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        route = 'api/export/<str:kind>/'
+        before = self.sample('tasktable_http_request_duration_seconds_count',
+                             method='GET', route=route)
+        queries = self.sample('tasktable_db_queries_per_request_sum',
+                              route=route)
+
+        response = client.get('/api/export/tasks/')
+        self.assertEqual(self.sample(
+            'tasktable_http_request_duration_seconds_count', method='GET',
+            route=route), before)
+
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(self.sample(
+            'tasktable_http_request_duration_seconds_count', method='GET',
+            route=route), before + 1)
+        # The queries of the content are counted too
+        self.assertGreater(self.sample('tasktable_db_queries_per_request_sum',
+                                       route=route), queries)
+
+    def test_cache_lookups(self):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.user.auth_token.key}')
+        before = {(cache_name, result): self.sample(
+            'tasktable_cache_requests_total', cache=cache_name, result=result)
+            for cache_name in ('response', 'token')
+            for result in ('hit', 'miss')}
+
+        client.get('/api/tasks/')
+        client.get('/api/tasks/')
+
+        for key in before:
+            self.assertEqual(self.sample(
+                'tasktable_cache_requests_total', cache=key[0],
+                result=key[1]), before[key] + 1)
+
+    def test_celery_task_metrics(self):
+        name = 'tasktable.send_basic_email'
+        runs = self.sample('tasktable_celery_task_duration_seconds_count',
+                           task=name)
+        successes = self.sample('tasktable_celery_tasks_total', task=name,
+                                state='SUCCESS')
+        waits = self.sample('tasktable_celery_queue_wait_seconds_count',
+                            task=name)
+        waited = self.sample('tasktable_celery_queue_wait_seconds_sum',
+                             task=name)
+
+        basic_email_sender.apply(args=[self.task.id, 'Measured'],
+                                 headers={'published_at': time.time() - 2})
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.sample(
+            'tasktable_celery_task_duration_seconds_count', task=name),
+            runs + 1)
+        self.assertEqual(self.sample('tasktable_celery_tasks_total',
+                                     task=name, state='SUCCESS'),
+                         successes + 1)
+        self.assertEqual(self.sample(
+            'tasktable_celery_queue_wait_seconds_count', task=name),
+            waits + 1)
+        self.assertGreaterEqual(self.sample(
+            'tasktable_celery_queue_wait_seconds_sum', task=name) - waited, 2)
+
+    def test_celery_task_retries(self):
+        name = 'tasktable.send_comment_email'
+        comment = Comment.objects.create(task=self.task, description='Retry',
+                                         author=self.user)
+        retries = self.sample('tasktable_celery_task_retries_total',
+                              task=name)
+
+        # The first attempt fails, the retry sends the email
+        with mock.patch.object(mailer, 'send_messages',
+                               side_effect=[smtplib.SMTPException, 1]):
+            comment_email_sender.apply(args=[self.task.id, comment.id])
+
+        self.assertEqual(self.sample('tasktable_celery_task_retries_total',
+                                     task=name), retries + 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PROFILING_SAMPLE_RATE=0)
+class ProfilingTests(TestCase):
+    """
+    Checks the on-demand and sampled request profiles
+    and their download by staff users.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='staff', is_staff=True)
+        cls.user = User.objects.create_user(username='regular')
+        Task.objects.create(name='Profiled task', specification='Profiled',
+                            due_date=datetime.date.today(),
+                            creator=cls.user, performer=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = self.settings(PROFILING_ROOT=directory.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.root = directory.name
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {user.auth_token.key}')
+        return client
+
+    def test_staff_request_is_profiled(self):
+        client = self.client_for(self.staff)
+        response = client.get('/api/tasks/', HTTP_X_PROFILE='1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'],
+                         r'^total;dur=[\d.]+, sql;dur=[\d.]+;desc="\d+ '
+                         r'queries", render;dur=[\d.]+, python;dur=[\d.]+$')
+
+        summary = client.get(
+            f'/api/profiles/{response["X-Profile-Id"]}/').json()
+        self.assertEqual(summary['path'], '/api/tasks/')
+        self.assertEqual(summary['queries'], len(summary['statements']))
+        self.assertTrue(any(
+            statement['call_site'].startswith('api/views.py:')
+            for statement in summary['statements']))
+
+        download = client.get(
+            f'/api/profiles/{response["X-Profile-Id"]}/?output=prof')
+        with tempfile.NamedTemporaryFile(suffix='.prof') as file:
+            file.write(b''.join(download.streaming_content))
+            file.flush()
+            self.assertGreater(pstats.Stats(file.name).total_calls, 0)
+
+    def test_other_requests_are_not_profiled(self):
+        response = self.client_for(self.user).get('/api/tasks/',
+                                                  HTTP_X_PROFILE='1')
+        anonymous = APIClient().get('/api/health/', HTTP_X_PROFILE='1')
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('Server-Timing', anonymous)
+        self.assertEqual(os.listdir(self.root), [])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_are_saved_without_headers(self):
+        response = APIClient().get('/api/health/')
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(len(os.listdir(self.root)), 2)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_MAX_FILES=2)
+    def test_old_profiles_are_removed(self):
+        for _ in range(4):
+            APIClient().get('/api/health/')
+
+        self.assertEqual(len(os.listdir(self.root)), 4)
+
+    def test_profiles_are_for_staff_only(self):
+        response = self.client_for(self.staff).get('/api/health/',
+                                                   HTTP_X_PROFILE='1')
+        url = f'/api/profiles/{response["X-Profile-Id"]}/'
+
+        self.assertEqual(self.client_for(self.user).get(url).status_code,
+                         403)
+        self.assertEqual(self.client_for(self.staff).get(
+            f'/api/profiles/{uuid.uuid4()}/').status_code, 404)
+
+
+class CeleryRoutingTests(TestCase):
+    """
+    Checks the queues of the tasks and the pruning of stale task results.
+    """
+
+    def test_task_routes(self):
+        queues = {
+            'tasktable.send_bulk_email': 'notifications',
+            'tasktable.process_upload': 'bulk',
+            'tasktable.relay_notifications': 'periodic',
+            'tasktable.prune_task_changes': 'periodic',
+            'tasktable.prune_task_results': 'periodic',
+            'tasktable.send_deadline_reminders': 'periodic',
+            'tasktable.archive_tasks': 'periodic',
+            'celery.backend_cleanup': 'default',
+        }
+
+        for name, queue in queues.items():
+            self.assertEqual(
+                celery_app.amqp.router.route({}, name)['queue'].name, queue)
+
+    def test_beat_jobs_are_routed(self):
+        for entry in settings.CELERY_BEAT_SCHEDULE.values():
+            self.assertNotIn('options', entry)
+            self.assertIn(entry['task'], settings.CELERY_TASK_ROUTES)
+
+    def test_prune_task_results(self):
+        for number in range(5):
+            TaskResult.objects.create(task_id=f'task-{number}',
+                                      status='FAILURE')
+        TaskResult.objects.filter(task_id__in=['task-0', 'task-1',
+                                               'task-2']).update(
+            date_done=timezone.now() - datetime.timedelta(days=8))
+
+        self.assertEqual(prune_task_results(7, batch_size=2), 3)
+        self.assertEqual(sorted(TaskResult.objects.values_list(
+            'task_id', flat=True)), ['task-3', 'task-4'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES,
+                   EMAIL_HOST_USER='tasktable@example.com')
+class DeadlineReminderTests(TestCase):
+    """
+    Checks that the deadline sweep reminds about every open task in its
+    windows once, and that it scans the partial index of open tasks.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reminded',
+                                            email='reminded@example.com',
+                                            password='secretpasswd951')
+        cls.today = datetime.date.today()
+
+    def create_task(self, days, status='n', performer=True):
+        return Task.objects.create(
+            name=f'Reminded task {Task.objects.count()}', specification='Remind me',
+            due_date=self.today + datetime.timedelta(days=days),
+            status=status, creator=self.user,
+            performer=self.user if performer else None)
+
+    def test_reminds_open_tasks_once(self):
+        soon = [self.create_task(0), self.create_task(1, status='w')]
+        overdue = self.create_task(-3)
+        self.create_task(2)
+        self.create_task(-8)
+        self.create_task(0, status='c')
+        self.create_task(1, performer=False)
+
+        self.assertEqual(send_deadline_reminders(1, 7, chunk_size=1), 3)
+        self.assertEqual(send_deadline_reminders(1, 7, chunk_size=1), 0)
+
+        self.assertEqual(sorted(TaskReminder.objects.filter(
+            kind='s').values_list('task_id', flat=True)),
+            [task.id for task in soon])
+        self.assertEqual(list(TaskReminder.objects.filter(
+            kind='o').values_list('task_id', flat=True)), [overdue.id])
+        self.assertEqual(sorted(Notification.objects.values_list(
+            'task_id', 'title')), sorted([
+                *((task.id, 'The task is due soon') for task in soon),
+                (overdue.id, 'The task is overdue')]))
+
+    def test_reminds_again_after_due_date_change(self):
+        task = self.create_task(1)
+        send_deadline_reminders(1, 7, chunk_size=10)
+
+        Task.objects.filter(id=task.id).update(due_date=self.today)
+        self.assertEqual(send_deadline_reminders(1, 7, chunk_size=10), 1)
+
+        # The overdue reminder is a separate one
+        self.assertEqual(send_deadline_reminders(
+            1, 7, chunk_size=10,
+            today=self.today + datetime.timedelta(days=1)), 1)
+        self.assertEqual(TaskReminder.objects.count(), 3)
+
+    def test_chunks_follow_keyset_order(self):
+        for days in (1, 0, 1, 0, 1):
+            self.create_task(days)
+
+        # A select, the reminders and the notifications per chunk
+        # (in savepoints here), and the empty selects of both windows
+        with self.assertNumQueries(3 * 5 + 2):
+            self.assertEqual(send_deadline_reminders(1, 0, chunk_size=2), 5)
+
+        self.assertEqual(TaskReminder.objects.count(), 5)
+
+    def test_skipped_while_another_sweep_runs(self):
+        self.create_task(0)
+        cache.add(SWEEP_LOCK, 1)
+        try:
+            self.assertEqual(send_deadline_reminders(1, 7, chunk_size=10), 0)
+        finally:
+            cache.delete(SWEEP_LOCK)
+
+        self.assertFalse(TaskReminder.objects.exists())
+
+    def test_sweep_avoids_table_scan(self):
+        queryset = reminder_candidates(
+            's', self.today, self.today + datetime.timedelta(days=1))[:10]
+
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan on api_task ', queryset.explain())
+        elif connection.vendor == 'sqlite':
+            self.assertIn('SEARCH api_task USING', queryset.explain())
+        else:
+            self.skipTest(f'no query plan check for {connection.vendor}')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ArchiveTests(TestCase):
+    """
+    Checks that old completed tasks are moved to the archive with their
+    comments and served by the archived tasks endpoints only.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='archivist',
+                                            email='archivist@example.com',
+                                            password='secretpasswd951')
+        cls.old = datetime.date.today() - datetime.timedelta(days=100)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_task(self, name, status='c', due_date=None, comments=0):
+        task = Task.objects.create(name=name, specification='Done',
+                                   due_date=due_date or self.old,
+                                   status=status, creator=self.user,
+                                   performer=self.user)
+        for number in range(comments):
+            Comment.objects.create(task=task, description=f'Comment {number}',
+                                   author=self.user)
+        # Old tasks were completed and commented long ago
+        posted = timezone.now() - datetime.timedelta(days=100)
+        Comment.objects.filter(task=task).update(post_date=posted)
+        if comments:
+            Task.objects.filter(id=task.id).update(last_comment_at=posted)
+        if status == 'c':
+            Task.objects.filter(id=task.id).update(completed_at=posted)
+
+        return task
+
+    def test_archives_old_completed_tasks(self):
+        archived = [self.create_task('Archived 1', comments=2),
+                    self.create_task('Archived 2')]
+        self.create_task('Open', status='w')
+        self.create_task('Recent', due_date=datetime.date.today())
+        commented = self.create_task('Commented', comments=1)
+        Task.objects.filter(id=commented.id).update(
+            last_comment_at=timezone.now())
+        Notification.objects.create(task=archived[0], title='Changed')
+
+        self.assertEqual(archive_tasks(90, batch_size=1), 2)
+        self.assertEqual(archive_tasks(90, batch_size=1), 0)
+
+        self.assertEqual(sorted(Task.objects.values_list('name', flat=True)),
+                         ['Commented', 'Open', 'Recent'])
+        task = ArchivedTask.objects.get(id=archived[0].id)
+        self.assertEqual((task.name, task.status, task.due_date,
+                          task.performer, task.comment_count),
+                         ('Archived 1', 'c', self.old, self.user, 2))
+        self.assertIsNotNone(task.archived_at)
+        self.assertEqual(ArchivedComment.objects.filter(task=task).count(), 2)
+        self.assertFalse(Comment.objects.filter(
+            task_id=archived[0].id).exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(sorted(TaskChange.objects.filter(
+            action='d').values_list('task_id', flat=True)),
+            [task.id for task in archived])
+
+        # The name of an archived task can be taken again
+        Task.objects.create(name='Archived 1', specification='Again')
+
+    def test_tasks_without_due_date_are_archived_by_completion(self):
+        archived = self.create_task('Undated')
+        recent = self.create_task('Recently completed')
+        Task.objects.filter(id__in=[archived.id, recent.id]).update(
+            due_date=None)
+        Task.objects.filter(id=recent.id).update(completed_at=timezone.now())
+
+        self.assertEqual(archive_tasks(90, batch_size=10), 1)
+        self.assertTrue(ArchivedTask.objects.filter(id=archived.id).exists())
+        self.assertTrue(Task.objects.filter(id=recent.id).exists())
+
+    def test_completion_is_tracked(self):
+        task = Task.objects.create(name='Tracked', specification='Done',
+                                   status='c', creator=self.user)
+        completed_at = task.completed_at
+        self.assertIsNotNone(completed_at)
+
+        task.name = 'Renamed'
+        task.save()
+        self.assertEqual(Task.objects.get(id=task.id).completed_at,
+                         completed_at)
+
+        task.status = 'w'
+        task.save(update_fields=['status'])
+        self.assertIsNone(Task.objects.get(id=task.id).completed_at)
+
+        response = self.client.post('/api/tasks/bulk/', [{
+            'id': task.id, 'name': 'Renamed', 'specification': 'Done',
+            'due_date': str(datetime.date.today()), 'performer': 'archivist',
+            'status': 'c'}], format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'updated')
+        self.assertIsNotNone(Task.objects.get(id=task.id).completed_at)
+
+    def test_archived_tasks_endpoints(self):
+        task = self.create_task('Archived', comments=1)
+        archive_tasks(90, batch_size=10)
+
+        self.assertEqual(self.client.get('/api/tasks/').data['count'], 0)
+        self.assertEqual(self.client.get(f'/api/tasks/{task.id}/')
+                         .status_code, 404)
+
+        response = self.client.get('/api/archived-tasks/')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Archived')
+        self.assertEqual(response.data['results'][0]['performer']['username'],
+                         'archivist')
+
+        response = self.client.get(f'/api/archived-tasks/{task.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['task_comments'][0]['description'],
+                         'Comment 0')
+
+        response = self.client.get('/api/archived-tasks/',
+                                   {'pagination': 'cursor', 'limit': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+        self.assertEqual(self.client.post('/api/archived-tasks/', {})
+                         .status_code, 405)
+
+    def test_archive_command(self):
+        self.create_task('Archived')
+        out = io.StringIO()
+
+        call_command('archive_tasks', '--days', '200', stdout=out)
+        call_command('archive_tasks', '--batch-size', '1', stdout=out)
+
+        self.assertEqual(out.getvalue(), '0 tasks archived\n'
+                                         '1 tasks archived\n')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ArchivedCommentTests(TransactionTestCase):
+    """
+    Checks that a comment on a task archived while the comment was being
+    added gets 404. The foreign keys are checked at commit on SQLite,
+    so the tests need real transactions.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='late',
+                                             password='secretpasswd951')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        task = Task.objects.create(name='Archived meanwhile',
+                                   specification='Done', status='c')
+        # The task as it was loaded before the archival
+        self.task = Task.objects.get(id=task.id)
+        Task.objects.filter(id=task.id).delete()
+
+    def test_comment_adding_view(self):
+        with mock.patch.object(IdentityMap, 'get', return_value=self.task):
+            response = self.client.post('/api/addcomment/', {
+                'task_name': self.task.name, 'description': 'Too late'},
+                format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_add_comment_action(self):
+        with mock.patch.object(TaskViewSet, 'get_object',
+                               return_value=self.task):
+            response = self.client.post(
+                f'/api/tasks/{self.task.id}/add_comment/',
+                {'description': 'Too late'}, format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Comment.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Checks the routing of reads to a replica, played by a second SQLite
+    database that nothing copies the data into, and the stickiness
+    of the clients that write.
+    """
+
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+        call_command('migrate', database='replica', verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        del connections.databases['replica']
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader',
+                                             password='secretpasswd951')
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.user.auth_token.key}')
+        Task.objects.create(name='Primary', specification='Written',
+                            due_date=datetime.date.today())
+        Task.objects.using('replica').bulk_create([
+            Task(name='Replica', specification='Replicated',
+                 due_date=datetime.date.today())])
+
+    def exported_names(self, client):
+        response = client.get('/api/export/tasks/')
+        return [json.loads(line)['name'] for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_safe_requests_read_from_replica(self):
+        self.assertEqual(self.exported_names(self.client), ['Replica'])
+        self.assertEqual(Task.objects.get().name, 'Primary')
+
+    def test_writer_sticks_to_primary(self):
+        other = APIClient()
+        other.force_authenticate(self.user)
+
+        response = self.client.post('/api/taskcreation/', {
+            'name': 'Created', 'specification': 'Mine',
+            'due_date': str(datetime.date.today()), 'performer': 'reader'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(sorted(self.exported_names(self.client)),
+                         ['Created', 'Primary'])
+        self.assertEqual(self.exported_names(other), ['Replica'])
+
+    def test_cached_responses_read_from_primary(self):
+        response = self.client.get('/api/tasks/')
+        self.assertEqual([task['name'] for task in response.data['results']],
+                         ['Primary'])
+
+    def test_change_feed_reads_from_primary(self):
+        cursor = self.client.get('/api/tasks/changes/').data['cursor']
+        self.assertEqual(cursor, TaskChange.objects.get().id)
+
+        response = self.client.get('/api/tasks/changes/', {'since': 0})
+        self.assertEqual(response.data['cursor'], cursor)
+        self.assertEqual([change['task']['name']
+                          for change in response.data['changes']], ['Primary'])
+
+    def test_transactions_read_from_primary(self):
+        with read_database(REPLICA):
+            self.assertEqual(Task.objects.get().name, 'Replica')
+            with transaction.atomic():
+                self.assertEqual(Task.objects.get().name, 'Primary')
+
+    def test_tasks_choose_database(self):
+        @celery_app.task(name='tasktable.tests.task_names',
+                         read_database=REPLICA)
+        def task_names():
+            return list(Task.objects.values_list('name', flat=True))
+
+        self.assertEqual(task_names.apply().get(), ['Replica'])
+        self.assertEqual(task_names.apply(
+            headers={'read_database': PRIMARY}).get(), ['Primary'])
+        self.assertEqual(Task.objects.get().name, 'Primary')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertEqual(self.exported_names(self.client), ['Primary'])
+        with read_database(REPLICA):
+            self.assertEqual(Task.objects.get().name, 'Primary')
@@ -1,19 +1,24 @@
 from django.urls import path, include
 from .views import (RegistrationView, LoginView, LogoutView,
                     TaskCreationView, CommentAddingView, TaskViewSet,
-                    TaskUpdateView)
+                    TaskUpdateView, ExportView, HealthView,
+                    ProfileView, ArchivedTaskViewSet)
 from rest_framework.routers import DefaultRouter
 
 
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet)
+router.register(r'archived-tasks', ArchivedTaskViewSet)
 
 urlpatterns = [
+    path('health/', HealthView.as_view()),
     path('registration/', RegistrationView.as_view()),
     path('login/', LoginView.as_view()),
     path('logout/', LogoutView.as_view()),
     path('taskupdate/', TaskUpdateView.as_view()),
     path('taskcreation/', TaskCreationView.as_view()),
     path('addcomment/', CommentAddingView.as_view()),
+    path('export/<str:kind>/', ExportView.as_view()),
+    path('profiles/<uuid:profile_id>/', ProfileView.as_view()),
     path('', include(router.urls)),
 ]
@@ -3,17 +3,60 @@ from .serializers import (RegistrationSerializer, LoginSerializer,
                           TaskCreationSerializer, TaskUpdateSerializer,
                           CommentAddingSerializer, TaskSerializer,
                           TaskPerformerSerializer, TaskListSerializer,
-                          TaskDetailSerializer, CommentSerializer)
+                          TaskDetailSerializer, CommentSerializer,
+                          UserSerializer, ExportSerializer,
+                          TaskChangeSerializer, ArchivedTaskListSerializer,
+                          ArchivedTaskDetailSerializer, sparse_fieldset)
+from .rows import TaskRows
 from django.contrib.auth.models import User
 from rest_framework.response import Response
+from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate, login, logout
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from .permissions import CanChangeTask
-from .models import Task, Comment
-from django.conf import settings
-from api.tasks import basic_email_sender, comment_email_sender
+from .authentication import token_expired
+from .pagination import TaskKeysetPagination
+from .filters import TieBreakOrderingFilter
+from .cache import (cached_response, task_generation, TASKS_GENERATION,
+                    USERS_GENERATION)
+from .models import Task, Comment, ArchivedTask, ArchivedComment
+from django.db import connection, transaction, DatabaseError, IntegrityError
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.db.models import Prefetch
+from .bulk import save_tasks
+from .outbox import enqueue_notifications
+from .export import EXPORTS, export_lines
+from .changes import (cursor_expired, latest_cursor, max_wait,
+                      wait_for_changes)
+from .replicas import read_database, PRIMARY
+from .renderers import EventStreamRenderer
+from .profiling import profile_path
+from rest_framework.settings import api_settings
 from rest_framework import viewsets, filters
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
+from functools import partial
+import json
+import os
+
+
+class HealthView(APIView):
+    """
+    The View class reports whether the service can reach its database.
+    Returns 200 status code or 503 if the database is unavailable.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            return Response({'status': 'database unavailable'}, 503)
+
+        return Response({'status': 'ok'}, 200)
 
 
 class RegistrationView(APIView):
@@ -41,6 +84,7 @@ class LoginView(APIView):
     """
     The View class logs the user in the system and returns its id,
     if such a user exists in the system.
+    An expired authorization token is replaced with a new one.
     Returns the user's authorization token or 400 status code for invalid data.
     """
 
@@ -53,8 +97,13 @@ class LoginView(APIView):
 
         if user is not None:
             login(request, user)
-            return Response({'Authorization':
-                            f'Token {user.auth_token.key}'}, 200)
+
+            token = user.auth_token
+            if token_expired(token):
+                token.delete()
+                token = Token.objects.create(user=user)
+
+            return Response({'Authorization': f'Token {token.key}'}, 200)
         else:
             return Response({'error': 'username or password invalid'}, 400)
 
@@ -80,25 +129,24 @@ class TaskCreationView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        serializer = TaskCreationSerializer(data=request.data)
+        serializer = TaskCreationSerializer(data=request.data,
+                                            context={'request': request})
         serializer.is_valid(raise_exception=True)
 
-        creator = User.objects.filter(username=request.user).first()
         name = serializer.validated_data['name']
         specification = serializer.validated_data['specification']
         due_date = serializer.validated_data['due_date']
-        performer = User.objects.filter(username=serializer.validated_data[
-            'performer']).first()
-
-        task = Task.objects.create(name=name, specification=specification,
-                                   due_date=due_date, creator=creator,
-                                   performer=performer, status='n')
-
-        if settings.EMAIL_HOST_USER is not None:
-            basic_email_sender.apply_async(kwargs={
+        performer = serializer.identity_map.get(
+            User, username=serializer.validated_data['performer'])
+
+        with transaction.atomic():
+            task = Task.objects.create(name=name, specification=specification,
+                                       due_date=due_date, creator=request.user,
+                                       performer=performer, status='n')
+            enqueue_notifications([{
                 'task_id': task.id,
                 'title': 'A new task has been created'
-            }, queue='default')
+            }])
 
         context = {
             f"task '{task.name}' created successfully. Task id": task.id
@@ -118,18 +166,20 @@ class TaskUpdateView(APIView):
     permission_classes = [IsAuthenticated, CanChangeTask]
 
     def put(self, request):
-        serializer = TaskUpdateSerializer(data=request.data)
+        serializer = TaskUpdateSerializer(data=request.data,
+                                          context={'request': request})
         serializer.is_valid(raise_exception=True)
 
-        task = Task.objects.filter(id=serializer.validated_data[
-            'task_id']).first()
+        task = serializer.identity_map.get(
+            Task, id=serializer.validated_data['task_id'])
 
         self.check_object_permissions(request, task)
 
-        performer = User.objects.filter(username=serializer.validated_data[
-            'performer']).first()
+        performer = serializer.identity_map.get(
+            User, username=serializer.validated_data['performer'])
 
-        if request.user != task.creator and performer != task.performer:
+        if request.user.id != task.creator_id and \
+                performer.id != task.performer_id:
             context = {
                 'Failure': 'You cannot change the task performer'
             }
@@ -140,13 +190,13 @@ class TaskUpdateView(APIView):
         task.due_date = serializer.validated_data['due_date']
         task.performer = performer
         task.status = serializer.validated_data['status']
-        task.save()
 
-        if settings.EMAIL_HOST_USER is not None:
-            basic_email_sender.apply_async(kwargs={
+        with transaction.atomic():
+            task.save()
+            enqueue_notifications([{
                 'task_id': task.id,
                 'title': 'The task has been changed'
-            }, queue='default')
+            }])
 
         context = {
             'Success': f"task '{task.name}' has been updated"
@@ -155,6 +205,16 @@ class TaskUpdateView(APIView):
         return Response(context, 200)
 
 
+def task_exists(pk):
+    """
+    Checks whether the task still exists after adding a comment to it
+    has failed: a task archived (see api/archive.py) or deleted while the
+    comment was inserted makes the insert fail on its foreign key.
+    """
+
+    return Task.objects.filter(id=pk).exists()
+
+
 class CommentAddingView(APIView):
     """
     The View class implements adding a comment to the specified task.
@@ -166,22 +226,27 @@ class CommentAddingView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        serializer = CommentAddingSerializer(data=request.data)
+        serializer = CommentAddingSerializer(data=request.data,
+                                             context={'request': request})
         serializer.is_valid(raise_exception=True)
 
-        task = Task.objects.filter(name=serializer.validated_data[
-            'task_name']).first()
+        task = serializer.identity_map.get(
+            Task, name=serializer.validated_data['task_name'])
         description = serializer.validated_data['description']
-        author = User.objects.filter(username=request.user).first()
-
-        comment = Comment.objects.create(task=task, description=description,
-                                         author=author)
 
-        if settings.EMAIL_HOST_USER is not None:
-            comment_email_sender.apply_async(kwargs={
-                'task_id': task.id,
-                'comment_id': comment.id
-            }, queue='default')
+        try:
+            with transaction.atomic():
+                comment = Comment.objects.create(task=task,
+                                                 description=description,
+                                                 author=request.user)
+                enqueue_notifications([{
+                    'task_id': task.id,
+                    'comment_id': comment.id
+                }])
+        except IntegrityError:
+            if task_exists(task.id):
+                raise
+            return Response({'error': 'task does not exists'}, 404)
 
         context = {
             'success': 'Comment on the task was published successfully'
@@ -190,29 +255,162 @@ class CommentAddingView(APIView):
         return Response(context, 201)
 
 
-class TaskViewSet(viewsets.ModelViewSet):
+class ExportView(APIView):
+    """
+    The View class streams all tasks or all comments (export kind)
+    as NDJSON or CSV (output parameter), one row at a time.
+    Can be filtered by since, status and performer parameters.
+    """
+
+    permission_classes = [IsAuthenticated]
+    content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    def get(self, request, kind):
+        if kind not in EXPORTS:
+            raise Http404
+
+        serializer = ExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = dict(serializer.validated_data)
+        output = filters.pop('output')
+
+        response = StreamingHttpResponse(
+            export_lines(kind, output, **filters),
+            content_type=self.content_types[output])
+        response['Content-Disposition'] = \
+            f'attachment; filename="{kind}.{output}"'
+
+        return response
+
+
+class ProfileView(APIView):
+    """
+    The View class gives staff users a saved request profile:
+    its summary with the SQL statements (output=json, the default)
+    or the cProfile statistics for pstats or snakeviz (output=prof).
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id):
+        output = request.query_params.get('output', 'json')
+        if output not in ('json', 'prof'):
+            return Response({'error': 'output must be json or prof'}, 400)
+
+        path = profile_path(profile_id, output)
+        if not os.path.exists(path):
+            raise Http404
+
+        if output == 'json':
+            with open(path) as file:
+                return Response(json.load(file), 200)
+
+        return FileResponse(open(path, 'rb'), as_attachment=True,
+                            filename=f'{profile_id}.prof')
+
+
+class KeysetPaginationMixin:
+    """
+    Pages the list with a keyset cursor on request (?pagination=cursor)
+    instead of the default limit/offset pagination.
+    """
+
+    cursor_pagination_class = TaskKeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.action == 'list' and self.request.query_params.get(
+                    'pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = super().paginator
+
+        return self._paginator
+
+
+class TaskViewSet(KeysetPaginationMixin, viewsets.ModelViewSet):
     """
     This ModelViewSet class implements the display of the list of tasks
     and detailed information about the task (including all comments on it).
     Allows to create a new task, edit an existing task, and add comments to the task.
     Includes Search Filter by task name and performer name.
+    Tasks can be ordered and filtered by their number of comments and
+    the date of the latest comment, which are stored on the task.
+    The task list and task details can be limited to some fields (?fields=)
+    and give the creator and performer as ids (?expand= without them).
+    The task list can be paged with a keyset cursor (?pagination=cursor)
+    instead of the default limit/offset pagination.
+    The task list and task details are cached per user and query in Redis.
     Requesting user will be the creator of the task and author of the comment.
     Only the creator of the task can change the performer.
     When creating/editing a task or adding a new comment to a task,
     an email is sent with information to the creator and performer.
+    Tasks can also be created and updated in batches (bulk action).
+    Changes of tasks and comments since a cursor are fetched from the
+    change feed (changes action), as JSON or as Server-Sent Events.
+    Only the active tasks are served, the archived completed tasks
+    are served by ArchivedTaskViewSet.
     """
 
     permission_classes = [IsAuthenticated, CanChangeTask]
-    queryset = Task.objects.all().select_related(
-        'creator', 'performer').prefetch_related('task_comments').order_by(
-        '-due_date')
+    queryset = Task.objects.all()
     serializer_class = TaskSerializer
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [filters.SearchFilter, TieBreakOrderingFilter,
+                       DjangoFilterBackend]
     search_fields = ['name', 'performer__username']
+    ordering_fields = ['due_date', 'comment_count', 'last_comment_at']
+    filterset_fields = {
+        'comment_count': ['gte', 'lte'],
+        'last_comment_at': ['gte', 'lte', 'isnull'],
+    }
+    bulk_max_items = 500
+    changes_max_items = 1000
+
+    def get_queryset(self):
+        """
+        Shapes the queryset for the current action: list, retrieve and
+        changes load only the user columns emitted by UserSerializer,
+        and only retrieve prefetches the task comments with their authors.
+        """
+
+        queryset = super().get_queryset().order_by('-due_date')
+
+        if self.action not in ('list', 'retrieve', 'changes'):
+            return queryset
+
+        user_fields = UserSerializer.Meta.fields
+        queryset = queryset.select_related('creator', 'performer').only(
+            'id', 'name', 'specification', 'due_date', 'status',
+            'comment_count', 'last_comment_at',
+            *(f'creator__{field}' for field in user_fields),
+            *(f'performer__{field}' for field in user_fields))
+
+        if self.action == 'retrieve':
+            comments = Comment.objects.select_related('author').only(
+                'task', 'description', 'post_date',
+                *(f'author__{field}' for field in user_fields))
+            queryset = queryset.prefetch_related(
+                Prefetch('task_comments', queryset=comments))
+
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(creator=serializer.context['request'].user)
 
+    def get_object(self):
+        """
+        Returns the task of the request, loading and checking it only once.
+        """
+
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+
+        return self._object
+
     def get_serializer_class(self):
         if self.action == 'list':
             return TaskListSerializer
@@ -221,8 +419,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         elif self.action == 'add_comment':
             return CommentSerializer
         elif self.action == 'update':
-            task = Task.objects.filter(id=self.kwargs.get('pk')).first()
-            if self.request.user == task.creator:
+            if self.request.user.id == self.get_object().creator_id:
                 return TaskSerializer
             else:
                 return TaskPerformerSerializer
@@ -236,36 +433,176 @@ class TaskViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        comment = serializer.save(author=request.user, task_id=pk)
-
-        if settings.EMAIL_HOST_USER is not None:
-            comment_email_sender.apply_async(kwargs={
-                'task_id': pk,
-                'comment_id': comment.id
-            }, queue='default')
+        try:
+            with transaction.atomic():
+                comment = serializer.save(author=request.user, task_id=pk)
+                enqueue_notifications([{
+                    'task_id': comment.task_id,
+                    'comment_id': comment.id
+                }])
+        except IntegrityError:
+            if task_exists(pk):
+                raise
+            return Response({'error': 'task does not exists'}, 404)
 
         return Response({'status': 'comment added'}, 201)
 
-    def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
+    @action(detail=False, methods=['post'],
+            permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        """
+        Creates and updates a list of tasks. Items with an 'id' update
+        the existing task, the other items create a new one.
+        Returns the result or the validation errors of every item.
+        """
+
+        if not isinstance(request.data, list):
+            return Response({'error': 'expected a list of tasks'}, 400)
+
+        if len(request.data) > self.bulk_max_items:
+            return Response({'error': 'no more than '
+                             f'{self.bulk_max_items} tasks per request'}, 400)
+
+        results = save_tasks(request.data, request.user)
+
+        return Response({'results': results}, 200)
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES,
+                              EventStreamRenderer])
+    def changes(self, request):
+        """
+        Returns the changes of tasks and comments made after the cursor
+        given in ?since (or in the Last-Event-ID header of Server-Sent
+        Events), with the current state of their tasks and tombstones
+        of deleted ones. Without a cursor returns the current cursor.
+        With ?wait=seconds waits for new changes if there are none yet
+        (the default for Server-Sent Events). A cursor older than the
+        pruned changes gets 410 status code: the client must resync.
+        """
+
+        cursor = request.META.get('HTTP_LAST_EVENT_ID') or \
+            request.query_params.get('since')
+        event_stream = request.accepted_renderer.format == 'sse'
+
+        try:
+            limit = max(min(int(request.query_params.get('limit', 100)),
+                            self.changes_max_items), 1)
+            wait = max(min(int(request.query_params.get(
+                'wait', max_wait(request) if event_stream else 0)),
+                max_wait(request)), 0)
+            cursor = int(cursor) if cursor is not None else None
+        except ValueError:
+            return Response({'error': 'since, limit and wait must be numbers'},
+                            400)
+
+        # A cursor taken from a lagging replica would skip the entries
+        # the replica has not received yet
+        with read_database(PRIMARY):
+            if cursor is None:
+                data = {'cursor': latest_cursor(), 'has_more': False,
+                        'changes': []}
+            elif cursor_expired(cursor):
+                return Response({'error': 'cursor expired, resync: reload '
+                                          'the tasks and take a new cursor'},
+                                410)
+            else:
+                changes = wait_for_changes(cursor, limit + 1, wait)
+                has_more = len(changes) > limit
+                changes = changes[:limit]
+                tasks = self.get_queryset().in_bulk(
+                    {change.task_id for change in changes})
+                data = {
+                    'cursor': changes[-1].position if changes else cursor,
+                    'has_more': has_more,
+                    'changes': TaskChangeSerializer(
+                        changes, many=True, context={
+                            **self.get_serializer_context(),
+                            'tasks': tasks}).data
+                }
+
+        response = Response(data, 200)
+        response['Cache-Control'] = 'no-cache'
+        if event_stream:
+            # The whole batch is ready, nginx must not wait for more
+            response['X-Accel-Buffering'] = 'no'
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(
+            request, [TASKS_GENERATION, USERS_GENERATION],
+            partial(self.list_rows, request))
+
+    def list_rows(self, request):
+        """
+        Lists the tasks like ListModelMixin.list with TaskListSerializer,
+        but builds the rows from values() with TaskRows.
+        """
+
+        rows = TaskRows(request, *sparse_fieldset(request))
+        queryset = rows.values(self.filter_queryset(self.get_queryset()))
 
-        if settings.EMAIL_HOST_USER is not None:
-            task_id = response.data['id']
-            basic_email_sender.apply_async(kwargs={
-                'task_id': task_id,
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.build(page))
+
+        return Response(rows.build(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(
+            request,
+            [task_generation(kwargs['pk']), USERS_GENERATION],
+            partial(super().retrieve, request, *args, **kwargs))
+
+    def create(self, request, *args, **kwargs):
+        with transaction.atomic():
+            response = super().create(request, *args, **kwargs)
+            enqueue_notifications([{
+                'task_id': response.data['id'],
                 'title': 'A new task has been created'
-            }, queue='default')
+            }])
 
         return response
 
     def update(self, request, *args, **kwargs):
-        response = super().update(request, *args, **kwargs)
-
-        if settings.EMAIL_HOST_USER is not None:
-            task_id = response.data['id']
-            basic_email_sender.apply_async(kwargs={
-                'task_id': task_id,
+        with transaction.atomic():
+            response = super().update(request, *args, **kwargs)
+            enqueue_notifications([{
+                'task_id': response.data['id'],
                 'title': 'The task has been changed'
-            }, queue='default')
+            }])
 
         return response
+
+
+class ArchivedTaskViewSet(KeysetPaginationMixin,
+                          viewsets.ReadOnlyModelViewSet):
+    """
+    This ReadOnlyModelViewSet class implements the display of the list
+    of archived tasks and of an archived task with all its comments.
+    Includes Search Filter by task name and performer name.
+    """
+
+    permission_classes = [IsAuthenticated]
+    queryset = ArchivedTask.objects.all()
+    filter_backends = [filters.SearchFilter, TieBreakOrderingFilter]
+    search_fields = ['name', 'performer__username']
+    ordering_fields = ['due_date', 'archived_at']
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('creator',
+                                                         'performer')
+
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(Prefetch(
+                'task_comments',
+                queryset=ArchivedComment.objects.select_related('author')))
+
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return ArchivedTaskDetailSerializer
+
+        return ArchivedTaskListSerializer
@@ -0,0 +1,156 @@
+"""
+Compares the throughput of the WSGI (gunicorn sync workers) and ASGI
+(gunicorn with uvicorn workers) serving modes while many slow clients
+keep connections open by sending their request headers byte by byte.
+
+Both servers run the project against a temporary SQLite database:
+
+    python benchmarks/asgi_vs_wsgi.py --workers 2 --slow-clients 8
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'wsgi': ['tasktable.wsgi:application'],
+    'asgi': ['tasktable.asgi:application',
+             '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def fetch(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n'
+                 'Connection: close\r\n\r\n'.encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response.startswith(b'HTTP/1.1 200')
+
+
+async def slow_client(port, path, until):
+    """
+    Holds a connection open until the deadline,
+    sending one byte of a request header every half a second.
+    """
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n'.encode())
+    while time.monotonic() < until:
+        writer.write(b'X')
+        await writer.drain()
+        await asyncio.sleep(0.5)
+    writer.close()
+
+
+async def fast_client(port, path, until, latencies, errors):
+    while time.monotonic() < until:
+        started = time.monotonic()
+        try:
+            ok = await asyncio.wait_for(fetch(port, path),
+                                        until - started + 1)
+        except (OSError, asyncio.TimeoutError):
+            ok = False
+        if ok:
+            latencies.append(time.monotonic() - started)
+        else:
+            errors.append(1)
+
+
+async def load(port, options):
+    until = time.monotonic() + options.duration
+    latencies, errors = [], []
+    slow = [asyncio.create_task(slow_client(port, options.path, until))
+            for _ in range(options.slow_clients)]
+    await asyncio.sleep(0.5)
+    await asyncio.gather(*[fast_client(port, options.path, until, latencies,
+                                       errors)
+                           for _ in range(options.fast_clients)])
+    await asyncio.gather(*slow, return_exceptions=True)
+    return latencies, errors
+
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if asyncio.run(fetch(port, '/api/health/')):
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def run_server(mode, env, options):
+    port = free_port()
+    server = subprocess.Popen(
+        ['gunicorn', *SERVERS[mode], '--bind', f'127.0.0.1:{port}',
+         '--workers', str(options.workers), '--log-level', 'warning'],
+        cwd=PROJECT_DIR, env=env)
+    try:
+        wait_until_ready(port)
+        latencies, errors = asyncio.run(load(port, options))
+    finally:
+        server.terminate()
+        server.wait()
+
+    completed = len(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if completed > 1 \
+        else [float('nan')] * 99
+    return {
+        'mode': mode,
+        'requests/s': completed / options.duration,
+        'p50 ms': quantiles[49] * 1000,
+        'p99 ms': quantiles[98] * 1000,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--slow-clients', type=int, default=8)
+    parser.add_argument('--fast-clients', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--path', default='/api/health/')
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ,
+                   DJANGO_SETTINGS_MODULE='tasktable.settings',
+                   SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark'),
+                   SQL_ENGINE='django.db.backends.sqlite3',
+                   SQL_DATABASE=os.path.join(directory, 'db.sqlite3'))
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'],
+                       cwd=PROJECT_DIR, env=env, check=True)
+
+        results = [run_server(mode, env, options) for mode in SERVERS]
+
+    print(f'{options.slow_clients} slow clients, {options.fast_clients} '
+          f'fast clients, {options.workers} workers, {options.duration}s')
+    columns = list(results[0])
+    print(''.join(f'{column:>12}' for column in columns))
+    for result in results:
+        print(''.join(f'{value:>12.1f}' if isinstance(value, float)
+                      else f'{value:>12}' for value in result.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Fills the database with synthetic users, tasks and comments for load
+testing. The same seed gives the same data; due and comment dates are
+counted from today. All users get the password 'benchmark'.
+
+Imports into the database configured by the SQL_* variables, with the
+import_tasks Importer (COPY on PostgreSQL):
+
+    python benchmarks/generate_data.py --users 100000 --tasks 1000000 \\
+        --comments 5000000 --seed 1
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = 'benchmark'
+
+WORDS = ('task', 'deploy', 'review', 'report', 'release', 'client', 'server',
+         'database', 'migration', 'design', 'fix', 'update', 'test', 'check',
+         'meeting', 'document', 'invoice', 'budget', 'backup', 'monitoring',
+         'задача', 'отчёт', 'проверка', 'встреча')
+
+FIRST_NAMES = ('Anna', 'Boris', 'Clara', 'Denis', 'Elena', 'Fedor', 'Galina',
+               'Igor', 'Маша', 'Олег')
+
+LAST_NAMES = ('Ivanova', 'Petrov', 'Smith', 'Jones', 'Kuznetsova', 'Orlov',
+              'Brown', 'Соколов')
+
+
+def setup():
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tasktable.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    import django
+    django.setup()
+
+
+def text(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def user_rows(rng, count, password):
+    for number in range(count):
+        yield {'username': f'user{number}',
+               'email': f'user{number}@example.com',
+               'first_name': rng.choice(FIRST_NAMES),
+               'last_name': rng.choice(LAST_NAMES),
+               'password': password}
+
+
+def task_rows(rng, count, users):
+    today = datetime.date.today()
+    for number in range(count):
+        yield {'name': f'Task {number}',
+               'specification': text(rng, 5, 60),
+               'due_date': str(today + datetime.timedelta(
+                   days=rng.randint(-180, 365))),
+               'status': rng.choices('nwc', weights=(3, 2, 5))[0],
+               'creator': f'user{rng.randrange(users)}',
+               'performer': f'user{rng.randrange(users)}'
+               if rng.random() < 0.9 else ''}
+
+
+def comment_rows(rng, count, users, tasks):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for _ in range(count):
+        # A few tasks get most of the comments
+        yield {'task_name': f'Task {int(tasks * rng.random() ** 3)}',
+               'description': text(rng, 3, 40),
+               'author': f'user{rng.randrange(users)}',
+               'post_date': (now - datetime.timedelta(
+                   minutes=rng.randrange(180 * 24 * 60))).isoformat()}
+
+
+def generate(users, tasks, comments, seed=1, batch_size=None, report=None):
+    """
+    Imports the given numbers of users, tasks and comments, calling
+    report(kind, imported, total) after every batch.
+    """
+
+    from django.conf import settings
+    from django.contrib.auth.hashers import make_password
+    from api.importer import Importer
+
+    rng = random.Random(seed)
+    # One hash for all users, hashing a million passwords takes hours
+    password = make_password(PASSWORD)
+    importer = Importer(batch_size or settings.IMPORT_BATCH_SIZE)
+
+    for kind, total, rows in (
+            ('users', users, user_rows(rng, users, password)),
+            ('tasks', tasks, task_rows(rng, tasks, users)),
+            ('comments', comments, comment_rows(rng, comments, users, tasks))):
+        imported = 0
+        for count in importer.run(kind, rows):
+            imported += count
+            if report is not None:
+                report(kind, imported, total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--tasks', type=int, default=1000000)
+    parser.add_argument('--comments', type=int, default=5000000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--batch-size', type=int)
+    options = parser.parse_args()
+
+    setup()
+    started = time.monotonic()
+    reported = {}
+
+    def report(kind, imported, total):
+        now = time.monotonic()
+        if imported == total or now - reported.get(kind, 0) >= 5:
+            reported[kind] = now
+            print(f'{kind}: {imported}/{total} '
+                  f'({now - started:.0f}s elapsed)', flush=True)
+
+    generate(options.users, options.tasks, options.comments, options.seed,
+             options.batch_size, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Compares the stock DRF JSONRenderer/JSONParser with FastJSONRenderer/
+FastJSONParser (orjson) on typical task payloads: a page of the task
+list, a large task list and a bulk task request.
+
+    python benchmarks/json_rendering.py --repeat 200
+"""
+
+import argparse
+import datetime
+import io
+import os
+import sys
+import timeit
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup():
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tasktable.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    import django
+    django.setup()
+
+
+def user(number):
+    return {'id': number, 'username': f'user{number}',
+            'email': f'user{number}@example.com', 'first_name': 'Имя',
+            'last_name': 'Last'}
+
+
+def task(number):
+    return {
+        'url': f'http://localhost:1337/api/tasks/{number}/',
+        'id': number,
+        'name': f'Task {number}',
+        'specification': 'Specification of the task. ' * 8,
+        'due_date': str(datetime.date(2020, 12, 1 + number % 28)),
+        'creator': user(number % 50),
+        'performer': user(number % 7) if number % 5 else None,
+        'status': 'nwc'[number % 3],
+        'comment_count': number % 4,
+        'last_comment_at': '20.12.2020 10:30',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=200)
+    options = parser.parse_args()
+
+    setup()
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from api.parsers import FastJSONParser, orjson
+    from api.renderers import FastJSONRenderer
+
+    if orjson is None:
+        print('orjson is not installed, the fast classes use the json module')
+
+    payloads = {
+        'list page (10)': {'count': 10000, 'next': None, 'previous': None,
+                           'results': [task(number) for number in range(10)]},
+        'list (1000)': {'count': 1000, 'next': None, 'previous': None,
+                        'results': [task(number) for number in range(1000)]},
+    }
+    bulk = JSONRenderer().render([
+        {key: task(number)[key] for key in ('name', 'specification',
+                                            'due_date', 'status')}
+        for number in range(500)])
+
+    print(f'{"payload":>20} {"stock ms":>10} {"fast ms":>10} {"speedup":>8}')
+
+    def report(name, stock, fast):
+        stock = timeit.timeit(stock, number=options.repeat) / options.repeat
+        fast = timeit.timeit(fast, number=options.repeat) / options.repeat
+        print(f'{name:>20} {stock * 1000:10.3f} {fast * 1000:10.3f} '
+              f'{stock / fast:7.1f}x')
+
+    for name, data in payloads.items():
+        assert JSONRenderer().render(data) == FastJSONRenderer().render(data)
+        report(f'render {name}', lambda: JSONRenderer().render(data),
+               lambda: FastJSONRenderer().render(data))
+
+    report('parse bulk (500)',
+           lambda: JSONParser().parse(io.BytesIO(bulk)),
+           lambda: FastJSONParser().parse(io.BytesIO(bulk)))
+
+
+if __name__ == '__main__':
+    main()
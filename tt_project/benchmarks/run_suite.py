@@ -0,0 +1,533 @@
+"""
+Runs scripted requests against every endpoint of api/urls.py through the
+Django test client and records the p50/p95/p99 latency, the queries per
+request and the peak memory of a request for each scenario.
+
+By default the suite runs against a temporary SQLite database filled by
+generate_data.py with a small dataset. With --existing it runs against the
+database configured by the SQL_* variables, filled beforehand with
+generate_data.py; the tasks, comments and users the suite creates there
+are deleted at the end, but the tasks of the acting user keep the changes
+made by the update scenarios.
+
+    python benchmarks/run_suite.py --output baseline.json
+    python benchmarks/run_suite.py --compare baseline.json
+    python benchmarks/run_suite.py --existing --cache settings \\
+        --requests 200 --output postgres.json
+
+With --compare the results are checked against a stored baseline and the
+script exits with status 1 if a scenario got slower than the tolerance,
+runs more queries or uses more memory.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from generate_data import PASSWORD, generate
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Latency differences below this are noise, whatever the tolerance
+MIN_LATENCY_DELTA_MS = 1.0
+
+SCENARIOS = {}
+
+
+def scenario(name, status=200):
+    """
+    Registers a scenario: a function of the suite and the request number
+    making one request and returning its response.
+    Scenarios run in the order they are registered.
+    """
+
+    def register(function):
+        SCENARIOS[name] = (function, status)
+        return function
+
+    return register
+
+
+def setup(database=None):
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tasktable.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    if database is not None:
+        os.environ.update(SQL_ENGINE='django.db.backends.sqlite3',
+                          SQL_DATABASE=database)
+
+    import django
+    django.setup()
+
+    if database is not None:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+
+
+class Suite:
+    """
+    Holds the client, the acting user and the ids the scenarios work with.
+    The acting user is the creator of the tasks it updates, and the
+    tasks, comments and users created by the suite are named after its run.
+    """
+
+    def __init__(self, seed):
+        from django.contrib.auth.models import User
+        from django.db.models import Count
+        from rest_framework.test import APIClient
+        from api.changes import latest_cursor
+        from api.models import Task
+
+        self.rng = random.Random(seed)
+        self.run = uuid.uuid4().hex[:8]
+        self.today = str(datetime.date.today())
+
+        self.actor = User.objects.annotate(
+            created=Count('task_creator')).order_by('-created', 'id').first()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.actor.auth_token.key}')
+
+        self.task_ids = list(Task.objects.values_list('id', flat=True))
+        self.own_tasks = list(Task.objects.filter(
+            creator=self.actor).values_list('id', 'name'))
+        self.performers = list(User.objects.order_by('id').values_list(
+            'id', 'username')[:1000])
+        self.task_count = len(self.task_ids)
+        self.cursor = latest_cursor()
+        self.created = []
+        self.next_page = None
+        self.registered = 0
+
+    def task_id(self):
+        return self.rng.choice(self.task_ids)
+
+    def own_task(self, number):
+        return self.own_tasks[number % len(self.own_tasks)]
+
+    def performer(self):
+        return self.rng.choice(self.performers)
+
+    def new_name(self, number):
+        return f'Benchmark {self.run} {number}'
+
+    def cleanup(self):
+        from django.contrib.auth.models import User
+        from api.models import Comment, Task
+
+        Comment.objects.filter(
+            description=f'Benchmark {self.run} comment').delete()
+        Task.objects.filter(name__startswith=f'Benchmark {self.run} ') \
+            .delete()
+        User.objects.filter(username__startswith=f'bench{self.run}') \
+            .delete()
+
+
+@scenario('health')
+def health(suite, number):
+    return suite.client.get('/api/health/')
+
+
+@scenario('api root')
+def api_root(suite, number):
+    return suite.client.get('/api/')
+
+
+@scenario('registration', 201)
+def registration(suite, number):
+    suite.registered += 1
+    username = f'bench{suite.run}{suite.registered}'
+    return suite.client.post('/api/registration/', {
+        'username': username, 'email': f'{username}@example.com',
+        'password': PASSWORD}, format='json')
+
+
+@scenario('login')
+def login(suite, number):
+    return suite.client.post('/api/login/', {
+        'username': suite.actor.username, 'password': PASSWORD},
+        format='json')
+
+
+@scenario('logout')
+def logout(suite, number):
+    return suite.client.post('/api/logout/')
+
+
+@scenario('task list')
+def task_list(suite, number):
+    offset = suite.rng.randrange(max(suite.task_count - 10, 1))
+    return suite.client.get(f'/api/tasks/?offset={offset}')
+
+
+@scenario('task list cached')
+def task_list_cached(suite, number):
+    return suite.client.get('/api/tasks/')
+
+
+@scenario('task list cursor')
+def task_list_cursor(suite, number):
+    # Walks the pages, so that every request misses the response cache
+    response = suite.client.get(suite.next_page or
+                                '/api/tasks/?pagination=cursor&limit=50')
+    suite.next_page = response.data.get('next') \
+        if response.status_code == 200 else None
+    return response
+
+
+@scenario('task list fields')
+def task_list_fields(suite, number):
+    offset = suite.rng.randrange(max(suite.task_count - 100, 1))
+    return suite.client.get(f'/api/tasks/?offset={offset}&limit=100'
+                            '&fields=id,name,status,performer&expand=')
+
+
+@scenario('task list search')
+def task_list_search(suite, number):
+    return suite.client.get(
+        f'/api/tasks/?search=Task%20{suite.rng.randrange(1000)}')
+
+
+@scenario('task list ordering')
+def task_list_ordering(suite, number):
+    offset = suite.rng.randrange(max(suite.task_count // 2, 1))
+    return suite.client.get(f'/api/tasks/?ordering=-comment_count'
+                            f'&comment_count__gte=1&offset={offset}')
+
+
+@scenario('task detail')
+def task_detail(suite, number):
+    return suite.client.get(f'/api/tasks/{suite.task_id()}/')
+
+
+@scenario('task detail fields')
+def task_detail_fields(suite, number):
+    return suite.client.get(f'/api/tasks/{suite.task_id()}/'
+                            '?fields=id,name,comment_count,task_comments')
+
+
+@scenario('archived task list')
+def archived_task_list(suite, number):
+    # Filled by the archive_tasks command, empty otherwise
+    return suite.client.get('/api/archived-tasks/?pagination=cursor&limit=50')
+
+
+@scenario('task creation', 201)
+def task_creation(suite, number):
+    return suite.client.post('/api/taskcreation/', {
+        'name': suite.new_name(f'c{number}'), 'specification': 'Created',
+        'due_date': suite.today, 'performer': suite.performer()[1]},
+        format='json')
+
+
+@scenario('task update')
+def task_update(suite, number):
+    task_id, name = suite.own_task(number)
+    return suite.client.put('/api/taskupdate/', {
+        'task_id': task_id, 'name': name, 'specification': 'Updated',
+        'due_date': suite.today, 'performer': suite.actor.username,
+        'status': 'w'}, format='json')
+
+
+@scenario('add comment', 201)
+def add_comment(suite, number):
+    return suite.client.post('/api/addcomment/', {
+        'task_name': suite.own_task(number)[1],
+        'description': f'Benchmark {suite.run} comment'}, format='json')
+
+
+@scenario('viewset create', 201)
+def viewset_create(suite, number):
+    response = suite.client.post('/api/tasks/', {
+        'name': suite.new_name(f'v{number}'), 'specification': 'Created',
+        'due_date': suite.today, 'performer': suite.performer()[0]},
+        format='json')
+    if response.status_code == 201:
+        suite.created.append(response.data['id'])
+    return response
+
+
+@scenario('viewset update')
+def viewset_update(suite, number):
+    task_id, name = suite.own_task(number)
+    return suite.client.put(f'/api/tasks/{task_id}/', {
+        'name': name, 'specification': 'Updated', 'due_date': suite.today,
+        'performer': suite.actor.id, 'status': 'w'}, format='json')
+
+
+@scenario('viewset partial update')
+def viewset_partial_update(suite, number):
+    task_id, _ = suite.own_task(number)
+    return suite.client.patch(f'/api/tasks/{task_id}/',
+                              {'status': 'nwc'[number % 3]}, format='json')
+
+
+@scenario('viewset add comment', 201)
+def viewset_add_comment(suite, number):
+    task_id, _ = suite.own_task(number)
+    return suite.client.post(f'/api/tasks/{task_id}/add_comment/', {
+        'description': f'Benchmark {suite.run} comment'}, format='json')
+
+
+@scenario('viewset destroy', 204)
+def viewset_destroy(suite, number):
+    return suite.client.delete(f'/api/tasks/{suite.created.pop()}/')
+
+
+@scenario('bulk')
+def bulk(suite, number):
+    return suite.client.post('/api/tasks/bulk/', [
+        {'name': suite.new_name(f'b{number} {item}'),
+         'specification': 'Bulk', 'due_date': suite.today,
+         'performer': suite.performer()[1]}
+        for item in range(50)], format='json')
+
+
+@scenario('changes')
+def changes(suite, number):
+    return suite.client.get(f'/api/tasks/changes/'
+                            f'?since={max(suite.cursor - 100, 0)}')
+
+
+@scenario('export tasks')
+def export_tasks(suite, number):
+    return suite.client.get('/api/export/tasks/'
+                            f'?performer={suite.actor.username}')
+
+
+@scenario('export comments csv')
+def export_comments(suite, number):
+    return suite.client.get('/api/export/comments/?output=csv'
+                            f'&performer={suite.actor.username}')
+
+
+def request(suite, function, number):
+    """
+    Makes a request of the scenario, reading the whole response.
+    """
+
+    response = function(suite, number)
+    if response.streaming:
+        b''.join(response.streaming_content)
+
+    return response
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(int(round(percent / 100 * (len(values) - 1))),
+                len(values) - 1)
+    return values[index]
+
+
+def run_scenario(suite, function, status, requests, warmup):
+    """
+    Times the requests of one scenario with their queries, then makes
+    one more request under tracemalloc for the peak memory, which is
+    not timed as tracing slows every allocation down.
+    """
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for number in range(warmup):
+        request(suite, function, -number - 1)
+
+    latencies, queries, errors = [], [], 0
+    for number in range(requests):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = request(suite, function, number)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(len(context))
+        if response.status_code != status:
+            errors += 1
+
+    tracemalloc.start()
+    try:
+        request(suite, function, requests)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'queries': round(statistics.mean(queries), 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run(options):
+    import django
+    from django.db import connection
+    from api.models import Comment, Task
+    from django.contrib.auth.models import User
+
+    suite = Suite(options.seed)
+    selected = [name for name in SCENARIOS
+                if not options.only or name in options.only]
+    # Every destroy request deletes a task of the create scenario
+    if 'viewset destroy' in selected and 'viewset create' not in selected:
+        selected.insert(selected.index('viewset destroy'), 'viewset create')
+
+    results = {}
+    try:
+        for name in selected:
+            function, status = SCENARIOS[name]
+            results[name] = run_scenario(suite, function, status,
+                                         options.requests, options.warmup)
+            print(format_result(name, results[name]), flush=True)
+    finally:
+        suite.cleanup()
+
+    return {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cache': options.cache,
+            'seed': options.seed,
+            'users': User.objects.count(),
+            'tasks': Task.objects.count(),
+            'comments': Comment.objects.count(),
+            # ru_maxrss is in kilobytes on Linux
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'scenarios': results,
+    }
+
+
+def format_result(name, result):
+    return (f'{name:>24}: p50 {result["p50_ms"]:8.2f} ms, '
+            f'p95 {result["p95_ms"]:8.2f} ms, '
+            f'p99 {result["p99_ms"]:8.2f} ms, '
+            f'{result["queries"]:6.2f} queries, '
+            f'{result["peak_memory_kb"]:9.1f} KiB peak'
+            + (f', {result["errors"]} errors' if result['errors'] else ''))
+
+
+def compare(current, baseline, tolerance, memory_tolerance):
+    """
+    Returns the regressions of the current results against the baseline:
+    latencies above the tolerance, more queries, more peak memory
+    and failed requests.
+    """
+
+    regressions = []
+    for name, result in current['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if result[key] > base[key] * (1 + tolerance) and \
+                    result[key] - base[key] > MIN_LATENCY_DELTA_MS:
+                regressions.append(f'{name}: {key} {base[key]:.2f} -> '
+                                   f'{result[key]:.2f}')
+        if result['queries'] > base['queries']:
+            regressions.append(f'{name}: queries {base["queries"]} -> '
+                               f'{result["queries"]}')
+        if result['peak_memory_kb'] > \
+                base['peak_memory_kb'] * (1 + memory_tolerance):
+            regressions.append(f'{name}: peak memory '
+                               f'{base["peak_memory_kb"]} -> '
+                               f'{result["peak_memory_kb"]} KiB')
+        if result['errors']:
+            regressions.append(f'{name}: {result["errors"]} of '
+                               f'{result["requests"]} requests failed')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--existing', action='store_true',
+                        help='Use the database of the SQL_* variables')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=50,
+                        help='Timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--cache', choices=['locmem', 'settings'],
+                        default='locmem',
+                        help='Local memory cache or the configured Redis')
+    parser.add_argument('--only', nargs='+', choices=list(SCENARIOS),
+                        metavar='SCENARIO')
+    parser.add_argument('--output', help='Write the results to this file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='Check the results against this file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed latency growth, 0.25 is 25%%')
+    parser.add_argument('--memory-tolerance', type=float, default=0.1)
+    options = parser.parse_args()
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as file:
+            baseline = json.load(file)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if options.existing:
+            setup()
+        else:
+            setup(os.path.join(directory, 'db.sqlite3'))
+
+        from django.test.utils import override_settings
+        caches = override_settings(CACHES=LOCMEM_CACHES) \
+            if options.cache == 'locmem' else override_settings()
+
+        with caches:
+            if not options.existing:
+                generate(options.users, options.tasks, options.comments,
+                         options.seed)
+            results = run(options)
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(results, file, indent=2)
+            file.write('\n')
+
+    if baseline is None:
+        return
+
+    for key in ('database', 'cache', 'users', 'tasks', 'comments'):
+        if baseline['meta'].get(key) != results['meta'][key]:
+            print(f'Warning: the baseline was recorded with {key} '
+                  f'{baseline["meta"].get(key)}, not {results["meta"][key]}')
+
+    regressions = compare(results, baseline, options.tolerance,
+                          options.memory_tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if regressions:
+        sys.exit(1)
+    print(f'No regressions against {options.compare}')
+
+
+if __name__ == '__main__':
+    main()
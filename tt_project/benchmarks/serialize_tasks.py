@@ -0,0 +1,116 @@
+"""
+Measures the time to build the task list rows per 1000 tasks with
+TaskListSerializer and with the values() based TaskRows, and checks
+that both render to the same JSON.
+
+Runs against a temporary SQLite database:
+
+    python benchmarks/serialize_tasks.py --tasks 5000 --repeat 5
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(database):
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.update(DJANGO_SETTINGS_MODULE='tasktable.settings',
+                      SQL_ENGINE='django.db.backends.sqlite3',
+                      SQL_DATABASE=database)
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def create_tasks(count):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from api.models import Task
+
+    users = User.objects.bulk_create([
+        User(username=f'user{number}', email=f'user{number}@example.com',
+             first_name='First', last_name='Last') for number in range(50)])
+    users = list(User.objects.all())
+    today = datetime.date.today()
+
+    Task.objects.bulk_create([
+        Task(name=f'Task {number}', specification='Specification ' * 10,
+             due_date=today + datetime.timedelta(days=number % 365),
+             creator=users[number % len(users)],
+             performer=users[(number * 7) % len(users)] if number % 5 else None,
+             status='nwc'[number % 3], comment_count=number % 4,
+             last_comment_at=timezone.now() if number % 4 else None)
+        for number in range(count)])
+
+
+def measure(build, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = build()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        setup(os.path.join(directory, 'db.sqlite3'))
+        create_tasks(options.tasks)
+
+        from rest_framework.renderers import JSONRenderer
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from api.models import Task
+        from api.rows import TaskRows
+        from api.serializers import TaskListSerializer, UserSerializer
+
+        request = Request(APIRequestFactory().get('/api/tasks/'))
+        user_fields = UserSerializer.Meta.fields
+        queryset = Task.objects.order_by('-due_date', 'id').select_related(
+            'creator', 'performer').only(
+            'id', 'name', 'specification', 'due_date', 'status',
+            'comment_count', 'last_comment_at',
+            *(f'creator__{field}' for field in user_fields),
+            *(f'performer__{field}' for field in user_fields))
+        # Both paths are timed on rows already fetched from the database
+        tasks = list(queryset)
+        rows = TaskRows(request)
+        values = list(rows.values(queryset))
+
+        results = {
+            'serializer': measure(lambda: TaskListSerializer(
+                tasks, many=True, context={'request': request}).data,
+                options.repeat),
+            'values rows': measure(lambda: rows.build(values),
+                                   options.repeat),
+        }
+
+    renderer = JSONRenderer()
+    outputs = {renderer.render(data) for _, data in results.values()}
+    print(f'{options.tasks} tasks, best of {options.repeat} runs, '
+          f'identical output: {len(outputs) == 1}')
+    for name, (elapsed, _) in results.items():
+        print(f'{name:>12}: {elapsed * 1000 / options.tasks * 1000:8.2f} ms '
+              f'per 1000 rows')
+
+
+if __name__ == '__main__':
+    main()
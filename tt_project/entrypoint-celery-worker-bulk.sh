@@ -0,0 +1,39 @@
+#!/bin/sh
+
+if [ "$DATABASE" = "postgres" ]
+then
+    echo "Waiting for postgres..."
+
+    while ! nc -z $SQL_HOST $SQL_PORT; do
+        sleep 0.1
+    done
+
+    echo "PostgreSQL started"
+fi
+
+echo "Waiting for rabbit..."
+
+while ! nc -z $RABBIT_HOST $RABBIT_PORT; do
+    sleep 0.1
+done
+
+echo "RabbitMQ started"
+
+echo "Waiting for redis..."
+
+while ! nc -z $REDIS_HOST $REDIS_PORT; do
+    sleep 0.1
+done
+
+echo "Redis started"
+
+if [ -n "$prometheus_multiproc_dir" ]
+then
+    # Metrics files of the processes of the previous run
+    rm -rf "$prometheus_multiproc_dir"
+    mkdir -p "$prometheus_multiproc_dir"
+fi
+
+celery -A tasktable worker -l info -n bulk@%h -Q bulk --concurrency=2 --prefetch-multiplier=1
+
+exec "$@"
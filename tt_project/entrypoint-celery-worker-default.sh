@@ -27,6 +27,13 @@ done
 
 echo "Redis started"
 
-celery -A tasktable worker -l info -Q default --autoscale=10,3
+if [ -n "$prometheus_multiproc_dir" ]
+then
+    # Metrics files of the processes of the previous run
+    rm -rf "$prometheus_multiproc_dir"
+    mkdir -p "$prometheus_multiproc_dir"
+fi
+
+celery -A tasktable worker -l info -Q default,notifications,bulk,periodic --autoscale=10,3
 
 exec "$@"
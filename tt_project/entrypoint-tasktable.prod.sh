@@ -27,7 +27,13 @@ done
 
 echo "Redis started"
 
-python3 manage.py makemigrations
+if [ -n "$prometheus_multiproc_dir" ]
+then
+    # Metrics files of the processes of the previous run
+    rm -rf "$prometheus_multiproc_dir"
+    mkdir -p "$prometheus_multiproc_dir"
+fi
+
 python3 manage.py migrate
 python3 manage.py collectstatic --no-input --clear
 
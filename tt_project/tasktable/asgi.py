@@ -7,10 +7,77 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
 
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tasktable.settings')
 
-application = get_asgi_application()
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    Django 3.0 iterates streaming responses on the event loop, where the
+    database queries of a generator like the export are not allowed.
+    This handler fetches every part of a streaming response in a thread
+    of its own, one per response, because the database cursor of a
+    streamed queryset must stay in the thread that opened it.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        headers = [(header.encode('ascii'), value.encode('latin1'))
+                   for header, value in response.items()]
+        headers += [(b'Set-Cookie',
+                     cookie.output(header='').encode('ascii').strip())
+                    for cookie in response.cookies.values()]
+        await send({'type': 'http.response.start',
+                    'status': response.status_code, 'headers': headers})
+
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1,
+                                      thread_name_prefix='asgi-stream')
+        parts = iter(response)
+        try:
+            while True:
+                part = await loop.run_in_executor(executor, next, parts, None)
+                if part is None:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk,
+                                'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            # Closes the database connections of the streaming thread
+            await loop.run_in_executor(executor, response.close)
+            executor.shutdown(wait=False)
+
+
+django.setup(set_prefix=False)
+django_application = StreamingASGIHandler()
+
+_executor_loops = set()
+
+
+async def application(scope, receive, send):
+    """
+    Serves Django on an event loop whose default executor is bounded
+    to ASGI_THREADS threads. Request bodies and responses are transferred
+    by the event loop, so slow clients do not hold a thread; only views
+    and ORM queries run in the pool, which also bounds the number of
+    database connections held by one worker process.
+    """
+
+    loop = asyncio.get_running_loop()
+    if loop not in _executor_loops:
+        loop.set_default_executor(ThreadPoolExecutor(
+            max_workers=settings.ASGI_THREADS,
+            thread_name_prefix='asgi'))
+        _executor_loops.add(loop)
+
+    await django_application(scope, receive, send)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
+from kombu import Queue
 import os
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -50,20 +51,26 @@ INSTALLED_APPS = [
 
 # Django REST
 
+# The browsable HTML API can be turned off in production (BROWSABLE_API=0)
+BROWSABLE_API = int(os.environ.get('BROWSABLE_API', default=1))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 10,
+    # JSON is encoded and decoded with orjson when it is installed
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.renderers.FastJSONRenderer',
+    ) + (
+        ('rest_framework.renderers.BrowsableAPIRenderer',) if BROWSABLE_API
+        else ()
     ),
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework.parsers.JSONParser',
+        'api.parsers.FastJSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FileUploadParser',
@@ -71,30 +78,142 @@ REST_FRAMEWORK = {
     'DATETIME_INPUT_FORMATS': (
         '%d.%m.%Y %H:%M:%S %Z',
     ),
-    'DATETIME_FORMAT': (
-        '%d.%m.%Y %H:%M:%S %Z',
-    )
+    'DATETIME_FORMAT': '%d.%m.%Y %H:%M:%S %Z',
 }
 
 # Celery
 
+# Results are not stored, only the failures of tasks are saved to the
+# database (and shown in the admin), so that workers do not write a row
+# per task; expired rows are deleted by the prune-task-results job
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_CACHE_BACKEND = 'django-cache'
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_STORE_ERRORS_EVEN_IF_IGNORED = True
+CELERY_RESULT_EXPIRES = None
 CELERY_BROKER_URL = f"amqp://{os.environ.get('RABBIT_HOST', 'localhost')}:" \
     f"{os.environ.get('RABBIT_PORT', '5672')}"
 
+# Notification emails, uploads and periodic jobs are sent
+# to separate queues, each consumed by its own worker (see the
+# entrypoint-celery-worker-*.sh scripts); other tasks go to 'default'
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_QUEUES = (
+    Queue('default'),
+    Queue('notifications'),
+    Queue('bulk'),
+    Queue('periodic'),
+)
+CELERY_TASK_ROUTES = {
+    'tasktable.send_bulk_email': {'queue': 'notifications'},
+    'tasktable.process_upload': {'queue': 'bulk'},
+    'tasktable.relay_notifications': {'queue': 'periodic'},
+    'tasktable.prune_task_changes': {'queue': 'periodic'},
+    'tasktable.prune_task_results': {'queue': 'periodic'},
+    'tasktable.send_deadline_reminders': {'queue': 'periodic'},
+    'tasktable.archive_tasks': {'queue': 'periodic'},
+}
+
+# Tasks are short and mostly wait for SMTP or the database: every worker
+# process reserves a few messages ahead, and messages are acknowledged
+# after the task has run, so that a lost worker does not lose them
+# (the bulk worker reserves one message at a time, see its entrypoint)
+CELERY_WORKER_PREFETCH_MULTIPLIER = 4
+CELERY_TASK_ACKS_LATE = True
+
+CELERY_BEAT_SCHEDULE = {
+    'relay-notifications': {
+        'task': 'tasktable.relay_notifications',
+        'schedule': 5.0,
+    },
+    'prune-task-changes': {
+        'task': 'tasktable.prune_task_changes',
+        'schedule': 3600.0,
+    },
+    'prune-task-results': {
+        'task': 'tasktable.prune_task_results',
+        'schedule': 3600.0,
+    },
+    'send-deadline-reminders': {
+        'task': 'tasktable.send_deadline_reminders',
+        'schedule': 3600.0,
+    },
+    'archive-tasks': {
+        'task': 'tasktable.archive_tasks',
+        'schedule': 86400.0,
+    },
+}
+
+# Number of days the failures of Celery tasks are kept in the database
+CELERY_TASK_RESULTS_RETENTION_DAYS = 7
+
+# The metrics view only answers the addresses or networks of
+# METRICS_ALLOWED_IPS (comma-separated) and the requests with the
+# "Authorization: Bearer <METRICS_TOKEN>" header (none if unset)
+METRICS_ALLOWED_IPS = list(filter(None, os.environ.get(
+    'METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+# Port of the Prometheus metrics server of Celery workers (none if unset)
+WORKER_METRICS_PORT = int(os.environ.get('WORKER_METRICS_PORT', 0)) or None
+
+# Requests of staff users with the X-Profile header are profiled, and this
+# share of all requests (0 - none); the newest PROFILING_MAX_FILES profiles
+# are kept in PROFILING_ROOT (see api/profiling.py)
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_ROOT = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MAX_FILES = 100
+
+# Notification outbox relay: notifications per bulk email job
+# and jobs published per run of the periodic relay task
+NOTIFICATION_RELAY_BATCH_SIZE = 500
+NOTIFICATION_RELAY_MAX_BATCHES = 20
+
+# Task change feed: longest wait of a long-poll request in seconds,
+# shorter under WSGI, where a sync worker is busy for the whole wait
+# (see api/changes.py), and number of days the change log is kept
+TASK_CHANGES_MAX_WAIT = 25
+TASK_CHANGES_MAX_WAIT_WSGI = 5
+TASK_CHANGES_RETENTION_DAYS = 7
+
+# Deadline reminders: performers are reminded of the open tasks due in the
+# next REMINDER_DAYS_AHEAD days and of the ones overdue for at most
+# REMINDER_OVERDUE_DAYS days, REMINDER_CHUNK_SIZE tasks at a time
+# (see api/reminders.py)
+REMINDER_DAYS_AHEAD = 1
+REMINDER_OVERDUE_DAYS = 7
+REMINDER_CHUNK_SIZE = 1000
+
+# Task archive: completed tasks whose due date and latest comment are older
+# than TASK_ARCHIVE_AFTER_DAYS days are moved to the archive tables,
+# TASK_ARCHIVE_BATCH_SIZE tasks per transaction (see api/archive.py)
+TASK_ARCHIVE_AFTER_DAYS = 90
+TASK_ARCHIVE_BATCH_SIZE = 500
+
+# Rows fetched from the database at a time by the tasks and comments export
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows inserted at a time by the import_tasks management command
+IMPORT_BATCH_SIZE = 5000
+
 # Authentication settings
 
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Authorization tokens expire after this number of seconds (never if unset)
+TOKEN_EXPIRE_AFTER = int(os.environ.get('TOKEN_EXPIRE_AFTER', 0)) or None
+
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.replicas.ReplicaMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -119,6 +238,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'tasktable.wsgi.application'
 
+# Threads running views and ORM queries in each ASGI worker process
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 20))
+
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
@@ -134,6 +256,26 @@ DATABASES = {
     }
 }
 
+# Read replicas of the default database (see api/replicas.py): the hosts
+# of the PostgreSQL replicas, or the database files of SQLite "replicas"
+# to try the routing locally (nothing copies the data into them)
+DATABASE_REPLICAS = []
+for number, location in enumerate(
+        filter(None, os.environ.get('SQL_REPLICAS', '').split(',')), 1):
+    DATABASE_REPLICAS.append(f'replica{number}')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        ('NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3')
+         else 'HOST'): location.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Clients keep reading from the primary database for this number
+# of seconds after a write request, until the replicas catch up
+REPLICA_STICKY_SECONDS = 10
+
 
 # Cache
 
@@ -151,6 +293,12 @@ CACHES = {
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
 
+# Lifetime of the cached task list and task detail responses, in seconds
+TASK_RESPONSE_CACHE_TIMEOUT = 5 * 60
+
+# Lifetime of the cached authorization tokens, in seconds
+TOKEN_CACHE_TIMEOUT = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -190,9 +338,23 @@ USE_TZ = True
 
 STATIC_URL = '/staticfiles/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# collectstatic stores the files under hashed names with gzip and brotli copies
+STATICFILES_STORAGE = 'tasktable.storage.CompressedManifestStaticFilesStorage'
 
 MEDIA_URL = '/mediafiles/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'mediafiles')
+# Internal nginx location that sends the media files allowed by Django,
+# without it (in development) Django sends the files itself
+MEDIA_ACCEL_REDIRECT_URL = None if DEBUG else '/protected-media/'
+
+# Largest image accepted by the upload app, in bytes
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 20 * 1024 * 1024))
+
+# Bytes read and written at a time while receiving and hashing uploads
+UPLOAD_BLOCK_SIZE = 64 * 1024
+
+# Bounding box of the thumbnails of uploaded images, in pixels
+UPLOAD_THUMBNAIL_SIZE = (256, 256)
 
 # Sending email
 """
@@ -209,6 +371,8 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', None)
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_USE_SSL = False
+# Number of notification emails built and sent together by a Celery worker
+EMAIL_BATCH_SIZE = 50
 
 
 # Sentry
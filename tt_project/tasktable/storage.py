@@ -0,0 +1,42 @@
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+import brotli
+import gzip
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Static files storage saving every file under a name with the hash of
+    its content, so it can be cached by clients forever, next to gzip and
+    brotli compressed copies that the web server sends as they are
+    instead of compressing the file on every request.
+    """
+
+    compressed_extensions = ('.css', '.js', '.svg', '.txt', '.html', '.xml',
+                             '.json', '.map', '.ttf', '.eot', '.otf', '.ico')
+    min_compressed_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+
+        # The final names are only known after all the hashing passes
+        if not dry_run:
+            for hashed_name in set(self.hashed_files.values()):
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        if not name.endswith(self.compressed_extensions):
+            return
+
+        with self.open(name) as file:
+            content = file.read()
+        if len(content) < self.min_compressed_size:
+            return
+
+        for extension, compressed in (
+                ('.gz', gzip.compress(content, compresslevel=9, mtime=0)),
+                ('.br', brotli.compress(content))):
+            # Variants that do not save anything are not worth serving
+            if len(compressed) < len(content):
+                path = self.path(name + extension)
+                with open(path, 'wb') as file:
+                    file.write(compressed)
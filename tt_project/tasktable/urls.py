@@ -18,14 +18,15 @@ from django.urls import path, include
 from django.views.generic import RedirectView
 from django.conf import settings
 from django.conf.urls.static import static
+from upload.views import MediaView
+from api.metrics import metrics_view
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('upload/', include('upload.urls')),
+    path('metrics', metrics_view),
+    path(f'{settings.MEDIA_URL.strip("/")}/<path:path>', MediaView.as_view()),
     path('', RedirectView.as_view(url='/api/', permanent=True)),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-
-if bool(settings.DEBUG):
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,3 +1,23 @@
 from django.contrib import admin
+from .models import Blob, Upload
 
-# Register your models here.
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    """
+    Administration object for Blob models.
+    """
+
+    list_display = ('sha256', 'format', 'width', 'height', 'size',
+                    'created_at')
+
+
+@admin.register(Upload)
+class UploadAdmin(admin.ModelAdmin):
+    """
+    Administration object for Upload models.
+    """
+
+    list_display = ('filename', 'owner', 'status', 'received', 'size',
+                    'created_at')
+    list_filter = ('status',)
@@ -1,3 +1,65 @@
+from django.contrib.auth.models import User
 from django.db import models
+import uuid
 
-# Create your models here.
+
+class Blob(models.Model):
+    """
+    Model representing a stored image file addressed by the SHA-256
+    of its content, so an image uploaded many times is stored only once.
+    """
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    format = models.CharField(max_length=10, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def name(self):
+        return f'blobs/{self.sha256[:2]}/{self.sha256[2:4]}/{self.sha256}'
+
+    @property
+    def thumbnail_name(self):
+        return f'thumbnails/{self.sha256[:2]}/{self.sha256}.jpg'
+
+    def __str__(self):
+        return self.sha256
+
+
+class Upload(models.Model):
+    """
+    Model representing a resumable upload of a file, received in chunks
+    and processed by a Celery task once all of its bytes have arrived.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True,
+                              blank=True, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField(help_text='Total size of the file in bytes')
+    received = models.BigIntegerField(default=0,
+                                      help_text='Bytes received so far')
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True,
+                             blank=True, related_name='uploads')
+
+    UPLOAD_STATUS = (
+        ('r', 'Receiving'),
+        ('p', 'Processing'),
+        ('d', 'Done'),
+        ('f', 'Failed'),
+    )
+
+    status = models.CharField(max_length=1, choices=UPLOAD_STATUS,
+                              default='r')
+    error = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def partial_name(self):
+        return f'uploads/{self.id}.part'
+
+    def __str__(self):
+        return self.filename
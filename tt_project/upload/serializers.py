@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+from .models import Upload
+
+
+class UploadCreationSerializer(serializers.Serializer):
+    """
+    Serializes the data for starting a new upload.
+    """
+
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_size(self, value):
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'file is larger than {settings.UPLOAD_MAX_SIZE} bytes')
+
+        return value
+
+
+class UploadSerializer(serializers.ModelSerializer):
+    """
+    Serializes the state of an upload and the stored image once it is done.
+    """
+
+    sha256 = serializers.CharField(source='blob_id', read_only=True)
+    url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    width = serializers.IntegerField(source='blob.width', read_only=True)
+    height = serializers.IntegerField(source='blob.height', read_only=True)
+
+    class Meta:
+        model = Upload
+        fields = ['id', 'filename', 'size', 'received', 'status', 'error',
+                  'sha256', 'url', 'thumbnail_url', 'width', 'height']
+
+    def get_url(self, obj):
+        return default_storage.url(obj.blob.name) if obj.blob_id else None
+
+    def get_thumbnail_url(self, obj):
+        return default_storage.url(obj.blob.thumbnail_name) \
+            if obj.blob_id else None
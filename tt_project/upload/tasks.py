@@ -0,0 +1,89 @@
+from __future__ import absolute_import, unicode_literals
+from celery import shared_task
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from PIL import Image
+from .models import Blob, Upload
+import hashlib
+import os
+
+
+def file_sha256(path):
+    """
+    Returns the SHA-256 of a file, reading it in blocks.
+    """
+
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(settings.UPLOAD_BLOCK_SIZE), b''):
+            sha256.update(block)
+
+    return sha256.hexdigest()
+
+
+def storage_path(name):
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def store_blob(sha256, path):
+    """
+    Checks that the file is an image, saves its thumbnail and moves it
+    to the location addressed by its content.
+    """
+
+    with Image.open(path) as image:
+        image.verify()
+
+    with Image.open(path) as image:
+        blob = Blob(sha256=sha256, size=os.path.getsize(path),
+                    format=image.format or '', width=image.width,
+                    height=image.height)
+        image.thumbnail(settings.UPLOAD_THUMBNAIL_SIZE)
+        image.convert('RGB').save(storage_path(blob.thumbnail_name), 'JPEG')
+
+    os.replace(path, storage_path(blob.name))
+
+    try:
+        blob.save(force_insert=True)
+    except IntegrityError:
+        # The same content was stored by a concurrent upload
+        blob = Blob.objects.get(pk=sha256)
+
+    return blob
+
+
+def process_upload(upload_id):
+    """
+    Hashes a fully received upload and links it to the stored image with
+    the same content, storing the image and its thumbnail if it is new.
+    """
+
+    upload = Upload.objects.get(pk=upload_id)
+    if upload.status != 'p':
+        return upload
+
+    path = default_storage.path(upload.partial_name)
+    sha256 = file_sha256(path)
+
+    try:
+        upload.blob = Blob.objects.filter(pk=sha256).first() or store_blob(
+            sha256, path)
+        upload.status = 'd'
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        upload.status = 'f'
+        upload.error = 'The file is not a valid image'
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    upload.save(update_fields=['blob', 'status', 'error'])
+
+    return upload
+
+
+@shared_task(name='tasktable.process_upload', ignore_result=True)
+def upload_processor(upload_id: str):
+    process_upload(upload_id)
@@ -1,3 +1,240 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from unittest import mock
+from PIL import Image
+from .models import Blob, Upload
+from .tasks import process_upload, storage_path
+from .views import receive_chunk
+import hashlib
+import io
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+
+def image_content(color='red', size=(600, 400)):
+    content = io.BytesIO()
+    Image.new('RGB', size, color).save(content, 'PNG')
+    return content.getvalue()
+
+
+class UploadTests(TestCase):
+    """
+    Checks the chunked upload of images, their deduplication by content
+    and the processing of complete uploads.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        patcher = mock.patch('upload.views.upload_processor.apply_async')
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(username='uploader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, content, **data):
+        response = self.client.post('/upload/files/', {
+            'filename': 'image.png', 'size': len(content), **data
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def send(self, upload_id, chunk, offset):
+        return self.client.generic('PATCH', f'/upload/files/{upload_id}/',
+                                   chunk, 'application/offset+octet-stream',
+                                   HTTP_UPLOAD_OFFSET=str(offset))
+
+    def upload(self, content, chunk_size=1000):
+        upload_id = self.start(content)['id']
+        for offset in range(0, len(content), chunk_size):
+            response = self.send(upload_id, content[offset:offset + chunk_size],
+                                 offset)
+            self.assertEqual(response.status_code, 200)
+
+        return process_upload(upload_id)
+
+    def test_chunked_upload(self):
+        content = image_content()
+        upload = self.upload(content)
+
+        self.assertEqual(upload.status, 'd')
+        self.assertEqual(upload.blob_id, hashlib.sha256(content).hexdigest())
+        self.assertEqual((upload.blob.width, upload.blob.height), (600, 400))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.media_root, upload.blob.name)))
+        with Image.open(os.path.join(self.media_root,
+                                     upload.blob.thumbnail_name)) as thumbnail:
+            self.assertEqual(thumbnail.size, (256, 171))
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'uploads')))
+
+        state = self.client.get(f'/upload/files/{upload.id}/').json()
+        self.assertEqual(state['status'], 'd')
+        self.assertEqual(state['url'], f'/mediafiles/{upload.blob.name}')
+
+    def test_resume_from_offset(self):
+        content = image_content()
+        upload_id = self.start(content)['id']
+        self.send(upload_id, content[:500], 0)
+
+        response = self.send(upload_id, content[100:], 100)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 500)
+
+        response = self.send(upload_id, content[500:], 500)
+        self.assertEqual(response.json()['status'], 'p')
+        self.assertEqual(process_upload(upload_id).status, 'd')
+
+    def test_chunk_is_rejected_when_offset_moves(self):
+        content = image_content()
+        upload_id = self.start(content)['id']
+
+        def receive_concurrently(stream, path):
+            # Another request appends a chunk while this body is read
+            receiving.side_effect = receive_chunk
+            self.assertEqual(
+                self.send(upload_id, content[:500], 0).status_code, 200)
+            return receive_chunk(stream, path)
+
+        with mock.patch('upload.views.receive_chunk',
+                        side_effect=receive_concurrently) as receiving:
+            response = self.send(upload_id, b'x' * 500, 0)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 500)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'uploads')),
+                         [f'{upload_id}.part'])
+
+        self.send(upload_id, content[500:], 500)
+        self.assertEqual(process_upload(upload_id).blob_id,
+                         hashlib.sha256(content).hexdigest())
+
+    def test_duplicates_are_stored_once(self):
+        content = image_content('blue')
+        first = self.upload(content)
+        second = self.upload(content)
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(Blob.objects.count(), 1)
+
+    def test_stored_file_is_not_claimed_by_hash(self):
+        content = image_content('blue')
+        stored = self.upload(content)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other'))
+        state = other.post('/upload/files/', {
+            'filename': 'image.png', 'size': len(content),
+            'sha256': stored.blob_id}, format='json').json()
+
+        self.assertEqual((state['status'], state['received']), ('r', 0))
+        self.assertIsNone(Upload.objects.get(pk=state['id']).blob_id)
+        self.assertEqual(other.get(f'/mediafiles/{stored.blob.name}')
+                         .status_code, 404)
+
+    def test_limits(self):
+        response = self.client.post('/upload/files/', {
+            'filename': 'huge.png', 'size': 10 ** 12}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        upload_id = self.start(b'12345')['id']
+        response = self.send(upload_id, b'1234567890', 0)
+        self.assertEqual(response.status_code, 413)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other'))
+        self.assertEqual(
+            other.get(f'/upload/files/{upload_id}/').status_code, 404)
+
+    def test_not_an_image(self):
+        upload = self.upload(b'not an image')
+
+        self.assertEqual(upload.status, 'f')
+        self.assertFalse(Blob.objects.exists())
+
+    @override_settings(UPLOAD_MAX_SIZE=100)
+    def test_form_upload_too_large(self):
+        response = self.client.post('/upload/', {
+            'image_file': SimpleUploadedFile('image.png', b'0' * 20000)})
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_form_upload(self):
+        content = image_content()
+        response = self.client.post('/upload/', {
+            'image_file': SimpleUploadedFile('image.png', content)})
+
+        upload = Upload.objects.get()
+        self.assertContains(response, str(upload.id))
+        self.assertEqual(process_upload(upload.id).status, 'd')
+
+
+class MediaTests(TestCase):
+    """
+    Checks that media files are only given to the owners of the uploads.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=self.media_root,
+                                     MEDIA_ACCEL_REDIRECT_URL=None)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+        self.owner = User.objects.create_user(username='owner')
+        self.upload = Upload.objects.create(owner=self.owner,
+                                            filename='image.png', size=1)
+        with open(storage_path(self.upload.partial_name), 'wb') as file:
+            file.write(image_content())
+        self.upload.status = 'p'
+        self.upload.save()
+        self.blob = process_upload(self.upload.id).blob
+
+    def get(self, user, name):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client.get(f'/mediafiles/{name}')
+
+    def test_owner(self):
+        response = self.get(self.owner, self.blob.name)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(b''.join(response.streaming_content),
+                         image_content())
+
+        response = self.get(self.owner, self.blob.thumbnail_name)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_URL='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.get(self.owner, self.blob.name)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         f'/protected-media/{self.blob.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_forbidden(self):
+        other = User.objects.create_user(username='other')
+
+        self.assertIn(self.get(None, self.blob.name).status_code, (401, 403))
+        self.assertEqual(self.get(other, self.blob.name).status_code, 404)
+        self.assertEqual(
+            self.get(other, self.upload.partial_name).status_code, 404)
+
+        admin = User.objects.create_user(username='admin', is_staff=True)
+        self.assertEqual(self.get(admin, self.blob.name).status_code, 200)
+        self.assertEqual(self.get(admin, '../manage.py').status_code, 404)
@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import image_upload
+from .views import image_upload, UploadCreationView, UploadView
 
 
 urlpatterns = [
-    path('', image_upload, name='upload')
+    path('', image_upload, name='upload'),
+    path('files/', UploadCreationView.as_view()),
+    path('files/<uuid:pk>/', UploadView.as_view()),
 ]
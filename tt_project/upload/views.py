@@ -1,15 +1,253 @@
-from django.shortcuts import render
-from django.core.files.storage import FileSystemStorage
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import render, get_object_or_404
+from django.utils._os import safe_join
+from PIL import Image
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import Blob, Upload
+from .serializers import UploadCreationSerializer, UploadSerializer
+from .tasks import storage_path, upload_processor
+from urllib.parse import quote
+import mimetypes
+import os
+import re
+import shutil
+import uuid
+
+
+BLOB_PATH = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<sha256>[0-9a-f]{64})$')
+THUMBNAIL_PATH = re.compile(r'^thumbnails/[0-9a-f]{2}/(?P<sha256>[0-9a-f]{64})\.jpg$')
+
+# Room for the multipart boundaries, headers and the CSRF token of the form
+FORM_OVERHEAD = 16 * 1024
+
+
+def start_processing(upload):
+    """
+    Marks a fully received upload for processing and hands it to
+    the Celery worker once the transaction is committed.
+    """
+
+    upload.status = 'p'
+    upload.save(update_fields=['received', 'status'])
+    transaction.on_commit(lambda: upload_processor.apply_async(
+        (str(upload.id),)))
+
+
+def receive_chunk(stream, path):
+    """
+    Streams the request body to the file in blocks.
+    Returns the number of bytes written.
+    """
+
+    received = 0
+    with open(path, 'wb') as file:
+        while stream is not None:
+            block = stream.read(settings.UPLOAD_BLOCK_SIZE)
+            if not block:
+                break
+            file.write(block)
+            received += len(block)
+
+    return received
 
 
 def image_upload(request):
-    if request.method == 'POST' and request.FILES['image_file']:
-        image_file = request.FILES['image_file']
-        fs = FileSystemStorage()
-        filename = fs.save(image_file.name, image_file)
-        image_url = fs.url(filename)
-        print(image_url)
-        return render(request, 'upload.html', {
-            'image_url': image_url
-        })
-    return render(request, 'upload.html')
+    context = {}
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+
+    # Checked before request.FILES reads the whole body
+    if request.method == 'POST' and \
+            length > settings.UPLOAD_MAX_SIZE + FORM_OVERHEAD:
+        context['error'] = f'The file is larger than ' \
+                           f'{settings.UPLOAD_MAX_SIZE} bytes'
+        return render(request, 'upload.html', context, status=413)
+
+    image_file = request.FILES.get('image_file')
+
+    if request.method == 'POST' and image_file:
+        if image_file.size > settings.UPLOAD_MAX_SIZE:
+            context['error'] = f'The file is larger than ' \
+                               f'{settings.UPLOAD_MAX_SIZE} bytes'
+        else:
+            with transaction.atomic():
+                upload = Upload.objects.create(
+                    owner=request.user if request.user.is_authenticated
+                    else None,
+                    filename=image_file.name, size=image_file.size)
+                with open(storage_path(upload.partial_name), 'wb') as file:
+                    for chunk in image_file.chunks(settings.UPLOAD_BLOCK_SIZE):
+                        file.write(chunk)
+                upload.received = upload.size
+                start_processing(upload)
+            context['upload'] = upload
+
+    return render(request, 'upload.html', context)
+
+
+class UploadCreationView(APIView):
+    """
+    The View class starts a new upload and returns its id.
+    The file content is then sent to the upload in one or more chunks.
+    Uploads are matched with the stored files only after the server
+    has hashed their content, so a client cannot claim a stored file
+    by its SHA-256. Returns 201 status code.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = UploadCreationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        upload = Upload(owner=request.user, filename=data['filename'],
+                        size=data['size'])
+        open(storage_path(upload.partial_name), 'wb').close()
+        upload.save(force_insert=True)
+
+        return Response(UploadSerializer(upload).data, status.HTTP_201_CREATED)
+
+
+class UploadView(APIView):
+    """
+    The View class returns the state of an upload of the current user (GET)
+    and appends a chunk of the file to it (PATCH).
+    A chunk is the raw request body written at the byte offset given in
+    the Upload-Offset header, which must match the bytes received so far,
+    so an interrupted upload is resumed from the offset of its state.
+    The body is streamed to a file of its own in blocks, never held in
+    memory, before the upload is locked: only the offset check and
+    the append to the partial file run in the transaction.
+    Once all bytes are received, the upload is processed by a Celery task.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self, pk, lock=False):
+        uploads = Upload.objects.select_related('blob')
+        if lock:
+            uploads = Upload.objects.select_for_update()
+
+        return get_object_or_404(uploads, pk=pk, owner=self.request.user)
+
+    def get(self, request, pk):
+        return Response(UploadSerializer(self.get_object(pk)).data)
+
+    def patch(self, request, pk):
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'Upload-Offset': 'Offset header is required'},
+                            status.HTTP_400_BAD_REQUEST)
+
+        # Checked before the body is read, and again once it is on disk
+        upload = self.get_object(pk)
+        if upload.status != 'r' or offset != upload.received:
+            return Response(UploadSerializer(upload).data,
+                            status.HTTP_409_CONFLICT)
+        if offset + length > upload.size:
+            return Response({'size': 'Chunk exceeds the file size'},
+                            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        # Concurrent chunks are received into separate files,
+        # only the one that still matches the offset is appended
+        chunk_path = storage_path(
+            f'{upload.partial_name}.{uuid.uuid4().hex}')
+        try:
+            length = receive_chunk(request.stream, chunk_path)
+
+            with transaction.atomic():
+                upload = self.get_object(pk, lock=True)
+                if upload.status != 'r' or offset != upload.received:
+                    return Response(UploadSerializer(upload).data,
+                                    status.HTTP_409_CONFLICT)
+                if offset + length > upload.size:
+                    return Response({'size': 'Chunk exceeds the file size'},
+                                    status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+                with open(chunk_path, 'rb') as chunk, open(
+                        storage_path(upload.partial_name), 'r+b') as file:
+                    file.seek(offset)
+                    shutil.copyfileobj(chunk, file, settings.UPLOAD_BLOCK_SIZE)
+                upload.received += length
+
+                if upload.received == upload.size:
+                    start_processing(upload)
+                else:
+                    upload.save(update_fields=['received'])
+        finally:
+            try:
+                os.remove(chunk_path)
+            except FileNotFoundError:
+                pass
+
+        return Response(UploadSerializer(upload).data)
+
+
+def media_response(path, content_type, cache_control):
+    """
+    Returns a response that makes nginx send the media file from its
+    internal location, or the file itself if there is no such location.
+    """
+
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+
+    if settings.MEDIA_ACCEL_REDIRECT_URL:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = \
+            f'{settings.MEDIA_ACCEL_REDIRECT_URL}{quote(path)}'
+    elif os.path.isfile(full_path):
+        response = FileResponse(open(full_path, 'rb'),
+                                content_type=content_type)
+    else:
+        raise Http404
+
+    response['Cache-Control'] = cache_control
+    return response
+
+
+class MediaView(APIView):
+    """
+    The View class gives access to the stored images (and their thumbnails)
+    of the uploads of the current user, and to all media files for staff.
+    Django only checks the permissions: the file itself is sent by nginx.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, path):
+        match = BLOB_PATH.match(path) or THUMBNAIL_PATH.match(path)
+
+        if match is not None:
+            blobs = Blob.objects.filter(pk=match['sha256'])
+            if not request.user.is_staff:
+                blobs = blobs.filter(uploads__owner=request.user)
+            image_format = blobs.values_list('format', flat=True).first()
+            if image_format is None:
+                raise Http404
+
+            content_type = 'image/jpeg' if match.re is THUMBNAIL_PATH else \
+                Image.MIME.get(image_format, 'application/octet-stream')
+            # Files stored under the hash of their content never change
+            return media_response(path, content_type,
+                                  'private, max-age=31536000, immutable')
+
+        if request.user.is_staff:
+            content_type = mimetypes.guess_type(path)[0] or \
+                'application/octet-stream'
+            return media_response(path, content_type, 'private, no-cache')
+
+        raise Http404